@@ -0,0 +1,360 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Replay agent events through the agent event function the way Kinesis
+# delivers them - in batches, one Lambda container per shard - and report
+# how fast they are processed, how many DynamoDB calls each event costs and
+# how long events wait before they are stored.
+#
+# Events are either read from a file of recorded agent events (one JSON
+# event per line, as Connect writes them to the stream, or Kinesis records)
+# or made up:
+#
+#   shift   - a shift change: --logins agents log in (and become available,
+#             some taking a contact straight away) and --logouts agents log
+#             out, all within --window seconds
+#   steady  - --agents agents handling contacts for --window seconds, with
+#             heartbeats
+#
+# Each shard has its own clock: a batch starts at the first poll after its
+# first event has arrived (or when the previous batch is finished, if that
+# is later), takes everything waiting up to --batch records, and lasts as
+# long as the function actually took. With --batching-window (the event
+# source mapping's MaximumBatchingWindowInSeconds) the batch waits that long
+# for more records unless it fills first. An event's latency is from its
+# timestamp to the end of the batch that stored it, so a backlog during a
+# burst shows up.
+#
+# Usage: agent-replay.py [--scenario shift|steady] [--input events.json]
+#                        [--logins 5000] [--logouts 1000] [--agents 2000]
+#                        [--window 60] [--known 0.5] [--shards 1] [--batch 100] [--poll 1] [--batching-window 0]
+#                        [--latency 0.005] [--store memory|sqlite:<file>]
+#                        [--save events.json] [--output results.json]
+#
+
+import argparse
+import base64
+import datetime
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from localdynamo import OpenStore, LoadFunction, RoutingProfiles
+
+InstanceARN = 'arn:aws:connect:us-east-1:123456789012:instance/replay'
+QueueARN    = f'{InstanceARN}/queue/00000000-0000-0000-0000-000000000001'
+Writes      = ['PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem']
+MaxAttempts = 10 # Kinesis would keep retrying - we give up on an event after this many
+
+class Agent:
+    def __init__(self, Index):
+        self.ARN      = f'{InstanceARN}/agent/{Index:05d}'
+        self.Username = f'agent{Index:05d}'
+        self.First    = 'Agent'
+        self.Last     = f'Number{Index}'
+        self.Profile  = RoutingProfiles[Index % len(RoutingProfiles)]
+
+def Timestamp(Seconds):
+    return datetime.datetime.fromtimestamp(Seconds, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]+'Z'
+
+def Snapshot(Agent, Status, Contacts, Since):
+    return {'AgentStatus':{'ARN':f'{InstanceARN}/agent-state/{zlib.crc32(Status.encode())}', 'Name':Status, 'StartTimestamp':Timestamp(Since)},
+            'Configuration':{'AgentHierarchyGroups':None, 'FirstName':Agent.First, 'LastName':Agent.Last, 'Username':Agent.Username,
+                             'RoutingProfile':{'ARN':f'{InstanceARN}/routing-profile/{Agent.Profile}', 'Name':Agent.Profile,
+                                               'DefaultOutboundQueue':{'ARN':QueueARN, 'Name':'BasicQueue'},
+                                               'InboundQueues':[{'ARN':QueueARN, 'Name':'BasicQueue'}]}},
+            'Contacts':Contacts}
+
+def Contact(ContactId, State, Since):
+    return {'ContactId':ContactId, 'Channel':'VOICE', 'InitiationMethod':'INBOUND', 'State':State,
+            'StateStartTimestamp':Timestamp(Since), 'ConnectedToAgentTimestamp':Timestamp(Since) if State != 'CONNECTING' else None,
+            'QueueTimestamp':Timestamp(Since-20), 'Queue':{'ARN':QueueARN, 'Name':'BasicQueue'}}
+
+def Event(EventType, Agent, When, Status=None, Contacts=[], Previous=None):
+    #
+    # An agent event as Connect puts it on the stream. LOGIN and LOGOUT
+    # events don't have the agent's details.
+    #
+    Result = {'AWSAccountId':'123456789012', 'AgentARN':Agent.ARN, 'EventId':f'{Agent.Username}-{When:.3f}-{EventType}',
+              'EventTimestamp':Timestamp(When), 'EventType':EventType, 'InstanceARN':InstanceARN, 'Version':'2019-05-25',
+              'CurrentAgentSnapshot':None, 'PreviousAgentSnapshot':None}
+    if Status is not None:
+        Result['CurrentAgentSnapshot']  = Snapshot(Agent, Status, Contacts, When)
+        Result['PreviousAgentSnapshot'] = Previous
+
+    return Result
+
+def ShiftEvents(Start, Logins, Logouts, Window):
+    #
+    # Agents coming in log in, become available and some of them are given a
+    # contact straight away. Agents going home go offline and log out.
+    #
+    Events = []
+    for Index in range(0, Logins):
+        Incoming = Agent(Index)
+        When = Start+random.uniform(0, Window)
+        Events.append(Event('LOGIN', Incoming, When))
+        Events.append(Event('STATE_CHANGE', Incoming, When+random.uniform(0.5, 2), 'Available'))
+        if random.random() < 0.3:
+            Offered = When+random.uniform(3, 10)
+            Events.append(Event('STATE_CHANGE', Incoming, Offered, 'Available', [Contact(f'{Index}-1', 'CONNECTING', Offered)]))
+            Events.append(Event('STATE_CHANGE', Incoming, Offered+5, 'Available', [Contact(f'{Index}-1', 'CONNECTED', Offered+5)]))
+
+    for Index in range(Logins, Logins+Logouts):
+        Outgoing = Agent(Index)
+        When = Start+random.uniform(0, Window)
+        Events.append(Event('STATE_CHANGE', Outgoing, When, 'Offline'))
+        Events.append(Event('LOGOUT', Outgoing, When+random.uniform(1, 5)))
+
+    return Events
+
+def SteadyEvents(Start, Agents, Window):
+    #
+    # Every agent takes contacts one after another and sends a heartbeat
+    # every couple of minutes.
+    #
+    Events = []
+    for Index in range(0, Agents):
+        Busy = Agent(Index)
+        When = Start+random.uniform(0, 30)
+        Call = 0
+        while When < Start+Window:
+            Call += 1
+            ContactId = f'{Index}-{Call}'
+            Events.append(Event('STATE_CHANGE', Busy, When, 'Available', [Contact(ContactId, 'CONNECTING', When)]))
+            Events.append(Event('STATE_CHANGE', Busy, When+4, 'Available', [Contact(ContactId, 'CONNECTED', When+4)]))
+            Talk = random.uniform(60, 300)
+            Events.append(Event('STATE_CHANGE', Busy, When+4+Talk, 'Available', [Contact(ContactId, 'ENDED', When+4+Talk)]))
+            Events.append(Event('STATE_CHANGE', Busy, When+34+Talk, 'Available'))
+            When += 34+Talk+random.uniform(5, 60)
+
+        for Beat in range(0, int(Window), 120):
+            Events.append(Event('HEART_BEAT', Busy, Start+Beat+random.uniform(0, 120), 'Available'))
+
+    return [Item for Item in Events if Item['EventTimestamp'] <= Timestamp(Start+Window)]
+
+def ReadEvents(FileName):
+    #
+    # One event per line - either the event itself or a Kinesis record.
+    #
+    Events = []
+    with open(FileName) as File:
+        for Line in File:
+            if len(Line.strip()) == 0: continue
+            Item = json.loads(Line)
+            if 'kinesis' in Item: Item = json.loads(base64.b64decode(Item['kinesis']['data']))
+            Events.append(Item)
+
+    return Events
+
+def EventTime(Item):
+    return datetime.datetime.strptime(Item['EventTimestamp'], '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=datetime.timezone.utc).timestamp()
+
+def Prepare(Table, Events, Known):
+    #
+    # A share of the agents have been seen before (so they have stored
+    # records and ARN mappings) - they are put through a separate copy of the
+    # function first, as if from an earlier shift, and aren't counted.
+    #
+    Agents = {}
+    for Item in Events:
+        Snapshot = Item.get('CurrentAgentSnapshot')
+        if Snapshot and Item['AgentARN'] not in Agents: Agents[Item['AgentARN']] = Snapshot
+
+    Earliest = min(EventTime(Item) for Item in Events)
+    Previous = []
+    for (Sequence, AgentARN) in enumerate(sorted(Agents)):
+        if random.random() >= Known: continue
+        Old = json.loads(json.dumps(Agents[AgentARN]))
+        Old['AgentStatus']['Name'] = 'Available'
+        Old['Contacts'] = []
+        Previous.append({'EventType':'STATE_CHANGE', 'AgentARN':AgentARN, 'EventTimestamp':Timestamp(Earliest-3600), 'CurrentAgentSnapshot':Old})
+
+    Function = LoadFunction('process-agent-event', Table)
+    logging.getLogger().setLevel(logging.ERROR)
+    for Start in range(0, len(Previous), 100):
+        Function.lambda_handler({'Records':[Record(Item, Start+Index) for (Index, Item) in enumerate(Previous[Start:Start+100])]}, None)
+
+    return len(Previous)
+
+def Record(Item, Sequence):
+    return {'eventSource':'aws:kinesis', 'kinesis':{'partitionKey':Item['AgentARN'], 'sequenceNumber':f'{Sequence:020d}',
+                                                    'data':base64.b64encode(json.dumps(Item).encode()).decode()}}
+
+def Percentile(Values, Fraction):
+    return round(Values[min(len(Values)-1, int(len(Values)*Fraction))], 3)
+
+def ReplayShard(Table, Records, BatchSize, Poll, BatchingWindow, Result):
+    #
+    # One Lambda container working through one shard. Records are
+    # (arrival time, Kinesis record) in arrival order.
+    #
+    Function = LoadFunction('process-agent-event', Table)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    Clock     = 0.0
+    Attempts  = {}
+    Pending   = list(Records)
+    Latencies = []
+    Batches   = []
+    Retried   = 0
+    Dropped   = 0
+    while len(Pending) > 0:
+        BatchStart = max(Clock, math.ceil(Pending[0][0]/Poll)*Poll) # An idle shard is only polled every so often
+        if BatchingWindow > 0:
+            Full = Pending[BatchSize-1][0] if len(Pending) >= BatchSize else math.inf
+            BatchStart = max(BatchStart, min(BatchStart+BatchingWindow, Full))
+        Batch = [Item for Item in Pending[:BatchSize] if Item[0] <= BatchStart]
+
+        Started  = time.perf_counter()
+        Response = Function.lambda_handler({'Records':[Item[1] for Item in Batch]}, None)
+        Elapsed  = time.perf_counter()-Started
+        Clock    = BatchStart+Elapsed
+        Batches.append(Elapsed*1000)
+
+        #
+        # Kinesis sends everything from the first failed record again.
+        #
+        Done = len(Batch)
+        Failed = [Item['itemIdentifier'] for Item in Response['batchItemFailures']]
+        if len(Failed) > 0:
+            Done = min(Index for (Index, Item) in enumerate(Batch) if Item[1]['kinesis']['sequenceNumber'] in Failed)
+            Sequence = Batch[Done][1]['kinesis']['sequenceNumber']
+            Attempts[Sequence] = Attempts.get(Sequence, 0)+1
+            if Attempts[Sequence] >= MaxAttempts:
+                Dropped += 1
+                Done += 1
+            else:
+                Retried += len(Batch)-Done
+
+        for Item in Batch[:Done]: Latencies.append(Clock-Item[0])
+        Pending = Pending[Done:]
+
+    Result.update({'Events':len(Records), 'Batches':Batches, 'Latencies':Latencies, 'Clock':Clock, 'Retried':Retried, 'Dropped':Dropped})
+
+def Replay(Table, Events, Shards, BatchSize, Poll, BatchingWindow):
+    #
+    # Records go to shards by partition key (the agent ARN), as Kinesis does
+    # it, and each shard is worked through at the same time as the others.
+    #
+    Events = sorted(Events, key=EventTime)
+    Start  = EventTime(Events[0])
+    ShardRecords = [[] for Shard in range(0, Shards)]
+    for (Sequence, Item) in enumerate(Events):
+        ShardRecords[zlib.crc32(Item['AgentARN'].encode()) % Shards].append((EventTime(Item)-Start, Record(Item, Sequence)))
+
+    Table.Reset()
+    Results = [{} for Shard in range(0, Shards)]
+    Threads = [threading.Thread(target=ReplayShard, args=(Table, ShardRecords[Shard], BatchSize, Poll, BatchingWindow, Results[Shard])) for Shard in range(0, Shards) if len(ShardRecords[Shard]) > 0]
+    Started = time.perf_counter()
+    for Thread in Threads: Thread.start()
+    for Thread in Threads: Thread.join()
+    Elapsed = time.perf_counter()-Started
+
+    #
+    # The writes to each partition are counted so the busiest can be compared
+    # with what DynamoDB allows on one partition.
+    #
+    return Results, Elapsed, Table.Stats()['Writes'], EventTime(Events[-1])-Start
+
+def main():
+    Parser = argparse.ArgumentParser(description='Replay agent events through the agent event function')
+    Parser.add_argument('--scenario', choices=['shift', 'steady'], default='shift')
+    Parser.add_argument('--input', help='file of recorded agent events (one per line) to replay instead')
+    Parser.add_argument('--logins', type=int, default=5000, help='agents logging in during a shift change')
+    Parser.add_argument('--logouts', type=int, default=1000, help='agents logging out during a shift change')
+    Parser.add_argument('--agents', type=int, default=2000, help='agents taking contacts in the steady scenario')
+    Parser.add_argument('--window', type=float, default=60, help='seconds the events are spread over')
+    Parser.add_argument('--known', type=float, default=0.5, help='share of agents already stored from an earlier shift')
+    Parser.add_argument('--shards', type=int, default=1, help='Kinesis shards (one container each)')
+    Parser.add_argument('--batch', type=int, default=100, help='records in each Kinesis batch')
+    Parser.add_argument('--poll', type=float, default=1.0, help='seconds between polls of an idle shard')
+    Parser.add_argument('--batching-window', type=float, default=0.0, help='seconds a batch waits for more records unless it fills')
+    Parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every DynamoDB call')
+    Parser.add_argument('--store', default='memory', help='memory or sqlite:<file> (the file is replaced)')
+    Parser.add_argument('--seed', type=int, default=1)
+    Parser.add_argument('--save', help='write the made up events to this file so they can be replayed again')
+    Parser.add_argument('--output', help='file to write the results to (default is standard output)')
+    Arguments = Parser.parse_args()
+
+    random.seed(Arguments.seed)
+    if Arguments.input:
+        Events = ReadEvents(Arguments.input)
+    elif Arguments.scenario == 'shift':
+        Events = ShiftEvents(time.time(), Arguments.logins, Arguments.logouts, Arguments.window)
+    else:
+        Events = SteadyEvents(time.time()-Arguments.window, Arguments.agents, Arguments.window)
+    if len(Events) == 0:
+        print('No events to replay', file=sys.stderr)
+        sys.exit(1)
+
+    if Arguments.save:
+        with open(Arguments.save, 'w') as File:
+            for Item in sorted(Events, key=EventTime):
+                File.write(json.dumps(Item)+'\n')
+
+    Table = OpenStore(Arguments.store, Arguments.latency)
+    Known = Prepare(Table, Events, Arguments.known)
+    (Results, Elapsed, PartitionWrites, Span) = Replay(Table, Events, Arguments.shards, Arguments.batch, Arguments.poll, Arguments.batching_window)
+
+    Stats     = Table.Stats()
+    Count     = len(Events)
+    Latencies = sorted(Latency for Result in Results for Latency in Result.get('Latencies', []))
+    Batches   = sorted(Batch for Result in Results for Batch in Result.get('Batches', []))
+    Finished  = max(Result.get('Clock', 0) for Result in Results)
+    EventTypes = {}
+    for Item in Events: EventTypes[Item['EventType']] = EventTypes.get(Item['EventType'], 0)+1
+
+    Output = {'Scenario':'input' if Arguments.input else Arguments.scenario, 'Events':Count, 'EventTypes':EventTypes,
+              'Agents':len(set(Item['AgentARN'] for Item in Events)), 'KnownAgents':Known,
+              'Shards':Arguments.shards, 'BatchSize':Arguments.batch, 'Poll':Arguments.poll, 'BatchingWindow':Arguments.batching_window, 'Latency':Arguments.latency, 'Store':Arguments.store,
+              'EventSpanSeconds':round(Span, 3), 'FinishedAfterSeconds':round(Finished, 3), 'BacklogSeconds':round(max(0, Finished-Span), 3),
+              'WallSeconds':round(Elapsed, 3), 'EventsPerSecond':round(Count/Elapsed, 1),
+              'Batches':len(Batches), 'BatchMs':{'Median':Percentile(Batches, 0.5), 'P90':Percentile(Batches, 0.9), 'P99':Percentile(Batches, 0.99), 'Max':round(Batches[-1], 3)},
+              'EventLatencySeconds':{'P50':Percentile(Latencies, 0.5), 'P90':Percentile(Latencies, 0.9), 'P99':Percentile(Latencies, 0.99), 'Max':round(Latencies[-1], 3)},
+              'Retried':sum(Result.get('Retried', 0) for Result in Results), 'Dropped':sum(Result.get('Dropped', 0) for Result in Results),
+              'Calls':Stats['Calls'], 'CallsPerEvent':round(Stats['TotalCalls']/Count, 3),
+              'WriteCallsPerEvent':round(sum(Stats['Calls'].get(Call, 0) for Call in Writes)/Count, 3),
+              'ReadCallsPerEvent':round(sum(Stats['Calls'].get(Call, 0) for Call in Stats['Calls'] if Call not in Writes)/Count, 3),
+              'ItemsWrittenPerEvent':round(Stats['ItemsWritten']/Count, 3), 'BytesWrittenPerEvent':round(Stats['BytesWritten']/Count, 1),
+              'ItemsReadPerEvent':round(Stats['ItemsRead']/Count, 3),
+              'PartitionWrites':dict(sorted(PartitionWrites.items(), key=lambda Item: -Item[1])[:20]),
+              'WriteUnits':sum(Stats['WriteUnits'].values()), 'PartitionWriteUnits':dict(sorted(Stats['WriteUnits'].items(), key=lambda Item: -Item[1])[:20])}
+    if len(PartitionWrites) > 0 and Span > 0:
+        Output['HottestPartitionWritesPerSecond'] = round(max(PartitionWrites.values())/max(Span, Finished), 1)
+        Output['WriteUnitsPerSecond'] = round(Output['WriteUnits']/max(Span, Finished), 1)
+        Output['SnapshotWriteUnitsPerSecond'] = round(Stats['WriteUnits'].get('Snapshot', 0)/max(Span, Finished), 1)
+
+    print(f'{Count} events in {Elapsed:.2f}s ({Output["EventsPerSecond"]}/s), {Output["CallsPerEvent"]} DynamoDB calls per event, '
+          f'event latency p50 {Output["EventLatencySeconds"]["P50"]}s p99 {Output["EventLatencySeconds"]["P99"]}s, finished {Output["BacklogSeconds"]}s after the last event', file=sys.stderr)
+
+    Text = json.dumps(Output, indent=2)
+    if Arguments.output:
+        with open(Arguments.output, 'w') as File:
+            File.write(Text)
+    else:
+        print(Text)
+
+if __name__ == '__main__':
+    main()
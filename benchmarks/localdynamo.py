@@ -0,0 +1,136 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# The benchmarks run the Lambda functions against one of the stores in
+# storage/python/wallboardstore.py rather than DynamoDB. The stores count every call
+# along with the items and bytes read and written, and can add a fixed delay
+# to each call to stand in for the network round trip.
+#
+
+import os
+import sys
+import time
+import random
+import importlib.util
+from types import SimpleNamespace
+from botocore.hooks import HierarchicalEmitter
+from botocore.model import ServiceId
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(Root, 'storage', 'python'))
+
+from wallboardstore import MemoryStore, SQLiteStore
+
+States          = ['Available', 'On Contact', 'After Call Work', 'Lunch', 'Break', 'Training', 'Logout']
+RoutingProfiles = ['Sales', 'Support', 'Billing', 'Retention']
+
+def OpenStore(Store, Latency=0.0):
+    #
+    # A fresh table for each run - memory or sqlite:<file> (which is replaced).
+    #
+    if Store.startswith('sqlite:'):
+        if os.path.exists(Store[7:]): os.remove(Store[7:])
+        return SQLiteStore(Store[7:], Latency)
+
+    return MemoryStore(Latency)
+
+def LoadFunction(Directory, Table):
+    #
+    # Import one of the Lambda functions (each lives in its own directory as
+    # lambda_function.py) and point it at the local table.
+    #
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('MetricNamespace', '') # Keep the metric lines out of the results
+    Spec = importlib.util.spec_from_file_location(Directory.replace('-', '_'), os.path.join(Root, Directory, 'lambda_function.py'))
+    Module = importlib.util.module_from_spec(Spec)
+    Spec.loader.exec_module(Module)
+    Module.Store = Table
+
+    return Module
+
+def AgentItems(Agent, Count):
+    #
+    # Agent records the way the agent event function stores them.
+    #
+    Now   = int(time.time())
+    Items = []
+    for Index in range(0, Count):
+        Username = f'agent{Index:05d}'
+        Items.append({'Identifier':Agent.GetAgentShard(Username), 'RecordType':Username,
+                      'Value':random.choice(States), 'AgentARN':f'arn:aws:connect:us-east-1:123456789012:instance/bench/agent/{Index:05d}',
+                      'FullAgentName':f'Agent Number{Index}', 'RoutingProfile':random.choice(RoutingProfiles),
+                      'LastEventTimestamp':'2026-01-01T09:00:00.000Z', 'StateSince':'2026-01-01T09:00:00.000Z',
+                      'LastSeen':Now, 'ExpiresAt':Now+86400})
+
+    return Items
+
+class StubPaginator:
+    def __init__(self, Connect):
+        self.Connect = Connect
+
+    def paginate(self, InstanceId):
+        Queues = self.Connect.Queues.get(InstanceId, [])
+        for Start in range(0, max(len(Queues), 1), 100):
+            self.Connect.Count('ListQueues')
+            yield {'QueueSummaryList':[{'Id':Queue} for Queue in Queues[Start:Start+100]]}
+
+class StubConnect:
+    #
+    # Stands in for the Amazon Connect client. It knows the queues in each
+    # instance and answers real-time metric requests with made up values,
+    # a page of results at a time, after an optional delay for each call.
+    #
+    def __init__(self, Queues, Latency=0.0):
+        self.Queues  = Queues # {InstanceId:[QueueId, ...]}
+        self.Latency = Latency
+        self.Calls   = {}
+        self.meta    = SimpleNamespace(events=HierarchicalEmitter(), service_model=SimpleNamespace(service_id=ServiceId('Connect'))) # So the functions can watch it for throttling
+
+    def Count(self, Call):
+        self.Calls[Call] = self.Calls.get(Call, 0)+1
+        if self.Latency > 0: time.sleep(self.Latency)
+
+    def get_paginator(self, Operation):
+        return StubPaginator(self)
+
+    def get_current_metric_data(self, InstanceId, Groupings, Filters, CurrentMetrics, NextToken=None, MaxResults=100):
+        self.Count('GetCurrentMetricData')
+        Queues = [Queue for Queue in Filters['Queues'] if Queue in self.Queues.get(InstanceId, [])]
+        Start  = int(NextToken or 0)
+
+        Results = []
+        for Queue in Queues[Start:Start+MaxResults]:
+            Results.append({'Dimensions':{'Queue':{'Id':Queue}},
+                            'Collections':[{'Metric':Metric, 'Value':float(random.randint(0, 50))} for Metric in CurrentMetrics]})
+
+        Response = {'MetricResults':Results}
+        if Start+MaxResults < len(Queues): Response['NextToken'] = str(Start+MaxResults)
+        return Response
+
+class StubBoto3:
+    #
+    # Put in place of a function's boto3 module so it gets the stub client.
+    #
+    def __init__(self, Connect):
+        self.Connect = Connect
+
+    def client(self, Service, **Arguments):
+        if Service != 'connect': raise ValueError(f'No stub for {Service}')
+        return self.Connect
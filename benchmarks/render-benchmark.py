@@ -0,0 +1,307 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Time the render function on made up wallboards of different sizes. For
+# each combination of cells, calculations and agents a wallboard definition
+# is written in the import format and loaded with wallboard-import.py, agents
+# and metrics are added the way the other functions store them, and then
+# lambda_handler is timed - split into loading the configuration, reading
+# the data and building the HTML, JSON or MessagePack - in a new container
+# (cold) and in one that has already served requests (warm). By default the
+# real-time values are stored by the real-time poller (against a stub of
+# the API) as they are when deployed; --realtime render also times the
+# render function calling the stub itself on every request.
+#
+# Usage: render-benchmark.py [--cells 10 500 2000] [--calculations 0 200]
+#                            [--agents 100 10000] [--iterations 10]
+#                            [--latency 0.005] [--api-latency 0.05]
+#                            [--thresholds 300] [--thresholded 0.3]
+#                            [--store memory|sqlite:<file>] [--json-options agents=false]
+#                            [--realtime poller render]
+#                            [--output results.json]
+#
+
+import argparse
+import base64
+import gzip
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import urllib.parse
+import time
+import yaml
+from localdynamo import Root, OpenStore, SQLiteStore, LoadFunction, AgentItems, States, RoutingProfiles, StubConnect, StubBoto3
+
+InstanceId      = '12345678-1234-1234-1234-123456789012'
+RealtimeMetrics = ['CONTACTS_IN_QUEUE', 'AGENTS_AVAILABLE', 'OLDEST_CONTACT_AGE', 'AGENTS_ON_CALL']
+HistoricMetrics = ['CONTACTS_HANDLED', 'CONTACTS_ABANDONED', 'HANDLE_TIME']
+Metrics         = RealtimeMetrics+HistoricMetrics
+Colours         = ['Green', 'Orange', 'Yellow', 'Red', 'Blue', 'Purple', 'Grey']
+
+#
+# The parts of lambda_handler that are timed, and the functions that do them
+#
+Phases  = {'Config':'GetConfiguration', 'Data':'GetData', 'Realtime':'GetRealtimeData', 'Thresholds':'EvaluateThresholds',
+           'HTML':'RenderHTML', 'JSON':'RenderJSON', 'MessagePack':'RenderMessagePack'}
+Formats = ['HTML', 'JSON', 'MessagePack']
+
+def QueueId(Index):
+    return f'87654321-4321-4321-4321-{Index:012d}'
+
+def MakeWallboard(WallboardName, Cells, Calculations, Agents, Thresholds=None, Thresholded=0.3):
+    #
+    # A definition the way someone would write one: a data source for every
+    # few cells, thresholds on some of them, calculations over the sources
+    # and a mix of metric, calculation, agent, agent count and text cells.
+    #
+    SourceCount = max(4, min(Cells//4, 500))
+    Sources = [{'Source':f'Source{Index}', 'Description':f'{Metrics[Index % len(Metrics)]} for queue {Index//len(Metrics)}',
+                'Reference':f'{InstanceId}:{QueueId(Index//len(Metrics))}:{Metrics[Index % len(Metrics)]}'} for Index in range(0, SourceCount)]
+    SourceNames = [Source['Source'] for Source in Sources]
+
+    CalculationList = []
+    for Index in range(0, Calculations):
+        (First, Second, Third) = random.sample(SourceNames, 3)
+        Formula = random.choice([f'{First}+{Second}', f'{First}+{Second}*2-{Third}', f'max({First},{Second})', f'round({First}/({Second}+1))'])
+        CalculationList.append({'Calculation':f'Calculation{Index}', 'Formula':Formula})
+    CalculationNames = [Calculation['Calculation'] for Calculation in CalculationList]
+
+    ThresholdList = []
+    for Index in range(0, Thresholds or max(1, min(Cells//20, 100))):
+        Threshold = {'Threshold':f'Threshold{Index}', 'Reference':random.choice(SourceNames+CalculationNames)}
+        if Index % 2 == 0:
+            Threshold['WarnAbove']  = random.randint(5, 20)
+            Threshold['AlertAbove'] = Threshold['WarnAbove']+random.randint(5, 20)
+        else:
+            Threshold['WarnBelow']  = random.randint(10, 20)
+            Threshold['AlertBelow'] = Threshold['WarnBelow']-random.randint(1, 9)
+        ThresholdList.append(Threshold)
+    ThresholdNames = [Threshold['Threshold'] for Threshold in ThresholdList]
+
+    Columns = min(Cells, 20)
+    Rows    = []
+    for Index in range(0, Cells):
+        if Index % Columns == 0: Rows.append({'Row':len(Rows)+1, 'Cells':[]})
+        Cell = {'Cell':Index % Columns+1}
+
+        Kind = random.random()
+        if Kind < 0.35 or (Kind < 0.55 and Calculations == 0):
+            Cell['Reference'] = random.choice(SourceNames)
+        elif Kind < 0.55:
+            Cell['Reference'] = random.choice(CalculationNames)
+        elif Kind < 0.80:
+            Cell['Reference'] = random.choice(['=allagents', '=activeagents'])
+        elif Kind < 0.85:
+            Cell['Reference'] = f'=agentcount:{random.choice(States)}'
+            if random.random() < 0.5: Cell['Reference'] += f':{random.choice(RoutingProfiles)}'
+        else:
+            Cell['Text'] = f'Label {Index}'
+
+        if 'Reference' in Cell and not Cell['Reference'].endswith('agents') and random.random() < Thresholded:
+            Cell['ThresholdReference'] = random.choice(ThresholdNames)
+        Rows[-1]['Cells'].append(Cell)
+
+    Definition = {'WallboardTemplateFormatVersion':1, 'Description':f'{Cells} cells, {Calculations} calculations, {Agents} agents',
+                  'Identifier':WallboardName, 'Defaults':{'TextSize':14},
+                  'Sources':Sources, 'Thresholds':ThresholdList, 'AgentStates':[{'State':State, 'Color':Colour} for (State, Colour) in zip(States, Colours)],
+                  'Rows':Rows}
+    if len(CalculationList) > 0: Definition['Calculations'] = CalculationList
+
+    return Definition, len(Sources), len(ThresholdList), SourceCount//len(Metrics)+1
+
+def ImportWallboard(Directory, Definition, Queues):
+    #
+    # Run the real import utility against a SQLite file. It checks the queues
+    # each source refers to - they come from its queue cache rather than
+    # Connect.
+    #
+    FileName = os.path.join(Directory, f'{Definition["Identifier"]}.yaml')
+    with open(FileName, 'w') as File:
+        yaml.safe_dump(Definition, File, sort_keys=False)
+
+    QueueCacheFile = os.path.join(Directory, 'queues.json')
+    with open(QueueCacheFile, 'w') as File:
+        json.dump({InstanceId:{'Fetched':time.time(), 'Queues':Queues}}, File)
+
+    Database = os.path.join(Directory, 'import.db')
+    if os.path.exists(Database): os.remove(Database)
+
+    Environment = dict(os.environ, WallboardStore=f'sqlite:{Database}', QueueCacheFile=QueueCacheFile, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    Start  = time.perf_counter()
+    Result = subprocess.run([sys.executable, os.path.join(Root, 'wallboard-import.py'), FileName], env=Environment, capture_output=True, text=True)
+    Elapsed = time.perf_counter()-Start
+    if Result.returncode != 0:
+        raise RuntimeError(f'Import failed: {Result.stdout}{Result.stderr}')
+
+    return SQLiteStore(Database).AllItems(), Elapsed
+
+def MakeTable(Store, Latency, Items, Agents, SourceCount, Connect):
+    Table    = OpenStore(Store, Latency)
+    Agent    = LoadFunction('process-agent-event', Table)
+    Poller   = LoadFunction('get-historical-metrics', Table)
+    Realtime = LoadFunction('get-realtime-metrics', Table)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    Items = Items+AgentItems(Agent, Agents)
+    Table.Load(Items)
+
+    #
+    # Historical values are stored (and put in the snapshot) the way the
+    # historical function does it. The real-time poller does one poll of the
+    # stub and stores what it gets along with its own snapshot.
+    #
+    Poller.GetConfiguration()
+    Poller.Data = {f'Source{Index}':str(random.randint(0, 500)) for Index in range(0, SourceCount) if Metrics[Index % len(Metrics)] in HistoricMetrics}
+    Poller.WriteData()
+    Poller.WriteSnapshot()
+
+    Realtime.boto3 = StubBoto3(Connect)
+    Realtime.GetConfiguration()
+    Realtime.GetRealtimeData()
+    Realtime.WriteData()
+    Realtime.WriteSnapshot()
+    for Shard in range(0, Agent.AgentShards):
+        Agent.SaveSnapshot(f'Agent#{Shard}', 0, Agent.SeedAgentSnapshot(f'Agent#{Shard}'))
+
+    return Table
+
+def LoadRender(Table, Connect, Timings, InRender):
+    #
+    # A new copy of the render function is a new (cold) container. Each of the
+    # phase functions is wrapped so we know how long it took.
+    #
+    Start  = time.perf_counter()
+    Render = LoadFunction('render-wallboard', Table)
+    Elapsed = time.perf_counter()-Start
+    logging.getLogger().setLevel(logging.ERROR)
+
+    Render.boto3            = StubBoto3(Connect)
+    Render.RealtimeInRender = InRender
+    for (Phase, Name) in Phases.items():
+        def Timed(*Arguments, Function=getattr(Render, Name), Phase=Phase, **Keywords):
+            Started = time.perf_counter()
+            try:
+                return Function(*Arguments, **Keywords)
+            finally:
+                Timings[Phase] = Timings.get(Phase, 0)+(time.perf_counter()-Started)*1000
+        setattr(Render, Name, Timed)
+
+    return Render, Elapsed*1000
+
+def Invoke(Render, Table, Connect, Timings, WallboardName, Format, Options={}):
+    Timings.clear()
+    Table.Reset()
+    Connect.Calls = {}
+    Render.LastRealtimeRun = 0 # With --realtime render every request calls the API rather than every few seconds
+
+    Parameters = {'Wallboard':WallboardName}
+    if Format == 'JSON': Parameters.update(Options, json='true')
+    if Format == 'MessagePack': Parameters.update(Options, format='msgpack')
+
+    Start    = time.perf_counter()
+    Response = Render.lambda_handler({'queryStringParameters':Parameters}, None)
+    Result   = {Phase:round(Timings.get(Phase, 0), 3) for Phase in Phases if Phase == Format or Phase not in Formats}
+    Result['Total'] = round((time.perf_counter()-Start)*1000, 3)
+    Result['TableCalls']   = Table.Stats()['TotalCalls']
+    Result['ConnectCalls'] = sum(Connect.Calls.values())
+    Body = base64.b64decode(Response['body']) if Response.get('isBase64Encoded') else Response['body'].encode('utf-8')
+    Result['BodyBytes']    = len(Body)
+    Result['GzipBytes']    = len(gzip.compress(Body)) # What API Gateway would send with compression turned on
+
+    if b'not found' in Body: raise RuntimeError(f'Render could not find {WallboardName}')
+    return Result
+
+def Summarise(Results):
+    Summary = {}
+    for Name in Results[0]:
+        Values = sorted(Result[Name] for Result in Results)
+        Summary[Name] = {'Median':round(statistics.median(Values), 3), 'P95':Values[min(len(Values)-1, int(len(Values)*0.95))]}
+
+    return Summary
+
+def RunScenario(Arguments, Directory, Cells, Calculations, Agents, Mode):
+    WallboardName = f'Bench{Cells}c{Calculations}k{Agents}a'
+    (Definition, SourceCount, ThresholdCount, QueueCount) = MakeWallboard(WallboardName, Cells, Calculations, Agents, Arguments.thresholds, Arguments.thresholded)
+    Queues = [QueueId(Index) for Index in range(0, QueueCount)]
+
+    (Items, ImportSeconds) = ImportWallboard(Directory, Definition, Queues)
+    Connect = StubConnect({InstanceId:Queues}, Arguments.api_latency)
+    Table   = MakeTable(Arguments.store, Arguments.latency, Items, Agents, SourceCount, Connect)
+
+    Run = {'Wallboard':WallboardName, 'Realtime':Mode, 'Cells':Cells, 'Calculations':Calculations, 'Thresholds':ThresholdCount,
+           'ThresholdedCells':sum('ThresholdReference' in Cell for Row in Definition['Rows'] for Cell in Row['Cells']), 'Sources':SourceCount, 'Agents':Agents, 'ImportSeconds':round(ImportSeconds, 3), 'Cold':{}, 'Warm':{}}
+
+    Timings = {}
+    for Format in Formats:
+        (Render, LoadMs) = LoadRender(Table, Connect, Timings, Mode == 'render')
+        Run['Cold'][Format] = Invoke(Render, Table, Connect, Timings, WallboardName, Format, Arguments.json_options)
+        Run['Cold'][Format]['Load'] = round(LoadMs, 3)
+
+    (Render, LoadMs) = LoadRender(Table, Connect, Timings, Mode == 'render')
+    for Format in Formats:
+        Invoke(Render, Table, Connect, Timings, WallboardName, Format, Arguments.json_options) # Warm the container up
+        Run['Warm'][Format] = Summarise([Invoke(Render, Table, Connect, Timings, WallboardName, Format, Arguments.json_options) for Iteration in range(0, Arguments.iterations)])
+
+    return Run
+
+def main():
+    Parser = argparse.ArgumentParser(description='Time the render function on made up wallboards of different sizes')
+    Parser.add_argument('--cells', type=int, nargs='+', default=[10, 500, 2000])
+    Parser.add_argument('--calculations', type=int, nargs='+', default=[0, 200])
+    Parser.add_argument('--agents', type=int, nargs='+', default=[100, 10000])
+    Parser.add_argument('--thresholds', type=int, help='thresholds on each wallboard (default is one for every 20 cells, up to 100)')
+    Parser.add_argument('--thresholded', type=float, default=0.3, help='share of metric cells that have a threshold')
+    Parser.add_argument('--iterations', type=int, default=10, help='warm requests timed for each format')
+    Parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every DynamoDB call')
+    Parser.add_argument('--api-latency', type=float, default=0.0, help='seconds added to every Connect call')
+    Parser.add_argument('--store', default='memory', help='memory or sqlite:<file> (the file is replaced)')
+    Parser.add_argument('--json-options', type=lambda Query: dict(urllib.parse.parse_qsl(Query)), default={}, help='extra query string for JSON and MessagePack requests, such as agents=false or states=Available&limit=50')
+    Parser.add_argument('--realtime', nargs='+', choices=['poller', 'render'], default=['poller'], help='where the real-time values come from - stored by the poller (the default when deployed) and/or fetched by the render function (RealtimeInRender)')
+    Parser.add_argument('--seed', type=int, default=1)
+    Parser.add_argument('--output', help='file to write the results to (default is standard output)')
+    Arguments = Parser.parse_args()
+
+    random.seed(Arguments.seed)
+    Results = {'Iterations':Arguments.iterations, 'Latency':Arguments.latency, 'ApiLatency':Arguments.api_latency,
+               'Store':Arguments.store, 'JSONOptions':Arguments.json_options, 'Seed':Arguments.seed, 'Python':sys.version.split()[0], 'Runs':[]}
+
+    with tempfile.TemporaryDirectory() as Directory:
+        for (Cells, Calculations, Agents, Mode) in itertools.product(Arguments.cells, Arguments.calculations, Arguments.agents, Arguments.realtime):
+            Run = RunScenario(Arguments, Directory, Cells, Calculations, Agents, Mode)
+            Results['Runs'].append(Run)
+            print(f'{Cells} cells, {Calculations} calculations, {Agents} agents, real-time from {Mode}: cold HTML {Run["Cold"]["HTML"]["Total"]}ms, '
+                  f'warm HTML {Run["Warm"]["HTML"]["Total"]["Median"]}ms, warm JSON {Run["Warm"]["JSON"]["Total"]["Median"]}ms, '
+                  f'warm MessagePack {Run["Warm"]["MessagePack"]["Total"]["Median"]}ms', file=sys.stderr)
+
+    Output = json.dumps(Results, indent=2)
+    if Arguments.output:
+        with open(Arguments.output, 'w') as File:
+            File.write(Output)
+    else:
+        print(Output)
+
+if __name__ == '__main__':
+    main()
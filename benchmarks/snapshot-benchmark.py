@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Compare how the render function reads its data - one query per partition
+# or the snapshot items - for different numbers of agents. The snapshots are
+# built by the writer code in the agent event and historical functions, and
+# a batch of agent events is run through the agent event function to show
+# what keeping the snapshots up to date costs.
+#
+# Usage: snapshot-benchmark.py [--agents 500 5000] [--metrics 200]
+#                              [--iterations 20] [--latency 0.005] [--store memory|sqlite:<file>]
+#                              [--output results.json]
+#
+
+import argparse
+import base64
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+from localdynamo import OpenStore, LoadFunction, AgentItems, RoutingProfiles
+from wallboarddata import GetDataShard
+
+def MakeTable(Agents, Metrics, Latency, Store):
+    Table  = OpenStore(Store, Latency)
+    Agent  = LoadFunction('process-agent-event', Table)
+    Poller = LoadFunction('get-historical-metrics', Table)
+    Render = LoadFunction('render-wallboard', Table)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    #
+    # Agent records as the agent event function stores them, and metrics as
+    # the historical function stores them.
+    #
+    Items = AgentItems(Agent, Agents)
+    for Index in range(0, Metrics):
+        Items.append({'Identifier':GetDataShard(f'metric{Index}', Poller.DataShards), 'RecordType':f'metric{Index}', 'Value':str(random.randint(0, 500))})
+    Table.Load(Items)
+
+    return Table, Agent, Poller, Render
+
+def BuildSnapshots(Table, Agent, Poller, Metrics):
+    Table.Reset()
+    Start = time.perf_counter()
+    for Shard in range(0, Agent.AgentShards):
+        Agent.SaveSnapshot(f'Agent#{Shard}', 0, Agent.SeedAgentSnapshot(f'Agent#{Shard}'))
+    Poller.DataSources = {f'metric{Index}':f'bench:queue{Index}:CONTACTS_HANDLED' for Index in range(0, Metrics)}
+    Poller.Data        = {f'metric{Index}':Table.Get(GetDataShard(f'metric{Index}', Poller.DataShards), f'metric{Index}')['Value'] for Index in range(0, Metrics)}
+    Poller.WriteSnapshot()
+
+    return {'Seconds':time.perf_counter()-Start, 'Stats':Table.Stats()}
+
+def TimeReads(Table, Render, UseSnapshot, Iterations):
+    Render.UseSnapshot = UseSnapshot
+    Render.Data        = {}
+    Times = []
+    Table.Reset()
+    for Iteration in range(0, Iterations):
+        Start = time.perf_counter()
+        Render.GetData()
+        Times.append((time.perf_counter()-Start)*1000)
+
+    Stats = Table.Stats()
+    Times.sort()
+    return {'MedianMs':round(statistics.median(Times), 3),
+            'P95Ms':round(Times[min(len(Times)-1, int(len(Times)*0.95))], 3),
+            'CallsPerRead':Stats['TotalCalls']/Iterations,
+            'ItemsPerRead':Stats['ItemsRead']/Iterations,
+            'BytesPerRead':Stats['BytesRead']//Iterations,
+            'Agents':len(Render.SortedAgentList),
+            'Values':len(Render.Data)}, (dict(Render.Data), list(Render.SortedAgentList))
+
+def MakeEvent(Index, Sequence):
+    Event = {'EventType':'STATE_CHANGE', 'AgentARN':f'arn:aws:connect:us-east-1:123456789012:instance/bench/agent/{Index:05d}',
+             'EventTimestamp':f'2026-01-01T10:{Sequence//60%60:02d}:{Sequence%60:02d}.000Z',
+             'CurrentAgentSnapshot':{'AgentStatus':{'Name':random.choice(['Available', 'Lunch', 'Break'])}, 'Contacts':[],
+                                     'Configuration':{'FirstName':'Agent', 'LastName':f'Number{Index}', 'Username':f'agent{Index:05d}',
+                                                      'RoutingProfile':{'Name':random.choice(RoutingProfiles)}}}}
+
+    return {'kinesis':{'data':base64.b64encode(json.dumps(Event).encode()).decode(), 'sequenceNumber':str(Sequence)}}
+
+def TimeWrites(Table, Agent, Agents, BatchSize):
+    #
+    # One batch of state changes for different agents, as one Kinesis batch.
+    #
+    Records = [MakeEvent(Index, Sequence) for (Sequence, Index) in enumerate(random.sample(range(0, Agents), min(BatchSize, Agents)))]
+    Table.Reset()
+    Start    = time.perf_counter()
+    Response = Agent.lambda_handler({'Records':Records}, None)
+    Elapsed  = time.perf_counter()-Start
+
+    Stats = Table.Stats()
+    return {'Events':len(Records), 'Ms':round(Elapsed*1000, 3), 'Failures':len(Response['batchItemFailures']),
+            'Calls':Stats['Calls'], 'BytesWritten':Stats['BytesWritten']}
+
+def main():
+    Parser = argparse.ArgumentParser(description='Compare reading wallboard data by query and from the snapshots')
+    Parser.add_argument('--agents', type=int, nargs='+', default=[500, 5000])
+    Parser.add_argument('--metrics', type=int, default=200)
+    Parser.add_argument('--iterations', type=int, default=20)
+    Parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every DynamoDB call')
+    Parser.add_argument('--batch', type=int, default=100, help='agent events in the write batch')
+    Parser.add_argument('--store', default='memory', help='memory or sqlite:<file> (the file is replaced)')
+    Parser.add_argument('--output', help='file to write the results to (default is standard output)')
+    Arguments = Parser.parse_args()
+
+    random.seed(1)
+    Results = {'Metrics':Arguments.metrics, 'Iterations':Arguments.iterations, 'Latency':Arguments.latency, 'Store':Arguments.store, 'Runs':[]}
+    for Agents in Arguments.agents:
+        (Table, Agent, Poller, Render) = MakeTable(Agents, Arguments.metrics, Arguments.latency, Arguments.store)
+        Run = {'Agents':Agents}
+        Run['BuildSnapshots'] = BuildSnapshots(Table, Agent, Poller, Arguments.metrics)
+        (Run['Query'], QueryData)       = TimeReads(Table, Render, False, Arguments.iterations)
+        (Run['Snapshot'], SnapshotData) = TimeReads(Table, Render, True, Arguments.iterations)
+        Run['SameResult'] = QueryData == SnapshotData
+        Run['SnapshotBytes'] = {Item['RecordType']:len(Item['Snapshot']) for Item in Table.AllItems() if Item['Identifier'] == 'Snapshot'}
+        Run['WriteBatch'] = TimeWrites(Table, Agent, Agents, Arguments.batch)
+        Results['Runs'].append(Run)
+        print(f'{Agents} agents: query {Run["Query"]["MedianMs"]}ms/{Run["Query"]["CallsPerRead"]:.0f} calls, '
+              f'snapshot {Run["Snapshot"]["MedianMs"]}ms/{Run["Snapshot"]["CallsPerRead"]:.0f} calls, same result: {Run["SameResult"]}', file=sys.stderr)
+
+    Output = json.dumps(Results, indent=2)
+    if Arguments.output:
+        with open(Arguments.output, 'w') as File:
+            File.write(Output)
+    else:
+        print(Output)
+
+if __name__ == '__main__':
+    main()
@@ -40,7 +40,16 @@ class WallboardStack(Stack):
             sort_key=dynamodb.Attribute(name="RecordType", type=dynamodb.AttributeType.STRING),
             billing_mode=dynamodb.BillingMode.PROVISIONED,
             read_capacity=10,
-            write_capacity=10
+            write_capacity=10,
+            time_to_live_attribute="ExpiresAt"
+        )
+
+        # Lambda layer: the storage interface all of the functions use
+        storage_layer = lambda_.LayerVersion(
+            self, "WallboardStorageLayer",
+            code=lambda_.Code.from_asset("../storage"),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_14],
+            description="Connect wallboard storage interface"
         )
 
         # Lambda: Render Wallboard
@@ -49,6 +58,7 @@ class WallboardStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_14,
             handler="lambda_function.lambda_handler",
             code=lambda_.Code.from_asset("../render-wallboard"),
+            layers=[storage_layer],
             timeout=Duration.seconds(20),
             environment={"WallboardTable": table.table_name}
         )
@@ -64,6 +74,7 @@ class WallboardStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_14,
             handler="lambda_function.lambda_handler",
             code=lambda_.Code.from_asset("../get-historical-metrics/"),
+            layers=[storage_layer],
             timeout=Duration.seconds(20),
             environment={"WallboardTable": table.table_name}
         )
@@ -80,12 +91,37 @@ class WallboardStack(Stack):
             targets=[targets.LambdaFunction(historical_lambda)]
         )
 
+        # Lambda: Realtime Metrics - polls every few seconds until the next start
+        realtime_lambda = lambda_.Function(
+            self, "WallboardLambdaRealtime",
+            runtime=lambda_.Runtime.PYTHON_3_14,
+            handler="lambda_function.lambda_handler",
+            code=lambda_.Code.from_asset("../get-realtime-metrics/"),
+            layers=[storage_layer],
+            timeout=Duration.seconds(70),
+            reserved_concurrent_executions=1,
+            environment={"WallboardTable": table.table_name}
+        )
+        table.grant_read_write_data(realtime_lambda)
+        realtime_lambda.add_to_role_policy(iam.PolicyStatement(
+            actions=["connect:GetCurrentMetricData"],
+            resources=["*"]
+        ))
+
+        # EventBridge Rule for Realtime Metrics
+        events.Rule(
+            self, "WallboardRealtimeEvent",
+            schedule=events.Schedule.rate(Duration.minutes(1)),
+            targets=[targets.LambdaFunction(realtime_lambda)]
+        )
+
         # Lambda: Agent Events
         agent_lambda = lambda_.Function(
             self, "WallboardLambdaAgentEvent",
             runtime=lambda_.Runtime.PYTHON_3_14,
             handler="lambda_function.lambda_handler",
             code=lambda_.Code.from_asset("../process-agent-event"),
+            layers=[storage_layer],
             timeout=Duration.seconds(20),
             environment={"WallboardTable": table.table_name}
         )
@@ -93,13 +129,18 @@ class WallboardStack(Stack):
         agent_lambda.add_event_source(
             event_sources.KinesisEventSource(
                 stream=kinesis.Stream.from_stream_arn(self, "KinesisStream", kinesis_agent_stream),
-                starting_position=lambda_.StartingPosition.LATEST
+                starting_position=lambda_.StartingPosition.LATEST,
+                batch_size=500,
+                max_batching_window=Duration.seconds(5),
+                report_batch_item_failures=True
             )
         )
 
         # API Gateway
         api = apigateway.RestApi(
             self, "WallboardAPIGateway",
+            binary_media_types=["application/msgpack"],
+            minimum_compression_size=1024,
             deploy_options=apigateway.StageOptions(
                 stage_name="prod",
                 data_trace_enabled=True
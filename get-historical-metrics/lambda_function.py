@@ -18,11 +18,11 @@
 #
 
 import boto3
-from boto3.dynamodb.conditions import Key,Attr
 import os
 import time
 import logging
 import datetime
+import json
 
 #
 # Things to configure
@@ -31,17 +31,46 @@ DDBTableName          = os.environ.get('WallboardTable', 'ConnectWallboard')
 ConfigTimeout         = int(os.environ.get('ConfigTimeout', 300)) # How long we wait before grabbing the config from the database
 ServiceLevelThreshold = 60  # See note in README.md
 MaxItemsPerAPICall    = 100 # Maximum number of metrics returned from Connect
-Table                 = boto3.resource('dynamodb').Table(DDBTableName)
+BucketMinutes         = 5   # Size of each rolling window bucket - matches the API's five minute granularity
+MaxWindow             = int(os.environ.get('MaxWindowMinutes', 60)) # Longest rolling window (in minutes) we keep buckets for
+BucketCount           = MaxWindow//BucketMinutes+1
+SlotsPerDay           = 1440//BucketMinutes
+DefaultRefresh        = int(os.environ.get('DefaultRefreshMinutes', 1)) # How often a data source is fetched if it doesn't say
+RefreshSlack          = 10  # Seconds of leeway so that scheduling jitter doesn't make a source skip a tick
+DataShards            = int(os.environ.get('DataShards', 4)) # Number of partitions metrics are spread over - must match the other functions
+ProfileRate           = float(os.environ.get('ProfileRate', 0)) # Share of invocations profiled with cProfile (0 to 1) - see README.md
+ProfileTop            = int(os.environ.get('ProfileTop', 25)) # Functions listed in the log for each profile
+LogLevel              = os.environ.get('LogLevel', 'INFO').upper() # DEBUG also logs every value stored and every API request
+MetricNamespace       = os.environ.get('MetricNamespace', 'ConnectWallboard') # CloudWatch namespace for the per-run metrics - empty for none
+FunctionName          = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'get-historical-metrics')
+WallboardStore = os.environ.get('WallboardStore', 'dynamodb') # dynamodb, memory or sqlite:<file> - see storage/python/wallboardstore.py
+
+import wallboardstore # From the storage layer
+import wallboardmetrics # From the storage layer
+import wallboarddata # From the storage layer
+Store   = wallboardstore.OpenStore(WallboardStore, DDBTableName)
+Metrics = wallboardmetrics.Metrics(FunctionName, MetricNamespace, ProfileRate, ProfileTop)
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LogLevel)
+Debug = logger.isEnabledFor(logging.DEBUG) # Checked before building per-item messages so they cost nothing otherwise
 
 #
 # Global state
 #
-LastRun     = 0
-DataSources = {}
-Data        = {}
+LastRun       = 0
+DataSources   = {}
+Refresh       = {}
+LastFetched   = {}
+LastWritten   = {}
+Data          = {}
+Results       = {}
+Buckets       = {}
+DirtyBuckets  = set()
+BucketsLoaded = False
+Trends        = {}
+DirtyTrends   = set()
+SnapshotWritten = {}
 
 #
 # List of valid metrics we can retrieve
@@ -74,20 +103,51 @@ MetricUnitMapping = {
     'SERVICE_LEVEL': ['PERCENT', 'AVG']
   }
 
-def ProcessChunks(List, Size):
-    return (List[Pos:Pos+Size] for Pos in range(0, len(List), Size))
+#
+# Rolling windows for averaged metrics can't be worked out by subtracting one
+# since-midnight value from another - we need to know how many contacts each
+# average covers. These are the count metrics we request alongside so that the
+# average can be weighted. A weight of None means weight by elapsed time.
+#
+WindowWeightMapping = {
+    'SERVICE_LEVEL': 'CONTACTS_QUEUED',
+    'HANDLE_TIME': 'CONTACTS_HANDLED',
+    'AFTER_CONTACT_WORK_TIME': 'CONTACTS_HANDLED',
+    'QUEUE_ANSWER_TIME': 'CONTACTS_HANDLED',
+    'HOLD_TIME': 'CONTACTS_HANDLED',
+    'INTERACTION_TIME': 'CONTACTS_HANDLED',
+    'INTERACTION_AND_HOLD_TIME': 'CONTACTS_HANDLED',
+    'OCCUPANCY': None
+  }
+
+if WallboardStore == 'dynamodb': Metrics.WatchClient(Store.Client)
+
+def SplitReference(Reference):
+    #
+    # References are ConnectARN:QueueARN:Metric with an optional rolling window
+    # on the end of the metric - for example CONTACTS_ABANDONED@30m. A window
+    # of zero means the value since midnight.
+    #
+    (ConnectARN,QueueARN,Metric) = Reference.split(':')
+    Window = 0
+    if '@' in Metric:
+        (Metric,WindowString) = Metric.split('@', 1)
+        Window = int(WindowString.rstrip('m'))
+
+    return ConnectARN, QueueARN, Metric, Window
 
 def GetConfiguration():
-    global LastRun,ConfigTimeout,DDBTableName,Table,DataSources,UnitMapping
+    global LastRun,ConfigTimeout,DDBTableName,Store,DataSources,Refresh,UnitMapping
     
     #
     # We only want to retrieve the configuration for the wallboard if we haven't
     # retrieved it recently or it hasn't previously been loaded.
     #
-    logging.info(f'Last run at {LastRun}, timeout is {ConfigTimeout}, now is {time.time()}')
+    if Debug: logging.debug(f'Last run at {LastRun}, timeout is {ConfigTimeout}, now is {time.time()}')
     
     if time.time() < LastRun+ConfigTimeout:
-        logging.info('  Within timeout period - no config refresh')
+        if Debug: logging.debug('  Within timeout period - no config refresh')
+        Metrics.Count('ConfigCacheHits')
         return
     LastRun = time.time()
 
@@ -96,100 +156,189 @@ def GetConfiguration():
     # details, etc.) all have a primary partition key of the name of the
     # wallboard.
     #
-    Expression = Attr('RecordType').begins_with('DataSource')
     try:
-        Response = Table.scan(FilterExpression=Expression)
-        ConfigList = Response
+        ConfigList = Store.GetDataSources()
     except Exception as e:
         logging.error(f'DynamoDB error: {e}')
         return False
 
-    if len(Response['Items']) == 0:
+    if len(ConfigList) == 0:
         logging.error('Did not get any data sources')
         return
 
-    while 'LastEvaluatedKey' in Response:
-        try:
-            Response = Table.scan(ExclusiveStartKey=Response['LastEvaluatedKey'])
-            ConfigList.update(Response)
-        except Exception as e:
-            logging.error(f'DynamoDB error: {e}')
-            break
-
     DataSources = {}
-    for Item in ConfigList['Items']:
+    Refresh     = {}
+    for Item in ConfigList:
         if 'Name' not in Item:
             logging.warning(f'Data source reference not set for {Item["RecordType"]} - ignored')
             continue
         
-        Metric = Item['Reference'].split(':')[2]
+        try:
+            (ConnectARN,QueueARN,Metric,Window) = SplitReference(Item['Reference'])
+        except ValueError:
+            logging.warning(f'Could not parse reference {Item["Reference"]} for {Item["Name"]} - ignored')
+            continue
+
         if Metric not in MetricUnitMapping: continue # Ignore non-historical metrics
+
+        if Window:
+            if Window%BucketMinutes or Window > MaxWindow:
+                logging.warning(f'Window for {Item["Name"]} must be a multiple of {BucketMinutes} minutes up to {MaxWindow} - ignored')
+                continue
+            if MetricUnitMapping[Metric][1] != 'SUM' and Metric not in WindowWeightMapping:
+                logging.warning(f'Rolling windows are not supported for {Metric} in {Item["Name"]} - ignored')
+                continue
+
         DataSources[Item['Name']] = Item['Reference']
 
+        #
+        # Sources can ask to be fetched less often than every time we run.
+        # Daily volumes don't need to be as fresh as service level.
+        #
+        try:
+            Refresh[Item['Name']] = max(1, int(Item.get('Refresh', DefaultRefresh)))
+        except ValueError:
+            logging.warning(f'Refresh interval {Item["Refresh"]} for {Item["Name"]} is not a number - using {DefaultRefresh}')
+            Refresh[Item['Name']] = DefaultRefresh
+
+        #
+        # Windows need a bucket every five minutes, whatever the source asks.
+        #
+        if Window and Refresh[Item['Name']] > BucketMinutes:
+            logging.warning(f'Refresh for {Item["Name"]} is longer than the {BucketMinutes} minute buckets its window needs - using {BucketMinutes}')
+            Refresh[Item['Name']] = BucketMinutes
+
     return
 
 def StoreMetric(ConnectARN, QueueARN, MetricName, Value):
-    global DataSources,Data,logging
+    global DataSources,Data,Results,logging
 
     SourceString = f'{ConnectARN}:{QueueARN}:{MetricName}'
+    Results[SourceString] = Value
 
+    Found = False
     for Source in DataSources:
         if DataSources[Source] == SourceString:
             Data[Source] = str(int(Value))
-            logging.info(f'Storing {Data[Source]} in {Source}')
-            return
+            if Debug: logging.debug(f'Storing {Data[Source]} in {Source}')
+            Found = True
 
+    if Found: return
+    if SourceString in Buckets: return # Only needed for rolling windows
     logging.warning(f'Could not find {SourceString} in DataSources')
 
+def AddMetric(ConnectList, ConnectARN, QueueARN, Metric):
+    global MetricUnitMapping
+
+    if ConnectARN not in ConnectList: ConnectList[ConnectARN] = {}
+    if QueueARN not in ConnectList[ConnectARN]: ConnectList[ConnectARN][QueueARN] = []
+
+    for Existing in ConnectList[ConnectARN][QueueARN]:
+        if Existing['Name'] == Metric: return
+
+    if Metric == 'SERVICE_LEVEL':
+        ConnectList[ConnectARN][QueueARN].append({'Name':Metric,'Unit':MetricUnitMapping[Metric][0],'Statistic':MetricUnitMapping[Metric][1],'Threshold':{'Comparison':'LT','ThresholdValue':ServiceLevelThreshold}})
+    else:
+        ConnectList[ConnectARN][QueueARN].append({'Name':Metric,'Unit':MetricUnitMapping[Metric][0],'Statistic':MetricUnitMapping[Metric][1]})
+
+def GetMetricList(ConnectList, Instance):
+    #
+    # The same metric list is applied to every queue in the request so each
+    # metric only needs to appear once.
+    #
+    MetricList = []
+    for Queue in ConnectList[Instance]:
+        for Metric in ConnectList[Instance][Queue]:
+            if Metric not in MetricList: MetricList.append(Metric)
+
+    return MetricList
+
+def GetChunkSize(ConnectList, Instance):
+    return max(1, int(MaxItemsPerAPICall/len(GetMetricList(ConnectList, Instance))))
+
+def CountAPICalls(ConnectList):
+    Calls = 0
+    for Instance in ConnectList:
+        Calls += len(list(wallboarddata.ProcessChunks(list(ConnectList[Instance].keys()), GetChunkSize(ConnectList, Instance))))
+
+    return Calls
+
 def GetHistoricalData():
-    global logging,LastRealtimeRun,Data,DataSources,MetricUnitMapping,Data
+    global logging,LastRealtimeRun,Data,DataSources,MetricUnitMapping,Results,Buckets,LastFetched
 
-    Connect = boto3.client('connect')
+    Connect = Metrics.WatchClient(boto3.client('connect'))
+    Results = {}
+    Now     = time.time()
     
     #
-    # Build a list of information we need from the API.
+    # Build a list of information we need from the API. Only sources that are
+    # due for a refresh are fetched - we also build the full list so that we
+    # can report how many calls that saved. Rolling windows use the same
+    # since-midnight value (plus a weighting count for averages) so they don't
+    # add any calls of their own.
     #
     ConnectList = {}
+    FullList    = {}
+    Due         = []
     for Item in DataSources:
-        if Item not in Data: Data[Item] = '0'
+        (ConnectARN,QueueARN,Metric,Window) = SplitReference(DataSources[Item])
 
-        (ConnectARN,QueueARN,Metric) = DataSources[Item].split(':')
+        #
+        # A rolling window has no value until the bucket at its start has
+        # been filled, so it is left blank rather than showing 0 until then.
+        #
+        if Item not in Data and not Window: Data[Item] = '0'
+        AddMetric(FullList, ConnectARN, QueueARN, Metric)
+        if Window and WindowWeightMapping.get(Metric):
+            AddMetric(FullList, ConnectARN, QueueARN, WindowWeightMapping[Metric])
 
-        if ConnectARN not in ConnectList: ConnectList[ConnectARN] = {}
-        if QueueARN not in ConnectList[ConnectARN]: ConnectList[ConnectARN][QueueARN] = []
+        if Now < LastFetched.get(Item, 0)+Refresh.get(Item, DefaultRefresh)*60-RefreshSlack: continue
+        Due.append(Item)
+        AddMetric(ConnectList, ConnectARN, QueueARN, Metric)
 
-        if Metric == 'SERVICE_LEVEL':
-            ConnectList[ConnectARN][QueueARN].append({'Name':Metric,'Unit':MetricUnitMapping[Metric][0],'Statistic':MetricUnitMapping[Metric][1],'Threshold':{'Comparison':'LT','ThresholdValue':ServiceLevelThreshold}})
-        else:
-            ConnectList[ConnectARN][QueueARN].append({'Name':Metric,'Unit':MetricUnitMapping[Metric][0],'Statistic':MetricUnitMapping[Metric][1]})
+        if Window:
+            BaseReference = f'{ConnectARN}:{QueueARN}:{Metric}'
+            if BaseReference not in Buckets: Buckets[BaseReference] = [None]*BucketCount
+            if WindowWeightMapping.get(Metric):
+                WeightReference = f'{ConnectARN}:{QueueARN}:{WindowWeightMapping[Metric]}'
+                if WeightReference not in Buckets: Buckets[WeightReference] = [None]*BucketCount
+                AddMetric(ConnectList, ConnectARN, QueueARN, WindowWeightMapping[Metric])
 
     FiveMinuteMark = datetime.datetime.now().minute-datetime.datetime.now().minute%5
+    EndTime        = datetime.datetime.now().replace(minute=FiveMinuteMark, second=0)
+
+    FullCalls = CountAPICalls(FullList)
+    DueCalls  = CountAPICalls(ConnectList)
+    logging.info(f'{len(Due)} of {len(DataSources)} sources due - {DueCalls} API calls, saved {FullCalls-DueCalls}')
+    Metrics.Count('SourcesDue', len(Due))
+    Metrics.Count('CallsSaved', FullCalls-DueCalls)
     
     #
     # Now call the API for each Connect instance we're interested in.
     #
+    FailedInstances = set()
     for Instance in ConnectList:
         logging.info(f'Retrieving historical data from {Instance}')
         
-        MetricList = []
-        for Queue in ConnectList[Instance]:
-            MetricList += ConnectList[Instance][Queue]
-        logging.info(f'  Metrics: {MetricList}')
+        MetricList = GetMetricList(ConnectList, Instance)
+        if Debug: logging.debug(f'  Metrics: {MetricList}')
  
-        ChunkSize = int(MaxItemsPerAPICall/(len(MetricList)*len(ConnectList[Instance])))
+        ChunkSize = GetChunkSize(ConnectList, Instance)
 
-        for QueueList in ProcessChunks(list(ConnectList[Instance].keys()), ChunkSize):
-            logging.info(f'  Queues: {QueueList}')
+        for QueueList in wallboarddata.ProcessChunks(list(ConnectList[Instance].keys()), ChunkSize):
+            if Debug: logging.debug(f'  Queues: {QueueList}')
+            Metrics.Count('ConnectCalls')
             try:
                 Response = Connect.get_metric_data(
                                InstanceId=Instance,
                                StartTime=datetime.datetime.now().replace(hour=0, minute=0, second=0),
-                               EndTime=datetime.datetime.now().replace(minute=FiveMinuteMark, second=0),
+                               EndTime=EndTime,
                                Groupings=['QUEUE'],
                                Filters={'Queues':QueueList},
                                HistoricalMetrics=MetricList)
             except Exception as e:
                 logging.error(f'Failed to get historical data: {e}')
+                FailedInstances.add(Instance)
                 continue
 
             if 'MetricResults' not in Response: continue
@@ -201,21 +350,310 @@ def GetHistoricalData():
                     MetricValue = Metric['Value']
                     StoreMetric(Instance, QueueARN, MetricName, MetricValue)
 
+    #
+    # Anything that failed is left as due so we try again next time.
+    #
+    for Item in Due:
+        if DataSources[Item].split(':')[0] not in FailedInstances: LastFetched[Item] = Now
+
+    return EndTime
+
+def GetSlot(EndTime):
+    #
+    # Buckets are numbered from the start of time so that we can tell which
+    # ones belong to today - the since-midnight values reset each day.
+    #
+    return EndTime.toordinal()*SlotsPerDay + (EndTime.hour*60+EndTime.minute)//BucketMinutes
+
+def LoadBuckets():
+    global Buckets,BucketsLoaded
+
+    #
+    # The rolling window buckets survive between invocations in memory but we
+    # need to read them back from the table after a cold start.
+    #
+    if BucketsLoaded: return
+
+    try:
+        BucketList = Store.GetPartition('Buckets')
+    except Exception as e:
+        logging.error(f'DynamoDB error: {e}')
+        return
+
+    for Item in BucketList:
+        Ring = [None]*BucketCount
+        for (Slot,Value) in json.loads(Item['Buckets']):
+            Ring[Slot%BucketCount] = [Slot,Value]
+        Buckets[Item['RecordType']] = Ring
+
+    BucketsLoaded = True
+
+def UpdateBuckets(Slot):
+    global Buckets,Results,DirtyBuckets
+
+    #
+    # Each bucket holds the since-midnight value as at the end of that five
+    # minute period. We only mark a ring for writing when it has changed.
+    #
+    for Reference in Buckets:
+        if Reference not in Results: continue
+
+        Entry = [Slot, Results[Reference]]
+        if Buckets[Reference][Slot%BucketCount] != Entry:
+            Buckets[Reference][Slot%BucketCount] = Entry
+            DirtyBuckets.add(Reference)
+
+def GetBucketValue(Reference, Slot, StartSlot):
+    global Buckets
+
+    #
+    # Find the since-midnight value at the start of a window. Anything before
+    # midnight counts as zero. If polling missed that bucket there is no
+    # value - using a later one would quietly make the window shorter.
+    #
+    if StartSlot//SlotsPerDay != Slot//SlotsPerDay: return 0
+
+    Ring  = Buckets.get(Reference, [])
+    Entry = Ring[StartSlot%BucketCount] if len(Ring) else None
+    if Entry is not None and Entry[0] == StartSlot: return Entry[1]
+
+    return None
+
+def CalculateWindows(Slot):
+    global DataSources,Data,Results
+
+    for Source in DataSources:
+        (ConnectARN,QueueARN,Metric,Window) = SplitReference(DataSources[Source])
+        if not Window: continue
+
+        BaseReference = f'{ConnectARN}:{QueueARN}:{Metric}'
+        if BaseReference not in Results: continue
+
+        StartSlot  = Slot-Window//BucketMinutes
+        StartValue = GetBucketValue(BaseReference, Slot, StartSlot)
+        if StartValue is None:
+            logging.warning(f'No bucket for {BaseReference} at the start of the {Window} minute window - {Source} not updated')
+            Metrics.Count('WindowsSkipped')
+            continue
+        EndValue = Results[BaseReference]
+
+        if MetricUnitMapping[Metric][1] == 'SUM':
+            Value = EndValue-StartValue
+        else:
+            #
+            # Weighted difference of the two since-midnight averages.
+            #
+            if WindowWeightMapping[Metric] is None:
+                StartWeight = (StartSlot%SlotsPerDay)*BucketMinutes if StartSlot//SlotsPerDay == Slot//SlotsPerDay else 0
+                EndWeight   = (Slot%SlotsPerDay)*BucketMinutes
+            else:
+                WeightReference = f'{ConnectARN}:{QueueARN}:{WindowWeightMapping[Metric]}'
+                if WeightReference not in Results: continue
+                StartWeight = GetBucketValue(WeightReference, Slot, StartSlot)
+                if StartWeight is None:
+                    logging.warning(f'No bucket for {WeightReference} at the start of the {Window} minute window - {Source} not updated')
+                    Metrics.Count('WindowsSkipped')
+                    continue
+                EndWeight = Results[WeightReference]
+
+            if EndWeight > StartWeight:
+                Value = (EndValue*EndWeight-StartValue*StartWeight)/(EndWeight-StartWeight)
+            else:
+                Value = 0
+
+        Data[Source] = str(int(max(Value, 0)))
+        if Debug: logging.debug(f'Storing {Data[Source]} in {Source}')
+
+def WriteBuckets():
+    global Store,Buckets,DirtyBuckets
+
+    for Reference in DirtyBuckets:
+        DDBOutput = {}
+        DDBOutput['Identifier'] = 'Buckets'
+        DDBOutput['RecordType'] = Reference
+        DDBOutput['Buckets']    = json.dumps(sorted([Entry for Entry in Buckets[Reference] if Entry is not None]), separators=(',',':'))
+
+        try:
+            Store.PutItem(DDBOutput)
+        except Exception as e:
+            logging.error(f'DynamoDB put error: {e}')
+
+    DirtyBuckets = set()
+
+def EncodeSamples(Values):
+    #
+    # Trend samples are packed as the difference from the previous sample,
+    # zigzag encoded (so small negative numbers stay small) and written as
+    # variable length integers. A day of five minute samples is usually only
+    # a few hundred bytes. The zigzag step is written out rather than done
+    # with shifts so that differences past 64 bits still come back the same.
+    #
+    Packed   = bytearray()
+    Previous = 0
+    for Value in Values:
+        Delta = Value-Previous
+        Previous = Value
+        Delta = Delta*2 if Delta >= 0 else -Delta*2-1
+        while Delta > 0x7f:
+            Packed.append((Delta & 0x7f) | 0x80)
+            Delta >>= 7
+        Packed.append(Delta)
+
+    return bytes(Packed)
+
+def DecodeSamples(Packed):
+    Values   = []
+    Previous = 0
+    Delta    = 0
+    Shift    = 0
+    for Byte in Packed:
+        Delta |= (Byte & 0x7f) << Shift
+        Shift += 7
+        if Byte & 0x80: continue
+
+        Previous += (Delta >> 1) ^ -(Delta & 1)
+        Values.append(Previous)
+        Delta = 0
+        Shift = 0
+
+    return Values
+
+def LoadTrend(Source, Day):
+    global Store
+
+    #
+    # Each source has one trend item per day so that today's samples can be
+    # read (and rewritten) in a single request.
+    #
+    Trend = {'Day':Day, 'First':0, 'Values':[]}
+    try:
+        Item = Store.GetItem('Trend', f'{Source}#{Day}')
+    except Exception as e:
+        logging.error(f'DynamoDB error: {e}')
+        return Trend
+
+    if Item is not None:
+        Trend['First']  = int(Item['First'])
+        Trend['Values'] = DecodeSamples(bytes(Item['Samples']))
+
+    return Trend
+
+def UpdateTrends(Slot):
+    global DataSources,Data,Trends,DirtyTrends
+
+    Day    = datetime.date.fromordinal(Slot//SlotsPerDay).isoformat()
+    Offset = Slot%SlotsPerDay
+
+    for Source in DataSources:
+        if Source not in Data: continue
+
+        if Source not in Trends or Trends[Source]['Day'] != Day:
+            Trends[Source] = LoadTrend(Source, Day)
+        Trend = Trends[Source]
+
+        try:
+            Value = int(Data[Source])
+        except ValueError:
+            continue
+
+        if len(Trend['Values']) == 0: Trend['First'] = Offset
+        Index = Offset-Trend['First']
+        if Index < 0: continue
+
+        #
+        # Fill any gaps (where we weren't polling) with the last known value.
+        #
+        while len(Trend['Values']) < Index:
+            Trend['Values'].append(Trend['Values'][-1])
+
+        if Index == len(Trend['Values']):
+            Trend['Values'].append(Value)
+            DirtyTrends.add(Source)
+        elif Trend['Values'][Index] != Value:
+            Trend['Values'][Index] = Value
+            DirtyTrends.add(Source)
+
+def WriteTrends():
+    global Store,Trends,DirtyTrends
+
+    for Source in DirtyTrends:
+        DDBOutput = {}
+        DDBOutput['Identifier'] = 'Trend'
+        DDBOutput['RecordType'] = f'{Source}#{Trends[Source]["Day"]}'
+        DDBOutput['First']      = str(Trends[Source]['First'])
+        DDBOutput['Samples']    = EncodeSamples(Trends[Source]['Values'])
+
+        try:
+            Store.PutItem(DDBOutput)
+        except Exception as e:
+            logging.error(f'DynamoDB put error: {e}')
+
+    DirtyTrends = set()
+
 def WriteData():
-    global Table,Data
+    global Store,Data,LastWritten
 
+    #
+    # Sources that weren't refreshed (or haven't changed) don't need writing.
+    #
     for Item in Data:
+        if LastWritten.get(Item) == Data[Item]: continue
+
         DDBOutput = {}
-        DDBOutput['Identifier'] = 'Data'
+        DDBOutput['Identifier'] = wallboarddata.GetDataShard(Item, DataShards)
         DDBOutput['RecordType'] = Item
         DDBOutput['Value']      = Data[Item]
 
         try:
-            Table.put_item(TableName=DDBTableName, Item=DDBOutput)
+            Store.PutItem(DDBOutput)
+            LastWritten[Item] = Data[Item]
+            Metrics.Count('ItemsWritten')
         except Exception as e:
             logging.error(f'DynamoDB put error: {e}')
 
+def SeedSnapshot():
+    #
+    # The first time the snapshot is written we start from the metrics that
+    # are already stored so that sources which aren't due yet aren't missing.
+    # Only our own sources are copied - real-time values have a snapshot of
+    # their own and a copy here would go stale.
+    #
+    Contents = {}
+    for Partition in ['Data'] + [f'Data#{Shard}' for Shard in range(0, DataShards)]:
+        for Item in Store.GetPartition(Partition):
+            if Item['RecordType'] not in DataSources: continue
+            Contents[Item['RecordType']] = str(Item['Value'])
+
+    return Contents
+
+def WriteSnapshot():
+    global Store,Data,SnapshotWritten
+
+    #
+    # As well as the individual items we keep every metric in one compressed
+    # item so that the render function can read them all at once. Sources
+    # that have been removed drop out of it, and if it hasn't been written
+    # yet it is filled from the stored metrics.
+    #
+    wallboarddata.WriteSnapshot(Store, Metrics, 'Data', DataSources, Data, SnapshotWritten, SeedSnapshot)
+
 def lambda_handler(event, context):
-    GetConfiguration()
-    GetHistoricalData()
-    WriteData()
\ No newline at end of file
+    Profiler = Metrics.StartProfile()
+    with Metrics.TimePhase('Config'):
+        GetConfiguration()
+        LoadBuckets()
+    with Metrics.TimePhase('Connect'):
+        Slot = GetSlot(GetHistoricalData())
+    with Metrics.TimePhase('Calculate'):
+        UpdateBuckets(Slot)
+        CalculateWindows(Slot)
+        UpdateTrends(Slot)
+    with Metrics.TimePhase('Write'):
+        WriteData()
+    with Metrics.TimePhase('Snapshot'):
+        WriteSnapshot()
+    with Metrics.TimePhase('Write'):
+        WriteBuckets()
+        WriteTrends()
+    Metrics.StopProfile(Profiler, f'{len(DataSources)} data sources')
+    Metrics.Emit()
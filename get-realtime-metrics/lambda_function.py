@@ -0,0 +1,235 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import boto3
+import os
+import time
+import logging
+
+#
+# Things to configure
+#
+DDBTableName     = os.environ.get('WallboardTable', 'ConnectWallboard')
+ConfigTimeout    = int(os.environ.get('ConfigTimeout', 300)) # How long we wait before grabbing the config from the database
+PollInterval     = int(os.environ.get('PollInterval', 5)) # Seconds between each call to the real-time API
+ScheduleInterval = 60  # How often we are started by EventBridge - we keep polling until the next start
+MaxQueuesPerCall = 100 # Most queues the real-time API takes in one filter
+DataShards       = int(os.environ.get('DataShards', 4)) # Number of partitions metrics are spread over - must match the other functions
+ProfileRate      = float(os.environ.get('ProfileRate', 0)) # Share of invocations profiled with cProfile (0 to 1) - see README.md
+ProfileTop       = int(os.environ.get('ProfileTop', 25)) # Functions listed in the log for each profile
+LogLevel         = os.environ.get('LogLevel', 'INFO').upper()
+MetricNamespace  = os.environ.get('MetricNamespace', 'ConnectWallboard') # CloudWatch namespace for the per-run metrics - empty for none
+FunctionName     = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'get-realtime-metrics')
+WallboardStore = os.environ.get('WallboardStore', 'dynamodb') # dynamodb, memory or sqlite:<file> - see storage/python/wallboardstore.py
+
+import wallboardstore # From the storage layer
+import wallboardmetrics # From the storage layer
+import wallboarddata # From the storage layer
+Store   = wallboardstore.OpenStore(WallboardStore, DDBTableName)
+Metrics = wallboardmetrics.Metrics(FunctionName, MetricNamespace, ProfileRate, ProfileTop)
+
+logger = logging.getLogger()
+logger.setLevel(LogLevel)
+
+#
+# Global state
+#
+LastRun         = 0
+DataSources     = {}
+Data            = {}
+LastWritten     = {}
+SnapshotWritten = {}
+
+#
+# List of valid metrics we can retrieve
+#
+MetricUnitMapping = {
+    'AGENTS_AVAILABLE': 'COUNT',
+    'AGENTS_ONLINE': 'COUNT',
+    'AGENTS_ON_CALL': 'COUNT',
+    'AGENTS_STAFFED': 'COUNT',
+    'AGENTS_AFTER_CONTACT_WORK': 'COUNT',
+    'AGENTS_NON_PRODUCTIVE': 'COUNT',
+    'AGENTS_ERROR': 'COUNT',
+    'CONTACTS_IN_QUEUE': 'COUNT',
+    'OLDEST_CONTACT_AGE': 'SECONDS',
+    'CONTACTS_SCHEDULED': 'COUNT'
+  }
+
+if WallboardStore == 'dynamodb': Metrics.WatchClient(Store.Client)
+
+def GetConfiguration():
+    global LastRun,ConfigTimeout,Store,DataSources
+
+    #
+    # Data sources are defined per wallboard but we fetch all of them as they
+    # may be cross-referenced on other wallboards. We only re-read them every
+    # so often.
+    #
+    if time.time() < LastRun+ConfigTimeout:
+        Metrics.Count('ConfigCacheHits')
+        return
+    LastRun = time.time()
+
+    try:
+        ConfigList = Store.GetDataSources()
+    except Exception as e:
+        logger.error(f'DynamoDB error: {e}')
+        return
+
+    DataSources = {}
+    for Item in ConfigList:
+        if 'Name' not in Item or 'Reference' not in Item:
+            logger.warning(f'Data source reference not set for {Item["RecordType"]} - ignored')
+            continue
+
+        try:
+            (ConnectARN,QueueARN,Metric) = Item['Reference'].split(':')
+        except ValueError:
+            logger.warning(f'Could not parse reference {Item["Reference"]} for {Item["Name"]} - ignored')
+            continue
+
+        if Metric not in MetricUnitMapping: continue # Ignore non real-time metrics
+        DataSources[Item['Name']] = Item['Reference']
+
+    logger.info(f'Loaded {len(DataSources)} real-time data sources')
+
+def StoreMetric(ConnectARN, QueueARN, MetricName, Value):
+    global DataSources,Data
+
+    SourceString = f'{ConnectARN}:{QueueARN}:{MetricName}'
+
+    for Source in DataSources:
+        if DataSources[Source] == SourceString:
+            Data[Source] = str(int(Value))
+
+def GetRealtimeData():
+    global Data,DataSources,MetricUnitMapping
+
+    Connect = Metrics.WatchClient(boto3.client('connect'))
+
+    #
+    # First build a list of information we need from the API.
+    #
+    ConnectList = {}
+    for Item in DataSources:
+        if Item not in Data: Data[Item] = '0'
+
+        (ConnectARN,QueueARN,Metric) = DataSources[Item].split(':')
+
+        if ConnectARN not in ConnectList: ConnectList[ConnectARN] = {}
+        if QueueARN not in ConnectList[ConnectARN]: ConnectList[ConnectARN][QueueARN] = []
+        if Metric not in [Existing['Name'] for Existing in ConnectList[ConnectARN][QueueARN]]:
+            ConnectList[ConnectARN][QueueARN].append({'Name':Metric, 'Unit':MetricUnitMapping[Metric]})
+
+    #
+    # Now call the API for each Connect instance we're interested in - in
+    # groups of queues that the API will accept, and following the pages.
+    #
+    for Instance in ConnectList:
+        for QueueList in wallboarddata.ProcessChunks(list(ConnectList[Instance].keys()), MaxQueuesPerCall):
+            MetricList = []
+            for Queue in QueueList:
+                for Metric in ConnectList[Instance][Queue]:
+                    if Metric not in MetricList: MetricList.append(Metric)
+
+            Arguments = {'InstanceId':Instance, 'Groupings':['QUEUE'], 'Filters':{'Queues':QueueList}, 'CurrentMetrics':MetricList}
+            while True:
+                Metrics.Count('ConnectCalls')
+                try:
+                    Response = Connect.get_current_metric_data(**Arguments)
+                except Exception as e:
+                    logger.error(f'Failed to get real-time data from {Instance}: {e}')
+                    break
+
+                for Collection in Response.get('MetricResults', []):
+                    QueueARN = Collection['Dimensions']['Queue']['Id']
+                    for Metric in Collection['Collections']:
+                        StoreMetric(Instance, QueueARN, Metric['Metric']['Name'], Metric.get('Value', 0))
+
+                if 'NextToken' not in Response: break
+                Arguments['NextToken'] = Response['NextToken']
+
+def WriteData():
+    global Store,Data,LastWritten
+
+    #
+    # Values that haven't changed since we last wrote them don't need writing.
+    #
+    for Item in Data:
+        if LastWritten.get(Item) == Data[Item]:
+            Metrics.Count('UnchangedValues')
+            continue
+
+        DDBOutput = {}
+        DDBOutput['Identifier'] = wallboarddata.GetDataShard(Item, DataShards)
+        DDBOutput['RecordType'] = Item
+        DDBOutput['Value']      = Data[Item]
+
+        try:
+            Store.PutItem(DDBOutput)
+            LastWritten[Item] = Data[Item]
+            Metrics.Count('ValuesWritten')
+        except Exception as e:
+            logger.error(f'DynamoDB put error: {e}')
+
+def WriteSnapshot():
+    global Store,Data,SnapshotWritten
+
+    #
+    # Real-time values are kept in their own snapshot item (the historical
+    # function has another) so that the render function can read them along
+    # with everything else in one call. Every poll fetches every value so
+    # there is nothing to fill in when the snapshot is first written.
+    #
+    wallboarddata.WriteSnapshot(Store, Metrics, 'Realtime', DataSources, Data, SnapshotWritten)
+
+def lambda_handler(event, context):
+    #
+    # EventBridge can only start us once a minute so we poll every
+    # PollInterval seconds until the next start is due (or we are about to
+    # run out of time). Polls are spaced from when the last one started so
+    # slow API calls don't make us drift.
+    #
+    Profiler = Metrics.StartProfile()
+    Start = time.time()
+    Polls = 0
+    while True:
+        PollStart = time.time()
+        with Metrics.TimePhase('Config'):
+            GetConfiguration()
+        if len(DataSources) == 0: break # Nothing to do until the next start
+
+        with Metrics.TimePhase('Connect'):
+            GetRealtimeData()
+        with Metrics.TimePhase('Write'):
+            WriteData()
+        with Metrics.TimePhase('Snapshot'):
+            WriteSnapshot()
+        Polls += 1
+
+        NextPoll = PollStart+PollInterval
+        if NextPoll >= Start+ScheduleInterval: break
+        if context is not None and context.get_remaining_time_in_millis() < (NextPoll-time.time()+PollInterval)*1000: break
+        time.sleep(max(0, NextPoll-time.time()))
+
+    logger.info(f'Polled the real-time API {Polls} times for {len(DataSources)} data sources')
+    Metrics.Count('Polls', Polls)
+    Metrics.StopProfile(Profiler, f'{Polls} polls')
+    Metrics.Emit()
@@ -17,103 +17,636 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
-import boto3
-from boto3.dynamodb.conditions import Attr
+from collections import OrderedDict
 import base64
 import json
+import math
 import os
+import time
 import logging
+import zlib
 
 DDBTableName = os.environ.get('WallboardTable', 'ConnectWallboard')
-Table        = boto3.resource('dynamodb').Table(DDBTableName)
+AgentCacheSize = int(os.environ.get('AgentCacheSize', 5000)) # How many agents we keep mappings and recent states for in memory
+UnknownAgentExpiry = int(os.environ.get('UnknownAgentExpiry', 60)) # How long we remember that an AgentARN has no mapping (seconds)
+DataShards   = int(os.environ.get('DataShards', 4)) # Number of partitions metrics are spread over - must match the other functions
+AgentShards  = int(os.environ.get('AgentShards', 4)) # Number of partitions agents are spread over - must match the other functions
+HeartbeatInterval = int(os.environ.get('HeartbeatInterval', 300)) # Most often we record that an agent is still alive (seconds)
+AgentExpiry  = int(os.environ.get('AgentExpiry', 86400)) # How long after we last hear from an agent that their record is removed (seconds)
+LogoutExpiry = int(os.environ.get('LogoutExpiry', 3600)) # How long after logging out that an agent's record is removed (seconds)
+SnapshotRetries = 5 # How many times we re-read and merge the snapshot if someone else changed it first
+MaxSnapshotSize = 350000 # DynamoDB items can't be bigger than 400KB
+SnapshotWarnSize = int(os.environ.get('SnapshotWarnSize', 10240)) # Snapshots bigger than this (bytes) take more than the table's default write capacity to rewrite - see README.md
+SnapshotRefresh = int(os.environ.get('SnapshotRefresh', 21600)) # Most often a heartbeat pushes back when an agent expires in the snapshot (seconds)
+ProfileRate  = float(os.environ.get('ProfileRate', 0)) # Share of invocations profiled with cProfile (0 to 1) - see README.md
+ProfileTop   = int(os.environ.get('ProfileTop', 25)) # Functions listed in the log for each profile
+LogLevel     = os.environ.get('LogLevel', 'INFO').upper() # DEBUG also logs every event and lookup
+MetricNamespace = os.environ.get('MetricNamespace', 'ConnectWallboard') # CloudWatch namespace for the per-batch metrics - empty for none
+FunctionName = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'process-agent-event')
+WallboardStore = os.environ.get('WallboardStore', 'dynamodb') # dynamodb, memory or sqlite:<file> - see storage/python/wallboardstore.py
+
+import wallboardstore # From the storage layer
+import wallboardmetrics # From the storage layer
+import wallboarddata # From the storage layer
+Store   = wallboardstore.OpenStore(WallboardStore, DDBTableName)
+Metrics = wallboardmetrics.Metrics(FunctionName, MetricNamespace, ProfileRate, ProfileTop)
+
+#
+# Global state
+#
+AgentCache    = OrderedDict()
+UnknownAgents = OrderedDict()
+LastState     = OrderedDict()
+LastSeen      = OrderedDict()
+SnapshotSeen  = OrderedDict()
+SnapshotChanges    = {}
+SnapshotHeartbeats = {}
+SnapshotARNs       = {}
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LogLevel)
+Debug = logger.isEnabledFor(logging.DEBUG) # Checked before building per-event messages so they cost nothing otherwise
+
+if WallboardStore == 'dynamodb': Metrics.WatchClient(Store.Client)
+
+def GetAgentShard(Username):
+    #
+    # Agents are spread over several partitions (Agent#0..n) so that no
+    # single partition takes every write. The hash must match the other
+    # functions.
+    #
+    return f'Agent#{zlib.crc32(Username.encode()) % AgentShards}'
+
+def GetAgentPartitions():
+    #
+    # The original single "Data" partition is included so that tables that
+    # haven't been migrated are still searched.
+    #
+    return ['Data'] + [f'Agent#{Shard}' for Shard in range(0, AgentShards)]
+
+def Remember(Cache, Key, Value):
+    #
+    # The per-agent caches are kept in least recently used order and trimmed
+    # to AgentCacheSize so a long-lived container doesn't keep every agent
+    # it has ever seen.
+    #
+    Cache[Key] = Value
+    Cache.move_to_end(Key)
+    while len(Cache) > AgentCacheSize:
+        Cache.popitem(last=False)
+
+def CacheAgent(AgentARN, Username, FullAgentName):
+    global AgentCache,UnknownAgents
+
+    UnknownAgents.pop(AgentARN, None)
+    Remember(AgentCache, AgentARN, (Username, FullAgentName))
+
+def SaveAgentARN(Username, FullAgentName, AgentARN, Writer=None):
+    global Store,AgentCache
+
+    #
+    # LOGIN and LOGOUT events only carry the agent ARN so we keep an item
+    # that maps the ARN back to the username. We only need to write it when
+    # we haven't seen this agent (or their name has changed).
+    #
+    if AgentCache.get(AgentARN) == (Username, FullAgentName):
+        AgentCache.move_to_end(AgentARN)
+        return
+
+    Data = {}
+    Data['Identifier']    = 'AgentARN'
+    Data['RecordType']    = AgentARN
+    Data['Username']      = Username
+    Data['FullAgentName'] = FullAgentName
+
+    try:
+        if Writer is None:
+            Store.PutItem(Data)
+        else:
+            Writer.Put(Data)
+    except Exception as e:
+        logger.error(f'DDB put error: {e}')
+        return
+
+    CacheAgent(AgentARN, Username, FullAgentName)
+
+def MigrateDataShards():
+    global Store
+
+    #
+    # Move everything out of the original single "Data" partition into the
+    # sharded partitions. Anything already written to a shard is newer so we
+    # don't overwrite it. Invoke the function with
+    # {"Action": "MigrateDataShards"} to run this.
+    #
+    try:
+        Items = Store.GetPartition('Data')
+    except Exception as e:
+        logger.error(f'DDB query error: {e}')
+        return
+
+    Moved = []
+    for Item in Items:
+        NewItem = dict(Item)
+        if 'AgentARN' in Item:
+            NewItem['Identifier'] = GetAgentShard(Item['RecordType'])
+        else:
+            NewItem['Identifier'] = wallboarddata.GetDataShard(Item['RecordType'], DataShards)
+
+        try:
+            Store.PutIfMissing(NewItem) # If it's already there it's newer - either way the original can go
+        except Exception as e:
+            logger.error(f'DDB put error for {Item["RecordType"]}: {e}')
+            continue
+        Moved.append(Item['RecordType'])
+
+    try:
+        with Store.Writer() as Writer:
+            for RecordType in Moved:
+                Writer.Delete('Data', RecordType)
+    except Exception as e:
+        logger.error(f'DDB batch write error: {e}')
+
+    logger.info(f'Moved {len(Moved)} of {len(Items)} items out of the Data partition')
+
+def BackfillAgentARNs():
+    global Store
+
+    #
+    # Agents stored before the AgentARN mapping items existed don't have one,
+    # so their LOGIN and LOGOUT events can't be matched to them. This writes
+    # a mapping for every stored agent - it is run along with
+    # MigrateDataShards rather than searching the agents for each event.
+    #
+    Agents = {}
+    try:
+        for Partition in GetAgentPartitions():
+            for Item in Store.GetPartition(Partition, AgentsOnly=True):
+                Agents[Item['AgentARN']] = Item # Newer partitions replace the original
+    except Exception as e:
+        logger.error(f'DDB query error: {e}')
+        return
+
+    try:
+        with Store.Writer() as Writer:
+            for AgentARN in Agents:
+                Writer.Put({'Identifier':'AgentARN', 'RecordType':AgentARN, 'Username':Agents[AgentARN]['RecordType'], 'FullAgentName':Agents[AgentARN].get('FullAgentName', '')})
+    except Exception as e:
+        logger.error(f'DDB batch write error: {e}')
+        return
+
+    logger.info(f'Wrote {len(Agents)} agent ARN mappings')
+
+def LoadSnapshot(RecordType):
+    global Store
+
+    Version, Packed = Store.LoadSnapshot(RecordType)
+    if Packed is None: return 0, None
+
+    return Version, json.loads(zlib.decompress(Packed))
+
+def SaveSnapshot(RecordType, Version, Contents):
+    global Store
+
+    #
+    # Only replace the snapshot if nobody else has since we read it - if they
+    # have, the caller reads it again and merges its changes into theirs.
+    #
+    Packed = zlib.compress(json.dumps(Contents, separators=(',',':')).encode('utf-8'))
+    if len(Packed) > MaxSnapshotSize:
+        logger.error(f'Snapshot {RecordType} is too big ({len(Packed)} bytes) - increase AgentShards')
+        return False
+    if len(Packed) > SnapshotWarnSize:
+        logger.warning(f'Snapshot {RecordType} is {len(Packed)} bytes - each rewrite takes {math.ceil(len(Packed)/1024)} write units, consider increasing AgentShards')
+        Metrics.Count('LargeSnapshots')
+
+    if not Store.SaveSnapshot(RecordType, Version, Packed): return None
+
+    Metrics.Count('SnapshotWriteUnits', math.ceil(len(Packed)/1024))
+    return True
+
+def GetSnapshotEntry(Item):
+    #
+    # The parts of an agent record the render function needs.
+    #
+    Entry = {'Value':Item['Value']}
+    for Attribute in ['FullAgentName', 'RoutingProfile', 'StateSince']:
+        if len(Item.get(Attribute, '')) > 0: Entry[Attribute] = Item[Attribute]
+    if len(wallboardstore.GetLastEvent(Item)) > 0: Entry['EventTimestamp'] = wallboardstore.GetLastEvent(Item)
+    if 'ExpiresAt' in Item: Entry['ExpiresAt'] = int(Item['ExpiresAt'])
+
+    return Entry
+
+def SeedAgentSnapshot(Shard):
+    #
+    # The first time we write a shard's snapshot we start from the agent
+    # records that are already stored so that nobody goes missing.
+    #
+    Contents = {}
+    for Partition in ['Data', Shard]:
+        for Item in Store.GetPartition(Partition, AgentsOnly=True):
+            if GetAgentShard(Item['RecordType']) != Shard: continue
+            Contents[Item['RecordType']] = GetSnapshotEntry(Item)
+
+    return Contents
+
+def RecordSnapshot(Username, AgentARN, Entry):
+    global SnapshotChanges,SnapshotARNs
+
+    Shard = GetAgentShard(Username)
+    if Shard not in SnapshotChanges: SnapshotChanges[Shard] = {}
+    SnapshotChanges[Shard][Username] = Entry
+    SnapshotARNs[Username] = AgentARN
+
+def MergeAgentSnapshot(Contents, Changes, Heartbeats):
+    #
+    # Changes are only applied if they are at least as new as what's in the
+    # snapshot, the same rule as for the agent records, so merging the same
+    # change twice (or in a different order) gives the same answer.
+    #
+    for Username in Changes:
+        Old = Contents.get(Username)
+        New = Changes[Username]
+        if Old is None or len(New.get('EventTimestamp', '')) == 0 or Old.get('EventTimestamp', '') <= New['EventTimestamp']:
+            Contents[Username] = New
+
+    for Username in Heartbeats:
+        if Username in Contents and Contents[Username]['Value'] != 'Logout':
+            Contents[Username]['ExpiresAt'] = max(Contents[Username].get('ExpiresAt', 0), Heartbeats[Username])
+
+    Now = int(time.time())
+    for Username in list(Contents.keys()):
+        if Contents[Username].get('ExpiresAt', Now) < Now: del Contents[Username]
+
+def UpdateAgentSnapshots():
+    global SnapshotChanges,SnapshotHeartbeats
+
+    #
+    # As well as the individual agent records we keep one compressed item per
+    # agent shard with every agent in it so that the render function can read
+    # them all at once. Other invocations (one per Kinesis shard) may update
+    # the same snapshot at the same time, which the version check catches.
+    #
+    Failed = []
+    for Shard in set(SnapshotChanges.keys()) | set(SnapshotHeartbeats.keys()):
+        Changes    = SnapshotChanges.get(Shard, {})
+        Heartbeats = SnapshotHeartbeats.get(Shard, {})
+        Saved      = False
+        try:
+            for Attempt in range(0, SnapshotRetries):
+                (Version,Contents) = LoadSnapshot(Shard)
+                if Contents is None: Contents = SeedAgentSnapshot(Shard)
+                MergeAgentSnapshot(Contents, Changes, Heartbeats)
+                Saved = SaveSnapshot(Shard, Version, Contents)
+                if Saved is not None: break
+                Metrics.Count('SnapshotConflicts')
+                logger.info(f'Snapshot {Shard} changed while we were updating it - merging again')
+        except Exception as e:
+            logger.error(f'DDB snapshot error for {Shard}: {e}')
+            Saved = False
+
+        if not Saved: Failed += list(Changes.keys())
 
-def SaveStateToDDB(Username, FullAgentName, AgentARN, State):
-    global Table
+    SnapshotChanges    = {}
+    SnapshotHeartbeats = {}
+    return Failed
+
+def SaveStateToDDB(Username, FullAgentName, AgentARN, State, EventTimestamp='', RoutingProfile=''):
+    global Store,LastState,LastSeen
     
+    #
+    # Events can arrive out of order (retries, multiple shards) so every
+    # event moves the agent's stored LastEventTimestamp on, and an event
+    # older than that is ignored. The record itself is only replaced when the
+    # state (or routing profile) has changed, so that StateSince records when
+    # the agent entered this state - a repeat of the same state just moves
+    # the timestamp on. Batched writes can't carry a condition so these are
+    # single calls.
+    #
     Data = {}
-    Data['Identifier']    = 'Data'
+    Data['Identifier']    = GetAgentShard(Username)
     Data['RecordType']    = Username
     Data['Value']         = State
     Data['AgentARN']      = AgentARN
     Data['FullAgentName'] = FullAgentName
+    if len(RoutingProfile) > 0: Data['RoutingProfile'] = RoutingProfile
+
+    #
+    # Agent records are removed by DynamoDB (using TTL on ExpiresAt) once we
+    # stop hearing from the agent, or soon after they log out.
+    #
+    Now = int(time.time())
+    Data['LastSeen']  = Now
+    Data['ExpiresAt'] = Now+(LogoutExpiry if State == 'Logout' else AgentExpiry)
     
+    if len(EventTimestamp) > 0:
+        Data['LastEventTimestamp'] = EventTimestamp
+        Data['StateSince']         = EventTimestamp
+
+    if len(EventTimestamp) > 0 and AgentARN in LastState:
+        (LastTimestamp,LastValue,LastProfile) = LastState[AgentARN]
+        if LastTimestamp >= EventTimestamp:
+            if Debug: logger.debug(f'Ignoring stale event for {Username} at {EventTimestamp}')
+            Metrics.Count('StaleEvents')
+            return True
+        if LastValue == State and LastProfile == RoutingProfile:
+            try:
+                Touched = Store.TouchAgentState(Data)
+            except Exception as e:
+                logger.error(f'DDB update error: {e}')
+                return False
+            if Touched:
+                Remember(LastState, AgentARN, (EventTimestamp, State, RoutingProfile))
+                Remember(LastSeen, AgentARN, Now)
+                Metrics.Count('StateCacheHits')
+                return True
+            # Someone else has changed the record since - save it in full
+
     try:
-        Table.put_item(TableName=DDBTableName, Item=Data)
+        (Result,OldItem) = Store.SaveAgentState(Data)
     except Exception as e:
         logger.error(f'DDB put error: {e}')
+        return False
+
+    if Result == 'Stale':
+        Remember(LastState, AgentARN, (wallboardstore.GetLastEvent(OldItem), OldItem.get('Value', ''), OldItem.get('RoutingProfile', '')))
+        if Debug: logger.debug(f'Newer state already stored for {Username} - ignoring event at {EventTimestamp}')
+        Metrics.Count('StaleEvents')
+    elif Result == 'Unchanged':
+        Remember(LastState, AgentARN, (EventTimestamp, State, RoutingProfile))
+        Remember(LastSeen, AgentARN, Now)
+        if Debug: logger.debug(f'{Username} is already in state {State} - only the event time was written')
+        Metrics.Count('UnchangedStates')
+
+    #
+    # Pass on what is stored in case an earlier attempt wrote the record but
+    # didn't get as far as the snapshot.
+    #
+    if Result != 'Saved':
+        if 'Value' in OldItem: RecordSnapshot(Username, AgentARN, GetSnapshotEntry(OldItem))
+        return True
+
+    if len(EventTimestamp) > 0: Remember(LastState, AgentARN, (EventTimestamp, State, RoutingProfile))
+
+    Remember(LastSeen, AgentARN, Now)
+    Metrics.Count('StatesWritten')
+    RecordSnapshot(Username, AgentARN, GetSnapshotEntry(Data))
+
+    return True
+
+def GetUsernameFromARN(AgentARN):
+    global Store,AgentCache,UnknownAgents
+
+    Agent = AgentCache.get(AgentARN)
+    if Agent is not None:
+        AgentCache.move_to_end(AgentARN)
+        Metrics.Count('AgentCacheHits')
+        return Agent
+
+    #
+    # An agent we couldn't find is remembered (until the time to look again)
+    # so that their events don't each read the table until their first state
+    # change tells us who they are.
+    #
+    if time.time() < UnknownAgents.get(AgentARN, 0):
+        Metrics.Count('AgentCacheHits')
+        return None
+
+    Metrics.Count('AgentCacheMisses')
+    try:
+        Item = Store.GetAgentARN(AgentARN)
+    except Exception as e:
+        logger.error(f'DDB get error: {e}')
+        return False
+
+    if Item is None:
+        #
+        # A new agent's LOGIN arrives before the first state change that
+        # gives us their username. Agents stored before the mapping items
+        # existed are given one by the MigrateDataShards action.
+        #
+        if Debug: logger.debug(f'No username for {AgentARN} yet')
+        Metrics.Count('UnknownAgents')
+        Remember(UnknownAgents, AgentARN, time.time()+UnknownAgentExpiry)
+        return None
+
+    CacheAgent(AgentARN, Item['Username'], Item.get('FullAgentName', ''))
+    return AgentCache[AgentARN]
+
+def SaveStateUsingARN(AgentARN, State, EventTimestamp=''):
+    Agent = GetUsernameFromARN(AgentARN)
+    if Agent is False: return False
+    if Agent is None: return True # Nothing we can do for an agent we've never seen
+
+    if Debug: logger.debug(f'AgentARN: {AgentARN} = {Agent[0]}')
+    return SaveStateToDDB(Agent[0], Agent[1], AgentARN, State, EventTimestamp)
+
+def GetAgentState(AgentEvent):
+    State = AgentEvent['CurrentAgentSnapshot']['AgentStatus']['Name']
+
+    if State == 'Available':
+        Contacts = AgentEvent['CurrentAgentSnapshot']['Contacts']
+
+        if Contacts:
+            for Contact in Contacts:
+                ContactState = Contact['State']
+                if ContactState == 'CONNECTED':
+                    State = 'On Contact'
+                elif ContactState == 'CONNECTING':
+                    State = 'On Contact'
+                elif ContactState == 'PENDING':
+                    State = 'On Contact'
+                elif ContactState == 'CONNECTED_ONHOLD':
+                    State = 'On Hold'
+                elif ContactState == 'MISSED':
+                    State = 'Missed'
+                elif ContactState == 'PAUSED':
+                    State = 'Paused'
+                elif ContactState == 'REJECTED':
+                    State = 'Rejected'
+                elif ContactState == 'ENDED':
+                    State = 'After Call Work'
+                elif ContactState == 'ERROR':
+                    State = 'Error'
+                else:
+                    State = 'Unknown'
+        else:
+            State = 'Available'
+
+    return State
+
+def SaveHeartbeat(Update):
+    global Store,LastSeen,SnapshotSeen,SnapshotHeartbeats
+
+    #
+    # Heartbeats tell us the agent is still around so we push back when their
+    # record expires. We don't need to do that on every heartbeat - once per
+    # interval is plenty.
+    #
+    AgentARN = Update['AgentARN']
+    Now      = int(time.time())
+    if Now < LastSeen.get(AgentARN, 0)+HeartbeatInterval:
+        Metrics.Count('HeartbeatsSkipped')
+        return
+
+    Username = Update.get('Username', '')
+    if len(Username) == 0:
+        Agent = GetUsernameFromARN(AgentARN)
+        if not Agent: return
+        Username = Agent[0]
 
-def SaveStateUsingARN(AgentARN, State):
-    global Table
-    
     try:
-        # Scan the table looking for the agent ARN
-        Expression = Attr('AgentARN').eq(AgentARN)
-        Response = Table.scan(FilterExpression=Expression)
+        Store.RefreshAgent(GetAgentShard(Username), Username, Now, Now+AgentExpiry) # Not refreshed if they're gone or logged out
     except Exception as e:
-        logger.error(f'DDB scan error: {e}')
+        logger.error(f'DDB update error: {e}')
         return
-    
-    if len(Response['Items']) > 0:
-        logger.info(f'AgentARN: {AgentARN} = {Response["Items"][0]["RecordType"]}')
-        SaveStateToDDB(Response['Items'][0]['RecordType'], Response['Items'][0]['FullAgentName'], AgentARN, State)
-    
+
+    Remember(LastSeen, AgentARN, Now)
+    Metrics.Count('HeartbeatsWritten')
+
+    #
+    # Every heartbeat that goes into the snapshot means rewriting the whole
+    # shard, and an agent's expiry there is a day away, so it is only pushed
+    # back every SnapshotRefresh seconds rather than with every record.
+    #
+    if Now < SnapshotSeen.get(AgentARN, 0)+SnapshotRefresh: return
+    Remember(SnapshotSeen, AgentARN, Now)
+    Shard = GetAgentShard(Username)
+    if Shard not in SnapshotHeartbeats: SnapshotHeartbeats[Shard] = {}
+    SnapshotHeartbeats[Shard][Username] = Now+AgentExpiry
+
+def ParseAgentEvent(RawPayload):
+    #
+    # Turn a Kinesis record into the details we need to store. Anything we
+    # can't make sense of is returned as None - retrying it won't help.
+    #
+    try:
+        AgentEvent = json.loads(base64.b64decode(RawPayload['kinesis']['data']))
+        Update = {}
+        Update['EventType']      = AgentEvent['EventType']
+        Update['AgentARN']       = AgentEvent['AgentARN']
+        Update['EventTimestamp'] = AgentEvent.get('EventTimestamp', '')
+        if Debug: logger.debug(f'Event type: {Update["EventType"]} AgentARN: {Update["AgentARN"]}')
+
+        if Update['EventType'] == 'STATE_CHANGE':
+            Update['State']     = GetAgentState(AgentEvent)
+            Update['AgentName'] = f'{AgentEvent["CurrentAgentSnapshot"]["Configuration"]["FirstName"]} {AgentEvent["CurrentAgentSnapshot"]["Configuration"]["LastName"]}'
+            Update['Username']  = AgentEvent['CurrentAgentSnapshot']['Configuration']['Username']
+            Update['RoutingProfile'] = AgentEvent['CurrentAgentSnapshot']['Configuration'].get('RoutingProfile', {}).get('Name', '')
+        elif Update['EventType'] == 'HEART_BEAT':
+            Update['Username'] = (AgentEvent.get('CurrentAgentSnapshot') or {}).get('Configuration', {}).get('Username', '')
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f'Malformed agent event {RawPayload.get("kinesis", {}).get("sequenceNumber")}: {e}')
+        return None
+
+    return Update
+
+def SaveAgentEvent(Update, Writer):
+    EventType      = Update['EventType']
+    AgentARN       = Update['AgentARN']
+    EventTimestamp = Update['EventTimestamp']
+
+    if EventType == 'LOGIN': # We don't really need to do this but just in case...
+        return SaveStateUsingARN(AgentARN, 'Login', EventTimestamp)
+    if EventType == 'LOGOUT':
+        return SaveStateUsingARN(AgentARN, 'Logout', EventTimestamp)
+
+    State     = Update['State']
+    AgentName = Update['AgentName']
+    Username  = Update['Username']
+
+    if Debug: logger.debug(f'Agent: {AgentName}+ ({Username}) State: {State}')
+    if len(AgentName) == 1: logger.warning('Expected first and last name of agent but did not get it in the event.')
+
+    SaveAgentARN(Username, AgentName, AgentARN, Writer)
+    return SaveStateToDDB(Username, AgentName, AgentARN, State, EventTimestamp, Update['RoutingProfile'])
+
 def lambda_handler(event, context):
+    global SnapshotARNs
+
+    if event.get('Action') == 'MigrateDataShards':
+        MigrateDataShards()
+        BackfillAgentARNs()
+        return
+
+    Profiler     = Metrics.StartProfile()
+    SnapshotARNs = {} # Only needed for this batch's snapshot failures
+
+    #
+    # An agent can change state several times within one batch of records and
+    # only the last state matters. Reduce the batch to the newest event for
+    # each agent (by event timestamp) so stale events are dropped before we
+    # write anything. The ARN mapping items are written in batches.
+    #
+    # We keep the sequence numbers of every record that went into each agent's
+    # final state so that if the write fails we can tell Kinesis to retry from
+    # the first of them rather than retrying the whole batch.
+    #
+    FinalEvents = {}
+    Heartbeats  = {}
+    Sequences   = {}
+    Started     = time.perf_counter()
     for RawPayload in event['Records']:
-        AgentEvent = json.loads(base64.b64decode(RawPayload['kinesis']['data']))
-        EventType = AgentEvent['EventType']
-        AgentARN = AgentEvent['AgentARN']
-        logger.info('Event type: {EventType} AgentARN: {AgentARN}')
+        Update = ParseAgentEvent(RawPayload)
+        if Update is None: continue
+
+        EventType = Update['EventType']
+        AgentARN  = Update['AgentARN']
         
-        if EventType == 'LOGIN': # We don't really need to do this but just in case...
-            SaveStateUsingARN(AgentARN, 'Login')   
+        if EventType == 'HEART_BEAT':
+            Heartbeats[AgentARN] = Update
             continue
-        if EventType == 'LOGOUT':
-            SaveStateUsingARN(AgentARN, 'Logout')   
+        if EventType not in ['LOGIN', 'LOGOUT', 'STATE_CHANGE']:
+            logger.warning(f'Unknown event type: {EventType}')
             continue
-        if EventType == 'STATE_CHANGE':
-            State     = AgentEvent['CurrentAgentSnapshot']['AgentStatus']['Name']
-            AgentName = f'{AgentEvent["CurrentAgentSnapshot"]["Configuration"]["FirstName"]} {AgentEvent["CurrentAgentSnapshot"]["Configuration"]["LastName"]}'
-            Username  = AgentEvent['CurrentAgentSnapshot']['Configuration']['Username']
-
-            if State == 'Available':
-                Contacts = AgentEvent['CurrentAgentSnapshot']['Contacts']
-
-                if Contacts:
-                    for Contact in Contacts:
-                        ContactState = Contact['State']
-                        if ContactState == 'CONNECTED':
-                            State = 'On Contact'
-                        elif ContactState == 'CONNECTING':
-                            State = 'On Contact'
-                        elif ContactState == 'PENDING':
-                            State = 'On Contact'
-                        elif ContactState == 'CONNECTED_ONHOLD':
-                            State = 'On Hold'
-                        elif ContactState == 'MISSED':
-                            State = 'Missed'
-                        elif ContactState == 'PAUSED':
-                            State = 'Paused'
-                        elif ContactState == 'REJECTED':
-                            State = 'Rejected'
-                        elif ContactState == 'ENDED':
-                            State = 'After Call Work'
-                        elif ContactState == 'ERROR':
-                            State = 'Error'
-                        else:
-                            State = 'Unknown'
-                else:
-                    State = 'Available'
 
-            logger.info(f'Agent: {AgentName}+ ({Username}) State: {State}')
-            if len(AgentName) == 1: logger.warning('Expected first and last name of agent but did not get it in the event.')
+        if AgentARN not in Sequences: Sequences[AgentARN] = []
+        Sequences[AgentARN].append(RawPayload['kinesis']['sequenceNumber'])
 
-            SaveStateToDDB(Username, AgentName, AgentARN, State)
+        if AgentARN in FinalEvents and FinalEvents[AgentARN]['EventTimestamp'] > Update['EventTimestamp']:
+            if Debug: logger.debug(f'Ignoring older {EventType} event for {AgentARN}')
             continue
-        if EventType == 'HEART_BEAT':
-            # Not sure what to do here yet
-            continue
-        
-        logger.warning(f'Unknown event type: {EventType}')
\ No newline at end of file
+        FinalEvents[AgentARN] = Update
+
+    Metrics.AddTime('Parse', Started)
+    Metrics.Count('Records', len(event['Records']))
+    Metrics.Count('AgentUpdates', len(FinalEvents))
+    logger.info(f'{len(event["Records"])} records reduced to {len(FinalEvents)} agent updates')
+
+    Failures = []
+    try:
+        with Metrics.TimePhase('Write'), Store.Writer() as Writer:
+            for AgentARN in FinalEvents:
+                if not SaveAgentEvent(FinalEvents[AgentARN], Writer):
+                    Failures.append({'itemIdentifier':Sequences[AgentARN][0]})
+
+            #
+            # A state change that was written has already pushed back when
+            # the agent expires (and set LastSeen, so SaveHeartbeat skips
+            # it) - one that wasn't needed writing hasn't.
+            #
+            for AgentARN in Heartbeats:
+                SaveHeartbeat(Heartbeats[AgentARN])
+        if Writer.Failed > 0: logger.warning(f'{Writer.Failed} agent ARN mappings could not be written')
+    except Exception as e:
+        # Only the ARN mappings are batched - they are rebuilt when needed
+        logger.error(f'DDB batch write error: {e}')
+
+    #
+    # If a snapshot couldn't be written the agents in it are retried - their
+    # records are already stored so the retry just passes them on again.
+    #
+    with Metrics.TimePhase('Snapshot'):
+        SnapshotFailures = UpdateAgentSnapshots()
+    for Username in SnapshotFailures:
+        AgentARN = SnapshotARNs.get(Username)
+        LastState.pop(AgentARN, None)
+        if AgentARN in Sequences and {'itemIdentifier':Sequences[AgentARN][0]} not in Failures:
+            Failures.append({'itemIdentifier':Sequences[AgentARN][0]})
+
+    if len(Failures) > 0: logger.warning(f'{len(Failures)} agent updates failed and will be retried')
+    Metrics.Count('Failures', len(Failures))
+    Metrics.StopProfile(Profiler, f'{len(event["Records"])} records')
+    Metrics.Emit()
+
+    return {'batchItemFailures':Failures}
@@ -18,7 +18,6 @@
 #
 
 import boto3
-from boto3.dynamodb.conditions import Key,Attr
 import os
 import time
 import datetime
@@ -26,6 +25,21 @@ import logging
 import string
 import re
 import json
+import zlib
+import struct
+import base64
+import bisect
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import numpy # Optional - checks all of a wallboard's thresholds at once when there are lots of them
+except ImportError:
+    numpy = None
+try:
+    import msgpack # Optional - a faster MessagePack encoder than RenderMessagePack's own
+except ImportError:
+    msgpack = None
 
 #
 # Things to configure
@@ -33,10 +47,30 @@ import json
 DDBTableName    = os.environ.get('WallboardTable', 'ConnectWallboard')
 ConfigTimeout   = int(os.environ.get('ConfigTimeout', 300)) # How long we wait before grabbing the config from the database
 RealtimeTimeout = 5 # How long before in between polling the real-time API
-Table           = boto3.resource('dynamodb').Table(DDBTableName)
+TrendTimeout    = 60 # How long we keep trend data before reading it again - it only changes every five minutes
+TrendMinutes    = 5 # Minutes between each trend sample
+DataShards      = int(os.environ.get('DataShards', 4)) # Number of partitions metrics are spread over - must match the other functions
+AgentShards     = int(os.environ.get('AgentShards', 4)) # Number of partitions agents are spread over - must match the other functions
+MaxReadThreads  = 10 # Most partitions we read at the same time
+CompiledFormat  = 1 # Version of the compiled wallboard layout we understand
+ProfileRate     = float(os.environ.get('ProfileRate', 0)) # Share of invocations profiled with cProfile (0 to 1) - see README.md
+ProfileTop      = int(os.environ.get('ProfileTop', 25)) # Functions listed in the log for each profile
+UseSnapshot     = os.environ.get('UseSnapshot', 'true').lower() == 'true' # Read the data snapshots rather than every item
+RealtimeInRender = os.environ.get('RealtimeInRender', 'false').lower() == 'true' # Call the real-time API here rather than reading what the poller stored
+VectorThresholds = int(os.environ.get('VectorThresholds', 2000)) # Fewest thresholds on a wallboard before we use NumPy (if it is installed)
+LogLevel        = os.environ.get('LogLevel', 'INFO').upper() # DEBUG also logs every value, calculation and lookup
+MetricNamespace = os.environ.get('MetricNamespace', 'ConnectWallboard') # CloudWatch namespace for the per-request metrics - empty for none
+FunctionName    = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'render-wallboard')
+WallboardStore = os.environ.get('WallboardStore', 'dynamodb') # dynamodb, memory or sqlite:<file> - see storage/python/wallboardstore.py
+
+import wallboardstore # From the storage layer
+import wallboardmetrics # From the storage layer
+Store   = wallboardstore.OpenStore(WallboardStore, DDBTableName)
+Metrics = wallboardmetrics.Metrics(FunctionName, MetricNamespace, ProfileRate, ProfileTop)
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LogLevel)
+Debug = logger.isEnabledFor(logging.DEBUG) # Checked before building per-item messages so they cost nothing otherwise
 
 #
 # Sane defaults for new wallboards in case specific settings aren't given
@@ -57,13 +91,21 @@ LastRealtimeRun = 0
 Settings        = {}
 Cells           = {}
 Thresholds      = {}
+ThresholdTables = {}
+ThresholdLevels = {}
+Calculated      = set()
 AgentStates     = {}
 Data            = {}
 Calculations    = {}
+Formulas        = {}
 DataSources     = {}
+TrendSources    = {}
 NextAgent       = 0
 SortedAgentList = []
+AgentsByState   = {}
 FullAgentNames  = {}
+StateSince      = {}
+Trends          = {}
 
 #
 # List of valid metrics we can retrieve
@@ -87,8 +129,15 @@ MetricUnitMapping = {
 #
 FunctionList = ['round', 'int', 'float', 'min', 'max', 'sum', 'ord', 'pow']
 
+#
+# Threshold levels in the order EvaluateThresholds numbers them
+#
+ThresholdNames = ['Normal', 'Warning', 'Alert']
+
+if WallboardStore == 'dynamodb': Metrics.WatchClient(Store.Client)
+
 def GetConfiguration(WallboardName):
-    global LastRun,ConfigTimeout,DDBTableName,Table,Settings,Cells,Thresholds,AgentStates,Calculations,DataSources
+    global LastRun,ConfigTimeout,DDBTableName,Store,Settings,Cells,Thresholds,AgentStates,Calculations,Formulas,DataSources,TrendSources
     
     #
     # We only want to retrieve the configuration for the wallboard if we haven't
@@ -98,18 +147,27 @@ def GetConfiguration(WallboardName):
     if WallboardName not in Settings:
         LastRun = time.time()
         GetConfig = True
-        logger.info(f'No config loaded for {WallboardName} retrieving')
+        if Debug: logger.debug(f'No config loaded for {WallboardName} retrieving')
     else:
-        logger.info(f'Last run at {LastRun}, timeout is {ConfigTimeout}, now is {time.time()}')
+        if Debug: logger.debug(f'Last run at {LastRun}, timeout is {ConfigTimeout}, now is {time.time()}')
     
         if time.time() > LastRun+ConfigTimeout:
             LastRun = time.time()
             GetConfig = True
-            logger.info('  Wallboard config needs refreshing')
+            if Debug: logger.debug('  Wallboard config needs refreshing')
         else:
-            logger.info('  Within timeout period - no config refresh')
+            if Debug: logger.debug('  Within timeout period - no config refresh')
     
-    if not GetConfig: return True
+    if not GetConfig:
+        Metrics.Count('ConfigCacheHits')
+        return True
+
+    #
+    # The import utility stores a compiled copy of the whole wallboard in a
+    # single item. If that isn't there (the wallboard was imported with an
+    # older version of the utility) we build it up from the separate records.
+    #
+    if LoadCompiledConfiguration(WallboardName): return True
 
     #
     # All relevant wallboard information (how it is to be formatted, threshold
@@ -117,31 +175,24 @@ def GetConfiguration(WallboardName):
     # wallboard.
     #
     try:
-        Response = Table.query(KeyConditionExpression=Key('Identifier').eq(WallboardName))
-        ConfigList = Response
+        ConfigList = Store.GetWallboard(WallboardName)
     except Exception as e:
         logger.error(f'DynamoDB error: {e}')
         return False
 
-    if len(Response['Items']) == 0:
+    if len(ConfigList) == 0:
         logger.error(f'Did not get any configuration for wallboard {WallboardName}')
         return False
 
-    while 'LastEvaluatedKey' in Response:
-        try:
-            Response = Table.query(ExclusiveStartKey=Response['LastEvaluatedKey'])
-            ConfigList.update(Response)
-        except Exception as e:
-            logger.error(f'DynamoDB error: {e}')
-            break
-
     LocalSettings     = DefaultSettings.copy()
     LocalThresholds   = {}
     LocalCells        = {}
     LocalAgentStates  = {}
     LocalCalculations = {}
+    LocalFormulas     = {}
     LocalDataSources  = {}
-    for Item in ConfigList['Items']:
+    LocalTrendSources = set()
+    for Item in ConfigList:
         if Item['RecordType'] == 'Settings':
             for Config in Item:
                 LocalSettings[Config] = Item[Config]
@@ -150,6 +201,7 @@ def GetConfiguration(WallboardName):
                 logger.warning(f'Formula not set for {Item["RecordType"]} in wallboard {WallboardName} - ignored')
                 continue
             LocalCalculations[Item['Name']] = Item['Formula']
+            LocalFormulas[Item['Name']]     = SplitFormula(Item['Formula'])
         elif Item['RecordType'][:4] == 'Cell':
             if 'Address' not in Item:
                 logger.warning(f'Cell address not set for {Item["RecordType"]} in wallboard {WallboardName} - ignored')
@@ -171,7 +223,9 @@ def GetConfiguration(WallboardName):
                 continue
             
             Metric = Item['Reference'].split(':')[2]
-            if Metric not in MetricUnitMapping: continue # Ignore non real-time metrics
+            if Metric not in MetricUnitMapping: # Historical metrics are the only ones with trends
+                LocalTrendSources.add(Item['Name'])
+                continue
             LocalDataSources[Item['Name']] = Item['Reference']
 
     Settings[WallboardName]     = LocalSettings
@@ -179,53 +233,322 @@ def GetConfiguration(WallboardName):
     Thresholds[WallboardName]   = LocalThresholds
     AgentStates[WallboardName]  = LocalAgentStates
     Calculations[WallboardName] = LocalCalculations
+    Formulas[WallboardName]     = LocalFormulas
     DataSources[WallboardName]  = LocalDataSources
+    TrendSources[WallboardName] = LocalTrendSources
+    CompileThresholds(WallboardName)
     
     return True
 
+def LoadCompiledConfiguration(WallboardName):
+    global Settings,Cells,Thresholds,AgentStates,Calculations,Formulas,DataSources,TrendSources
+
+    try:
+        Item = Store.GetItem(WallboardName, 'Compiled')
+    except Exception as e:
+        logger.error(f'DynamoDB error: {e}')
+        return False
+
+    if Item is None: return False
+
+    if int(Item.get('Format', 0)) != CompiledFormat:
+        logger.warning(f'Compiled configuration for {WallboardName} is in an unknown format - reading records instead')
+        return False
+
+    try:
+        Compiled = json.loads(zlib.decompress(bytes(Item['Artifact'])))
+    except Exception as e:
+        logger.warning(f'Could not read compiled configuration for {WallboardName}: {e}')
+        return False
+
+    Settings[WallboardName]     = Compiled['Settings']
+    Cells[WallboardName]        = Compiled['Cells']
+    Thresholds[WallboardName]   = Compiled['Thresholds']
+    AgentStates[WallboardName]  = Compiled['AgentStates']
+    Calculations[WallboardName] = Compiled['Calculations']
+    Formulas[WallboardName]     = Compiled['Formulas']
+
+    #
+    # The compiled wallboard has every data source - we only want the ones we
+    # get from the real-time API. The rest are historical and have trends.
+    #
+    LocalDataSources  = {}
+    LocalTrendSources = set()
+    for Name in Compiled['DataSources']:
+        Metric = Compiled['DataSources'][Name].split(':')[2]
+        if Metric not in MetricUnitMapping:
+            LocalTrendSources.add(Name)
+            continue
+        LocalDataSources[Name] = Compiled['DataSources'][Name]
+    DataSources[WallboardName]  = LocalDataSources
+    TrendSources[WallboardName] = LocalTrendSources
+    CompileThresholds(WallboardName)
+
+    logger.info(f'Loaded compiled configuration for {WallboardName}')
+    return True
+
+def CompileThresholds(WallboardName):
+    global ThresholdTables
+
+    #
+    # Thresholds are turned into a table of numeric bounds when the
+    # configuration is loaded so that each request checks them all in one go
+    # rather than converting the same settings for every cell. A bound that
+    # isn't set can never be crossed. Thresholds on the same data share a
+    # single copy of the value.
+    #
+    LocalSettings = Settings[WallboardName]
+    Limits = {'Names':[], 'References':[], 'Rows':[], 'Colours':['', LocalSettings['WarningBackgroundColour'], LocalSettings['AlertBackgroundColour']]}
+    Positions = {}
+    for Name in Thresholds[WallboardName]:
+        Threshold = Thresholds[WallboardName][Name]
+        if 'Reference' not in Threshold:
+            logger.warning(f'No data reference present in threshold {Name} for wallboard {WallboardName}')
+            continue
+
+        try:
+            Bounds = [float(Threshold.get(Bound, Default)) for (Bound,Default) in [('WarnBelow', '-inf'), ('AlertBelow', '-inf'), ('WarnAbove', 'inf'), ('AlertAbove', 'inf')]]
+        except ValueError:
+            logger.warning(f'Threshold {Name} for wallboard {WallboardName} has a limit that is not a number - ignored')
+            continue
+
+        if Threshold['Reference'] not in Positions:
+            Positions[Threshold['Reference']] = len(Limits['References'])
+            Limits['References'].append(Threshold['Reference'])
+        Limits['Names'].append(Name)
+        Limits['Rows'].append([Positions[Threshold['Reference']]]+Bounds)
+
+    #
+    # With enough thresholds the comparisons are done as arrays instead.
+    #
+    if numpy is not None and len(Limits['Rows']) >= VectorThresholds:
+        Columns = numpy.array(Limits['Rows'], dtype=float).T
+        Limits['Positions'] = Columns[0].astype(int)
+        Limits['Bounds']    = Columns[1:]
+
+    ThresholdTables[WallboardName] = Limits
+
+def GetDataPartitions():
+    #
+    # Data is spread over several partitions so that no single partition
+    # takes every read and write - metrics in Data#0..n and agents in
+    # Agent#0..n. The original single "Data" partition is still read so that
+    # tables that haven't been migrated keep working.
+    #
+    Partitions = ['Data']
+    Partitions += [f'Data#{Shard}' for Shard in range(0, DataShards)]
+    Partitions += [f'Agent#{Shard}' for Shard in range(0, AgentShards)]
+
+    return Partitions
+
+def GetAgentShard(Username):
+    #
+    # Which agent partition a username is stored in - must match the agent
+    # event function.
+    #
+    return f'Agent#{zlib.crc32(Username.encode()) % AgentShards}'
+
+def QueryPartition(Partition):
+    #
+    # This runs in a worker thread - the stores are safe to share between
+    # threads.
+    #
+    try:
+        return Store.GetPartition(Partition)
+    except Exception as e:
+        logger.error(f'DynamoDB error reading {Partition}: {e}')
+
+    return []
+
+def GetSnapshot():
+    global Data,SortedAgentList,FullAgentNames,StateSince
+
+    #
+    # The other functions keep a compressed copy of everything they store in
+    # the "Snapshot" partition - one item each for historical and real-time
+    # metrics and one for each agent shard - so we can read it all in one
+    # call. If there aren't any the table hasn't been written by a version
+    # that keeps them.
+    #
+    Keys  = [('Snapshot', 'Data'), ('Snapshot', 'Realtime')]
+    Keys += [('Snapshot', f'Agent#{Shard}') for Shard in range(0, AgentShards)]
+    try:
+        Items = Store.GetItems(Keys, True)
+    except Exception as e:
+        logger.error(f'DynamoDB error reading snapshot: {e}')
+        return False
+
+    if len(Items) == 0: return False
+
+    Snapshots = {}
+    for Item in Items:
+        try:
+            Snapshots[Item['RecordType']] = json.loads(zlib.decompress(bytes(Item['Snapshot'])))
+        except Exception as e:
+            logger.error(f'Could not read snapshot {Item["RecordType"]}: {e}')
+            return False
+
+    #
+    # A snapshot that hasn't been written yet - an agent shard where nobody
+    # has changed state since the upgrade, say - is read from the records
+    # instead so that nothing is left off the wallboard. The real-time
+    # snapshot is only expected when the poller is storing real-time data.
+    #
+    Expected       = ['Data'] if RealtimeInRender else ['Data', 'Realtime']
+    MissingMetrics = [RecordType for RecordType in Expected if RecordType not in Snapshots]
+    MissingShards  = [f'Agent#{Shard}' for Shard in range(0, AgentShards) if f'Agent#{Shard}' not in Snapshots]
+
+    Partitions = []
+    if len(MissingMetrics) > 0:
+        Partitions += [Partition for Partition in GetDataPartitions() if not Partition.startswith('Agent#')]
+    elif len(MissingShards) > 0:
+        Partitions.append('Data') # Agents stored before the partitions were split
+    Partitions += MissingShards
+
+    Results = {}
+    if len(Partitions) > 0:
+        Metrics.Count('SnapshotsMissing', len(MissingMetrics)+len(MissingShards))
+        with ThreadPoolExecutor(max_workers=min(len(Partitions), MaxReadThreads)) as Executor:
+            Results = dict(zip(Partitions, Executor.map(QueryPartition, Partitions)))
+
+    #
+    # Metrics read from the records come first, then the historical snapshot
+    # and then the real-time one, which is always the newer of the two for
+    # anything they both hold.
+    #
+    if len(MissingMetrics) > 0:
+        for Partition in Partitions:
+            if Partition.startswith('Agent#'): continue
+            for Item in Results[Partition]:
+                if 'AgentARN' not in Item: Data[Item['RecordType']] = str(Item['Value'])
+
+    for RecordType in ['Data', 'Realtime']:
+        Contents = Snapshots.get(RecordType, {})
+        for Name in Contents:
+            Data[Name] = str(Contents[Name])
+
+    Agents = []
+    Now    = time.time()
+    for Shard in range(0, AgentShards):
+        RecordType = f'Agent#{Shard}'
+        if RecordType in Snapshots:
+            Contents = Snapshots[RecordType]
+        else:
+            Contents = {}
+            for Partition in ['Data', RecordType]:
+                for Item in Results[Partition]:
+                    if 'AgentARN' in Item and GetAgentShard(Item['RecordType']) == RecordType: Contents[Item['RecordType']] = Item
+
+        for AgentName in Contents:
+            Agent = Contents[AgentName]
+            if Agent.get('ExpiresAt', Now) < Now: continue
+
+            Data[AgentName] = Agent['Value']
+            SortedAgentList.append(AgentName)
+            if 'FullAgentName' in Agent: FullAgentNames[AgentName] = Agent['FullAgentName']
+            if 'StateSince'    in Agent: StateSince[AgentName]     = Agent['StateSince']
+            Agents.append(Agent)
+
+    CountAgents(Agents)
+    SortedAgentList.sort()
+    BuildRoster()
+    return True
+
 def GetData():
-    global Data,NextAgent,SortedAgentList,FullAgentNames
+    global Data,NextAgent,SortedAgentList,AgentsByState,FullAgentNames,StateSince
     
     SortedAgentList = []
+    AgentsByState   = {}
     NextAgent       = 0
 
+    if UseSnapshot and GetSnapshot():
+        Metrics.Count('SnapshotReads')
+        return
+    Metrics.Count('PartitionReads')
+
     #
     # All data retrieved from other sources is stored in the DDB table with
-    # the primary partition key of "Data" and a primary sort key of the name
-    # of the value that has been stored.
+    # a primary partition key of "Data#n" (or "Agent#n" for agents) and a
+    # primary sort key of the name of the value that has been stored.
     # We could get back numerical data (stored as a string) or agent state
-    # details.
+    # details. All of the partitions are read at the same time.
     #
-    try:
-        Response = Table.query(KeyConditionExpression=Key('Identifier').eq('Data'))
-        AllData = Response
-    except Exception as e:
-        logger.error(f'DynamoDB error: {e}')
-        return
-    
-    if len(Response['Items']) == 0:
+    Partitions = GetDataPartitions()
+    with ThreadPoolExecutor(max_workers=min(len(Partitions), MaxReadThreads)) as Executor:
+        Results = list(Executor.map(QueryPartition, Partitions))
+
+    #
+    # Results come back in partition order so anything that has been moved
+    # out of the original "Data" partition replaces the older copy.
+    #
+    AllItems = {}
+    Now      = time.time()
+    for Items in Results:
+        for Item in Items:
+            AllItems[Item['RecordType']] = Item
+
+    #
+    # DynamoDB can take a while to remove expired agents so skip them here.
+    #
+    for RecordType in list(AllItems.keys()):
+        if 'ExpiresAt' in AllItems[RecordType] and AllItems[RecordType]['ExpiresAt'] < Now:
+            del AllItems[RecordType]
+
+    if len(AllItems) == 0:
         logger.error('Did not get any data from DynamoDB')
         return
 
-    while 'LastEvaluatedKey' in Response:
-        try:
-            Response = Table.query(ExclusiveStartKey=Response['LastEvaluatedKey'])
-            AllData.update(Response)
-        except Exception as e:
-            logger.error(f'DynamoDB error: {e}')
-            break
-
-    for Item in AllData['Items']:
-        Data[Item['RecordType']] = Item['Value']
+    for Item in AllItems.values():
+        Data[Item['RecordType']] = str(Item['Value'])
         if 'AgentARN' in Item:
             SortedAgentList.append(Item['RecordType'])
             if 'FullAgentName' in Item:
                 FullAgentNames[Item['RecordType']] = Item['FullAgentName']
-        
+            if 'StateSince' in Item:
+                StateSince[Item['RecordType']] = Item['StateSince']
+
+    CountAgents([Item for Item in AllItems.values() if 'AgentARN' in Item])
+
     #
     # We want the agents in alphabetical order
     #
     SortedAgentList.sort()
+    BuildRoster()
+
+def CountAgents(Agents):
+    global Data
+
+    #
+    # The =agentcount: values are worked out from the agents themselves
+    # rather than stored separately so that they always agree with the
+    # agents on the wallboard. Counts we worked out last time are set to 0
+    # in case every agent has left that state.
+    #
+    Counts = {}
+    for Agent in Agents:
+        Counts[f'=agentcount:{Agent["Value"]}'] = Counts.get(f'=agentcount:{Agent["Value"]}', 0)+1
+        if len(Agent.get('RoutingProfile', '')) > 0:
+            Counter = f'=agentcount:{Agent["Value"]}:{Agent["RoutingProfile"]}'
+            Counts[Counter] = Counts.get(Counter, 0)+1
+
+    for Name in list(Data.keys()):
+        if Name.startswith('=agentcount:'): Data[Name] = '0'
+    for Counter in Counts:
+        Data[Counter] = str(Counts[Counter])
+
+def BuildRoster():
+    global AgentsByState
+
+    #
+    # The agents in each state, in the same alphabetical order as
+    # SortedAgentList, so that a JSON request for some states only looks at
+    # the agents in them.
+    #
+    AgentsByState = {}
+    for AgentName in SortedAgentList:
+        State = Data[AgentName]
+        if State not in AgentsByState: AgentsByState[State] = []
+        AgentsByState[State].append(AgentName)
     
 def StoreMetric(ConnectARN, QueueARN, MetricName, Value):
     global DataSources,Data
@@ -236,7 +559,7 @@ def StoreMetric(ConnectARN, QueueARN, MetricName, Value):
         for Source in DataSources[Wallboard]:
             if DataSources[Wallboard][Source] == SourceString:
                 Data[Source] = str(int(Value))
-                logger.info(f'Storing {Data[Source]} in {Source}')
+                if Debug: logger.debug(f'Storing {Data[Source]} in {Source}')
                 return
 
     logger.warning(f'Could not find {SourceString} in DataSources')
@@ -247,12 +570,14 @@ def GetRealtimeData():
     #
     # We only want to poll the real-time API every so often.
     #
-    logger.info(f'Last real-time poll at {LastRealtimeRun}, timeout is {RealtimeTimeout}, now is {time.time()}')
+    if Debug: logger.debug(f'Last real-time poll at {LastRealtimeRun}, timeout is {RealtimeTimeout}, now is {time.time()}')
     
-    if time.time() < LastRealtimeRun+RealtimeTimeout: return
+    if time.time() < LastRealtimeRun+RealtimeTimeout:
+        Metrics.Count('RealtimeCacheHits')
+        return
     LastRealtimeRun = time.time()
 
-    Connect = boto3.client('connect')
+    Connect = Metrics.WatchClient(boto3.client('connect'))
     
     #
     # Even though data sources are defined per wallboard we will always retrieve
@@ -275,12 +600,13 @@ def GetRealtimeData():
     # Now call the API for each Connect instance we're interested in.
     #
     for Instance in ConnectList:
-        logger.info(f'Retrieving real-time data from {Instance}')
+        if Debug: logger.debug(f'Retrieving real-time data from {Instance}')
         
         MetricList = []
         for Queue in ConnectList[Instance]:
             MetricList += ConnectList[Instance][Queue]
 
+        Metrics.Count('ConnectCalls')
         try:
             Response = Connect.get_current_metric_data(
                            InstanceId=Instance,
@@ -300,16 +626,113 @@ def GetRealtimeData():
                 MetricValue = Metric['Value']
                 StoreMetric(Instance, QueueARN, MetricName, MetricValue)
 
+def DecodeSamples(Packed):
+    #
+    # Trend samples are written by the historical metrics function as zigzag
+    # encoded, variable length differences from the previous sample.
+    #
+    Values   = []
+    Previous = 0
+    Delta    = 0
+    Shift    = 0
+    for Byte in Packed:
+        Delta |= (Byte & 0x7f) << Shift
+        Shift += 7
+        if Byte & 0x80: continue
+
+        Previous += (Delta >> 1) ^ -(Delta & 1)
+        Values.append(Previous)
+        Delta = 0
+        Shift = 0
+
+    return Values
+
+def GetTrendReferences(WallboardName, Marked=False):
+    #
+    # The historical data sources on a wallboard that have trends - only the
+    # cells that show a sparkline (Marked) for HTML, or every cell for JSON.
+    #
+    References = []
+    for Cell in Cells[WallboardName].values():
+        if Marked and str(Cell.get('Trend', '')).lower() != 'true': continue
+        if Cell.get('Reference') in TrendSources[WallboardName]: References.append(Cell['Reference'])
+
+    return References
+
+def LoadTrends(References):
+    global Trends
+
+    #
+    # Today's samples for a data source are held in a single item so one read
+    # gets the whole series, and every trend a request needs is read in one
+    # call. We hang on to them for a little while as they only change every
+    # five minutes.
+    #
+    Day    = datetime.datetime.now().date().isoformat()
+    Now    = time.time()
+    Wanted = {}
+    for Reference in dict.fromkeys(References):
+        if Reference in Trends and Trends[Reference]['Day'] == Day and Now < Trends[Reference]['Loaded']+TrendTimeout:
+            Metrics.Count('TrendCacheHits')
+            continue
+        Wanted[f'{Reference}#{Day}'] = Reference
+        Trends[Reference] = {'Day':Day, 'Loaded':Now, 'First':0, 'Values':[]}
+
+    if len(Wanted) == 0: return
+    Metrics.Count('TrendReads', len(Wanted))
+
+    try:
+        Items = Store.GetItems([('Trend', RecordType) for RecordType in Wanted])
+    except Exception as e:
+        logger.error(f'DynamoDB error reading trends: {e}')
+        for Reference in Wanted.values():
+            Trends[Reference]['Loaded'] = 0 # Try again on the next request
+        return
+
+    for Item in Items:
+        Trend = Trends[Wanted[Item['RecordType']]]
+        Trend['First']  = int(Item['First'])
+        Trend['Values'] = DecodeSamples(bytes(Item['Samples']))
+
+def GetTrend(Reference):
+    if Reference not in Trends: LoadTrends([Reference])
+    return Trends[Reference]
+
+def RenderSparkline(Values, Width=100, Height=20):
+    #
+    # A simple inline SVG line - it picks up the text colour of the cell.
+    #
+    if len(Values) < 2: return ''
+
+    Low   = min(Values)
+    Range = max(Values)-Low or 1
+    Step  = Width/(len(Values)-1)
+
+    Points = []
+    for Index in range(0, len(Values)):
+        Points.append(f'{Index*Step:.1f},{Height-(Values[Index]-Low)*Height/Range:.1f}')
+
+    return f'<svg class="sparkline" width="{Width}" height="{Height}" viewBox="0 0 {Width} {Height}"><polyline fill="none" stroke="currentColor" stroke-width="1" points="{" ".join(Points)}"/></svg>'
+
+def SplitFormula(Formula):
+    #
+    # Split the calculation based on mathemetical operators
+    #
+    return re.split('(\+|\*|\-|\/|\(|\)|,)', Formula)
+
 def DoCalculation(WallboardName, Reference):
-    global Data,Calculations,FunctionList
+    global Data,Calculations,Formulas,FunctionList
     
-    Result = '0' # All values are stored as strings when they come out of DDB
+    Started = time.perf_counter()
+    Result  = '0' # All values are stored as strings when they come out of DDB
 
     #
-    # Split the calculation based on mathemetical operators
+    # Formulas are split up when the configuration is loaded so we work on a
+    # copy of the pieces.
     #
-    CalcArray = re.split('(\+|\*|\-|\/|\(|\)|,)', Calculations[WallboardName][Reference])
+    CalcArray = list(Formulas[WallboardName][Reference])
 
+    #
     # Substitute in the values for the labels in the calculation
     #
     Index = 0
@@ -325,61 +748,102 @@ def DoCalculation(WallboardName, Reference):
             CalcArray[Index] = '0'
 
     CalcString = ''.join(CalcArray)
-    logger.info(f'Calculation for {Reference}: {Calculations[WallboardName][Reference]} -> {CalcString}')
+    if Debug: logger.debug(f'Calculation for {Reference}: {Calculations[WallboardName][Reference]} -> {CalcString}')
     
     try:
         Result = str(eval(CalcString))
     except Exception as e:
         logger.error(f'Could not eval {Reference}: {Calculations[WallboardName][Reference]} -> {CalcString} : {e}')
         
+    Metrics.Count('Calculations')
+    Metrics.AddTime('Calculation', Started)
     return Result
     
+def Calculate(WallboardName, Reference):
+    #
+    # Thresholds and cells can both refer to a calculation - it only needs
+    # working out once for each request.
+    #
+    if Reference in Calculated: return
+    Data[Reference] = DoCalculation(WallboardName, Reference)
+    Calculated.add(Reference)
+
+def GetThresholdValue(WallboardName, Reference):
+    if Reference in Calculations[WallboardName]: Calculate(WallboardName, Reference)
+
+    if Reference not in Data:
+        logger.warning(f'Data reference {Reference} in a threshold does not exist for wallboard {WallboardName}')
+        return float('nan') # Never crosses a threshold
+
+    try:
+        return float(Data[Reference])
+    except ValueError:
+        logger.warning(f'Data reference {Reference} in a threshold for wallboard {WallboardName} is not a number: {Data[Reference]}')
+        return float('nan')
+
+def EvaluateThresholds(WallboardName):
+    global ThresholdLevels
+
+    #
+    # Work out the level of every threshold on the wallboard at the start of
+    # each request so that each cell only has to look its threshold up. The
+    # checks are in the same order as they always have been so that where
+    # more than one applies the later one wins: warning below, alert below,
+    # warning above and then alert above.
+    #
+    Started = time.perf_counter()
+    Limits  = ThresholdTables[WallboardName]
+    Values  = [GetThresholdValue(WallboardName, Reference) for Reference in Limits['References']]
+
+    if 'Bounds' in Limits:
+        Current = numpy.array(Values, dtype=float)[Limits['Positions']]
+        (WarnBelow,AlertBelow,WarnAbove,AlertAbove) = Limits['Bounds']
+        Levels = numpy.select([Current > AlertAbove, Current > WarnAbove, Current < AlertBelow, Current < WarnBelow], [2, 1, 2, 1], 0).tolist()
+    else:
+        Levels = []
+        for (Position,WarnBelow,AlertBelow,WarnAbove,AlertAbove) in Limits['Rows']:
+            Value = Values[Position]
+            if Value > AlertAbove:   Levels.append(2)
+            elif Value > WarnAbove:  Levels.append(1)
+            elif Value < AlertBelow: Levels.append(2)
+            elif Value < WarnBelow:  Levels.append(1)
+            else:                    Levels.append(0)
+
+    ThresholdLevels = {Name:(Limits['Colours'][Level], ThresholdNames[Level]) for (Name,Level) in zip(Limits['Names'], Levels)}
+    Metrics.Count('Thresholds', len(Levels))
+    Metrics.AddTime('Thresholds', Started)
+
 def CheckThreshold(WallboardName, ThresholdReference):
-    global Settings,Data,Thresholds,Calculations
-    
     #
-    # For the given data reference, check for any threshold details and then
-    # return the right colour (which will be used for the cell background when
-    # displayed). We have warning thresholds (above and below) and error
-    # thresholds (above and below).
+    # For the given threshold return the right colour (which will be used for
+    # the cell background when displayed) and level. We have warning
+    # thresholds (above and below) and error thresholds (above and below).
+    # They have all been checked already by EvaluateThresholds.
     #
-    Colour         = ''
-    ThresholdLevel = 'Normal' # Additional flag for JSON data return
+    if ThresholdReference in ThresholdLevels: return ThresholdLevels[ThresholdReference]
 
     if ThresholdReference not in Thresholds[WallboardName]:
         logger.warning(f'Threshold reference {ThresholdReference} does not exist for wallboard {WallboardName}')
-        return Colour, ThresholdLevel
+    return '', 'Normal' # Additional flag for JSON data return
 
-    Threshold = Thresholds[WallboardName][ThresholdReference]
-    if 'Reference' not in Threshold:
-        logger.warning(f'No data reference present in threshold {ThresholdReference} for wallboard {WallboardName}')
-        return Colour, ThresholdLevel
+def GetTimeInState(AgentName):
+    global StateSince
 
-    if Threshold['Reference'] not in Data:
-        if Threshold['Reference'] in Calculations:
-            Data[Threshold['Reference']] = DoCalculation(WallboardName, Threshold['Reference'])
-        else:
-            logger.warning(f'Data reference {Threshold["Reference"]} in threshold {ThresholdReference} does not exist for wallboard {WallboardName}')
-            return Colour, ThresholdLevel
-
-    if 'WarnBelow' in Threshold:
-        if int(Data[Threshold['Reference']]) < int(Threshold['WarnBelow']):
-             Colour = Settings[WallboardName]['WarningBackgroundColour']
-             ThresholdLevel = 'Warning'
-    if 'AlertBelow' in Threshold:
-        if int(Data[Threshold['Reference']]) < int(Threshold['AlertBelow']):
-             Colour = Settings[WallboardName]['AlertBackgroundColour']
-             ThresholdLevel = 'Alert'
-    if 'WarnAbove' in Threshold:
-        if int(Data[Threshold['Reference']]) > int(Threshold['WarnAbove']):
-             Colour = Settings[WallboardName]['WarningBackgroundColour']
-             ThresholdLevel = 'Warning'
-    if 'AlertAbove' in Threshold:
-        if int(Data[Threshold['Reference']]) > int(Threshold['AlertAbove']):
-             Colour = Settings[WallboardName]['AlertBackgroundColour']
-             ThresholdLevel = 'Alert'
-
-    return Colour, ThresholdLevel
+    #
+    # The agent event function records when an agent entered their current
+    # state - work out how long ago that was in the same format as the Time
+    # cell format.
+    #
+    if AgentName not in StateSince: return ''
+
+    try:
+        Since = datetime.datetime.fromisoformat(StateSince[AgentName].replace('Z', '+00:00'))
+    except ValueError:
+        logger.warning(f'Could not parse state time {StateSince[AgentName]} for {AgentName}')
+        return ''
+
+    Elapsed = int((datetime.datetime.now(datetime.timezone.utc)-Since).total_seconds())
+    return str(datetime.timedelta(0, max(Elapsed, 0)))
 
 def GetNextAgent(GetActive, JSONFlag=False):
     global SortedAgentList,NextAgent,FullAgentNames
@@ -420,18 +884,54 @@ def GetNextAgent(GetActive, JSONFlag=False):
             return HTML, ''
     
     if JSONFlag:
-        if AgentName in FullAgentNames: # Just in case we didn't find a full name for this agent
-            JSON['FullAgentName'] = FullAgentNames[AgentName]
-        JSON['AgentState'] = Data[AgentName]
-
-        return JSON, AgentName
+        return GetAgentJSON(AgentName), AgentName
     else:
         if AgentName in FullAgentNames: # Just in case we didn't find a full name for this agent
             HTML += f'<div class="text">{FullAgentNames[AgentName]}</div>'
         HTML += f'<div class="data">{Data[AgentName]}</div>'
+        TimeInState = GetTimeInState(AgentName)
+        if len(TimeInState) > 0: HTML += f'<div class="time">{TimeInState}</div>'
 
         return HTML, Data[AgentName] # Return the state so we can set the cell background colour
 
+def GetAgentJSON(AgentName):
+    JSON = {}
+    if AgentName in FullAgentNames: # Just in case we didn't find a full name for this agent
+        JSON['FullAgentName'] = FullAgentNames[AgentName]
+    JSON['AgentState'] = Data[AgentName]
+    TimeInState = GetTimeInState(AgentName)
+    if len(TimeInState) > 0: JSON['TimeInState'] = TimeInState
+
+    return JSON
+
+def GetAgentRoster(States=None, Prefix='', Offset=0, Limit=None):
+    #
+    # Returns how many agents match along with the names on the page that was
+    # asked for. The lists are sorted so the agents whose username starts
+    # with the prefix are found with a binary search, and the lists for
+    # several states are merged back into alphabetical order.
+    #
+    if States is None:
+        Lists = [SortedAgentList]
+    else:
+        Lists = [AgentsByState.get(State, []) for State in dict.fromkeys(States)]
+
+    Ranges = []
+    for Names in Lists:
+        Start = bisect.bisect_left(Names, Prefix)
+        End   = bisect.bisect_right(Names, Prefix, lo=Start, key=lambda Name: Name[:len(Prefix)]) if len(Prefix) else len(Names)
+        if End > Start: Ranges.append((Names, Start, End))
+
+    Total = sum(End-Start for (Names,Start,End) in Ranges)
+    if len(Ranges) == 1:
+        (Names,Start,End) = Ranges[0]
+        Page = Names[Start+Offset:End if Limit is None else min(End, Start+Offset+Limit)]
+    else:
+        Merged = heapq.merge(*[Names[Start:End] for (Names,Start,End) in Ranges])
+        Page   = list(itertools.islice(Merged, Offset, None if Limit is None else Offset+Limit))
+
+    return Total, Page
+
 def RenderCell(WallboardName, Row, Column):
     global AgentStates,Thresholds,Data,Calculations
     
@@ -459,7 +959,7 @@ def RenderCell(WallboardName, Row, Column):
     if 'Reference' in Cell:
         State = ''
         if Cell['Reference'] in Calculations[WallboardName]: # We need to calculate this one
-            Data[Cell['Reference']] = DoCalculation(WallboardName, Cell['Reference'])
+            Calculate(WallboardName, Cell['Reference'])
         elif Cell['Reference'].lower() in Data: # Data already exists
             State = Data[Cell['Reference']]
         elif Cell['Reference'] == '=allagents': # Any agent at all
@@ -504,6 +1004,12 @@ def RenderCell(WallboardName, Row, Column):
             else:
                 FinalData = RawData
             HTML += f'<div class="data">{FinalData}</div>'
+            TimeInState = GetTimeInState(Cell['Reference'])
+            if len(TimeInState) > 0: HTML += f'<div class="time">{TimeInState}</div>'
+
+            if str(Cell.get('Trend', '')).lower() == 'true' and Cell['Reference'] in TrendSources[WallboardName]:
+                Sparkline = RenderSparkline(GetTrend(Cell['Reference'])['Values'])
+                if len(Sparkline) > 0: HTML += f'<div class="trend">{Sparkline}</div>'
         elif Cell['Reference'] == '=allagents' or Cell['Reference'] == '=activeagents':
             HTML += AgentDetails
         else:
@@ -522,6 +1028,10 @@ def RenderHTML(WallboardName):
     LocalSettings = Settings[WallboardName]
     HTML = ''
 
+    Calculated.clear()
+    EvaluateThresholds(WallboardName)
+    LoadTrends(GetTrendReferences(WallboardName, True))
+
     HTML += f'<table label="ConnectWallboard{LocalSettings["Identifier"].replace(" ", "")}"'
     HTML += ' style="border: 1px solid black; border-collapse: collapse; margin-left: auto; margin-right: auto; text-align: center;'
     if 'TextColour'       in LocalSettings: HTML += f' color: {LocalSettings["TextColour"]};'
@@ -540,7 +1050,7 @@ def RenderHTML(WallboardName):
 
     return HTML
 
-def GetRawCellData(WallboardName, Row, Column):
+def GetRawCellData(WallboardName, Row, Column, TrendFlag=False):
     global AgentStates,Thresholds,Data,Calculations
     
     #
@@ -571,7 +1081,7 @@ def GetRawCellData(WallboardName, Row, Column):
 
     if 'Reference' in Cell:
         if Cell['Reference'] in Calculations[WallboardName]: # We need to calculate this one
-            Data[Cell['Reference']] = DoCalculation(WallboardName, Cell['Reference'])
+            Calculate(WallboardName, Cell['Reference'])
 
     if 'ThresholdReference' in Cell:
         (Background,Level) = CheckThreshold(WallboardName, Cell['ThresholdReference'])
@@ -588,10 +1098,20 @@ def GetRawCellData(WallboardName, Row, Column):
         JSON['Metric'] = Cell['Reference']
         if Cell['Reference'] in Data:
             JSON['Value'] = Data[Cell['Reference']]
+            TimeInState = GetTimeInState(Cell['Reference'])
+            if len(TimeInState) > 0: JSON['TimeInState'] = TimeInState
+
+        #
+        # Trend data is only sent when asked for as it needs an extra read.
+        #
+        if TrendFlag and Cell['Reference'] in TrendSources[WallboardName]:
+            Trend = GetTrend(Cell['Reference'])
+            if len(Trend['Values']) > 0:
+                JSON['Trend'] = {'Start':str(datetime.timedelta(minutes=Trend['First']*TrendMinutes)), 'Interval':TrendMinutes, 'Values':Trend['Values']}
 
     return JSON
     
-def RenderJSON(WallboardName):
+def GetWallboardJSON(WallboardName, TrendFlag=False, AgentOptions={}):
     global Settings
 
     #
@@ -602,6 +1122,10 @@ def RenderJSON(WallboardName):
     LocalSettings = Settings[WallboardName]
     JSON = {}
 
+    Calculated.clear()
+    EvaluateThresholds(WallboardName)
+    if TrendFlag: LoadTrends(GetTrendReferences(WallboardName))
+
     #
     # The settings provided are for appearance only so the front end can
     # ignore these and render the data in whatever format is appropriate.
@@ -616,13 +1140,18 @@ def RenderJSON(WallboardName):
     JSON['Settings']['AgentStateList'] = AgentStates[WallboardName]
 
     #
-    # Get all the agent states.
+    # Get the agent states - all of them unless the request asked for some
+    # of them (or none). The count is of every agent that matched so that the
+    # front end knows how many pages there are.
     #
-    JSON['AgentStates'] = {}
-    (AgentState,AgentName) = GetNextAgent(False, JSONFlag=True)
-    while len(AgentName) > 0:
-        JSON['AgentStates'][AgentName] = AgentState
-        (AgentState,AgentName) = GetNextAgent(False, JSONFlag=True)
+    if AgentOptions.get('Include', True):
+        (JSON['AgentCount'],Page) = GetAgentRoster(AgentOptions.get('States'), AgentOptions.get('Prefix', ''), AgentOptions.get('Offset', 0), AgentOptions.get('Limit'))
+        JSON['AgentStates'] = {}
+        for AgentName in Page:
+            JSON['AgentStates'][AgentName] = GetAgentJSON(AgentName)
+        Metrics.Count('AgentsSent', len(Page))
+    else:
+        JSON['AgentCount'] = len(SortedAgentList)
 
     #
     # Now the rest of the data for this wallboard.
@@ -630,13 +1159,124 @@ def RenderJSON(WallboardName):
     JSON['WallboardData'] = {}
     for Row in range(1, int(LocalSettings['Rows'])+1):
         for Column in range(1, int(LocalSettings['Columns'])+1):
-            CellData = GetRawCellData(WallboardName, Row, Column)
+            CellData = GetRawCellData(WallboardName, Row, Column, TrendFlag)
             if len(CellData): JSON['WallboardData'][f'R{Row}C{Column}'] = CellData
 
-    return json.dumps(JSON)
+    return JSON
+
+def RenderJSON(WallboardName, TrendFlag=False, AgentOptions={}):
+    return json.dumps(GetWallboardJSON(WallboardName, TrendFlag, AgentOptions))
+
+def PackLength(Packed, Length, Small, Limit, Codes):
+    #
+    # MessagePack headers - a single byte for short strings, arrays and maps,
+    # otherwise a code followed by an 8, 16 or 32 bit length.
+    #
+    if Length < Limit:
+        Packed.append(Small | Length)
+    elif Codes[0] is not None and Length < 0x100:
+        Packed += struct.pack('>BB', Codes[0], Length)
+    elif Length < 0x10000:
+        Packed += struct.pack('>BH', Codes[1], Length)
+    else:
+        Packed += struct.pack('>BI', Codes[2], Length)
+
+def PackText(Value):
+    Packed  = bytearray()
+    Encoded = Value.encode('utf-8')
+    PackLength(Packed, len(Encoded), 0xa0, 32, [0xd9, 0xda, 0xdb])
+    Packed += Encoded
+    return bytes(Packed)
+
+def PackScalar(Value):
+    if Value is None:                 return b'\xc0'
+    if Value is True:                 return b'\xc3'
+    if Value is False:                return b'\xc2'
+    if isinstance(Value, float):      return struct.pack('>Bd', 0xcb, Value)
+    if 0 <= Value < 0x80:             return struct.pack('>B', Value)
+    if -0x20 <= Value < 0:            return struct.pack('>b', Value)
+    if 0 <= Value < 0x100:            return struct.pack('>BB', 0xcc, Value)
+    if 0 <= Value < 0x10000:          return struct.pack('>BH', 0xcd, Value)
+    if 0 <= Value < 2**32:            return struct.pack('>BI', 0xce, Value)
+    if 0 <= Value:                    return struct.pack('>BQ', 0xcf, Value)
+    if -0x80 <= Value:                return struct.pack('>Bb', 0xd0, Value)
+    if -0x8000 <= Value:              return struct.pack('>Bh', 0xd1, Value)
+    if -2**31 <= Value:               return struct.pack('>Bi', 0xd2, Value)
+    return struct.pack('>Bq', 0xd3, Value)
+
+def PackValue(Value, Strings, Packed):
+    #
+    # Strings (and keys) are encoded once and then copied from the cache as
+    # the same few states, colours and values appear over and over.
+    #
+    if isinstance(Value, str):
+        Encoded = Strings.get(Value)
+        if Encoded is None: Encoded = Strings[Value] = PackText(Value)
+        Packed += Encoded
+    elif isinstance(Value, dict):
+        PackLength(Packed, len(Value), 0x80, 16, [None, 0xde, 0xdf])
+        for (Name,Entry) in Value.items():
+            Encoded = Strings.get(Name)
+            if Encoded is None: Encoded = Strings[Name] = PackText(Name)
+            Packed += Encoded
+
+            if isinstance(Entry, str): # Most values are strings - saves a call for each
+                Encoded = Strings.get(Entry)
+                if Encoded is None: Encoded = Strings[Entry] = PackText(Entry)
+                Packed += Encoded
+            else:
+                PackValue(Entry, Strings, Packed)
+    elif isinstance(Value, (list, tuple)):
+        PackLength(Packed, len(Value), 0x90, 16, [None, 0xdc, 0xdd])
+        for Entry in Value: PackValue(Entry, Strings, Packed)
+    else:
+        Packed += PackScalar(Value)
+
+def RenderMessagePack(WallboardName, TrendFlag=False, AgentOptions={}):
+    #
+    # Exactly the same structure as the JSON response packed as plain
+    # MessagePack, so any MessagePack library can read it - see
+    # wallboard-msgpack-example.html for a small decoder. The msgpack package
+    # is much quicker if it is installed (in a layer, say); otherwise we pack
+    # it ourselves, which gives the same bytes.
+    #
+    JSON = GetWallboardJSON(WallboardName, TrendFlag, AgentOptions)
+    if msgpack is not None: return msgpack.packb(JSON)
+
+    Packed = bytearray()
+    PackValue(JSON, {}, Packed)
+    return bytes(Packed)
+
+def GetAgentOptions(Parameters):
+    #
+    # A JSON request can leave the agents out (agents=false), only list the
+    # agents in some states (states=Available,Lunch) or whose username starts
+    # with prefix, and ask for a page of them with offset and limit.
+    #
+    Options = {'Include':str(Parameters.get('agents', 'true')).lower() != 'false', 'Prefix':Parameters.get('prefix', '')}
+    if Parameters.get('states'): Options['States'] = [State for State in Parameters['states'].split(',') if len(State) > 0]
+
+    try:
+        Options['Offset'] = max(0, int(Parameters.get('offset', 0)))
+        if 'limit' in Parameters: Options['Limit'] = max(0, int(Parameters['limit']))
+    except ValueError:
+        logger.warning(f'Agent offset {Parameters.get("offset")} or limit {Parameters.get("limit")} is not a number - ignored')
+        Options['Offset'] = 0
+        Options.pop('Limit', None)
+
+    return Options
 
 def lambda_handler(event, context):
-    GetData()
+    #
+    # As well as the sampled invocations, a JSON request can ask to be
+    # profiled with profile=true - but only when LogLevel is DEBUG so that
+    # anyone who can load a wallboard can't fill the logs.
+    #
+    Parameters = event['queryStringParameters'] if str(type(event.get('queryStringParameters'))).find('dict') != -1 else {}
+    Profiler   = Metrics.StartProfile(Debug and bool(Parameters.get('json')) and bool(Parameters.get('profile')))
+
+    with Metrics.TimePhase('DataRead'):
+        GetData()
 
     Response = {}
     Response['statusCode'] = 200
@@ -644,19 +1284,50 @@ def lambda_handler(event, context):
 
     if str(type(event['queryStringParameters'])).find('dict') == -1 or 'Wallboard' not in event['queryStringParameters']:
         Response['body'] = '<div class="error">No wallboard name specified</div>'
+        Metrics.StopProfile(Profiler, 'request with no wallboard')
+        Metrics.Emit()
         return Response
 
     WallboardName = event['queryStringParameters']['Wallboard']
-    if GetConfiguration(WallboardName):
-        GetRealtimeData()
-
-        JSONFlag = event['queryStringParameters'].get('json')
-        if JSONFlag:
-            OutputData = RenderJSON(WallboardName)
-        else:
-            OutputData = RenderHTML(WallboardName)
+    Format        = 'HTML'
+    with Metrics.TimePhase('Config'):
+        Found = GetConfiguration(WallboardName)
+
+    if Found:
+        if RealtimeInRender:
+            with Metrics.TimePhase('Connect'):
+                GetRealtimeData()
+
+        #
+        # format=msgpack gets the JSON structure as MessagePack, which API
+        # Gateway only passes on as binary if the caller sends
+        # "Accept: application/msgpack".
+        #
+        if event['queryStringParameters'].get('format', '').lower() == 'msgpack':
+            Format = 'MessagePack'
+        elif event['queryStringParameters'].get('json'):
+            Format = 'JSON'
+        with Metrics.TimePhase('Render'):
+            if Format == 'MessagePack':
+                OutputData = RenderMessagePack(WallboardName, bool(event['queryStringParameters'].get('trend')), GetAgentOptions(event['queryStringParameters']))
+            elif Format == 'JSON':
+                OutputData = RenderJSON(WallboardName, bool(event['queryStringParameters'].get('trend')), GetAgentOptions(event['queryStringParameters']))
+            else:
+                OutputData = RenderHTML(WallboardName)
+        Metrics.Count('Cells', int(Settings[WallboardName]['Rows'])*int(Settings[WallboardName]['Columns']))
     else:
         OutputData = f'<div class="error">Wallboard {WallboardName} not found</div>'
 
-    Response['body'] = OutputData
-    return Response
\ No newline at end of file
+    Metrics.Count('Values', len(Data))
+    Metrics.Count('Agents', len(SortedAgentList))
+    Metrics.Count('ResponseBytes', len(OutputData))
+    Metrics.StopProfile(Profiler, f'wallboard {WallboardName}')
+    Metrics.Emit({'Wallboard':WallboardName, 'Format':Format})
+
+    if isinstance(OutputData, bytes):
+        Response['headers']['Content-Type'] = 'application/msgpack'
+        Response['body']            = base64.b64encode(OutputData).decode('ascii')
+        Response['isBase64Encoded'] = True
+    else:
+        Response['body'] = OutputData
+    return Response
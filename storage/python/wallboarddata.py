@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Code the functions share for keeping current data in the wallboard table:
+# which Data#n partition a metric goes in, and the compressed snapshot items
+# under the "Snapshot" identifier that the render function reads instead of
+# every partition. The pollers use it like this:
+#
+#   Store.PutItem({'Identifier':wallboarddata.GetDataShard(Name, DataShards), ...})
+#   wallboarddata.WriteSnapshot(Store, Metrics, 'Realtime', DataSources, Data, SnapshotWritten)
+#
+# This file is deployed to the functions as part of the storage layer.
+#
+
+import json
+import zlib
+import logging
+
+SnapshotRetries = 5 # How many times we re-read and merge a snapshot if someone else changed it first
+MaxSnapshotSize = 350000 # DynamoDB items can't be bigger than 400KB
+
+logger = logging.getLogger()
+
+def GetDataShard(Name, DataShards):
+    #
+    # Metrics are spread over several partitions (Data#0..n) so that no single
+    # partition takes every write. Every function uses this so the hash always
+    # matches.
+    #
+    return f'Data#{zlib.crc32(Name.encode()) % DataShards}'
+
+def ProcessChunks(List, Size):
+    return (List[Pos:Pos+Size] for Pos in range(0, len(List), Size))
+
+def WriteSnapshot(Store, Metrics, RecordType, Sources, Values, Written, Seed=None):
+    #
+    # Keep the values of Sources in one compressed snapshot item. The
+    # snapshot is rebuilt from Sources each time, so anything that is no
+    # longer a source drops out, and sources we don't have a value for yet
+    # keep the one already in the snapshot (or from Seed the first time it is
+    # written). Written is what we last wrote - if nothing has changed since
+    # then there is nothing to do. If someone else changes the snapshot
+    # between our read and write the version check fails and we read it
+    # again. Returns whether the snapshot is up to date. With no sources at
+    # all an empty snapshot is still written (once) so that the render
+    # function doesn't go back to reading every record.
+    #
+    Changes = {Name:Values[Name] for Name in Sources if Name in Values and Written.get(Name) != Values[Name]}
+    Removed = [Name for Name in Written if Name not in Sources]
+    if len(Changes) == 0 and len(Removed) == 0 and (len(Written) > 0 or len(Sources) > 0): return True
+
+    for Attempt in range(0, SnapshotRetries):
+        try:
+            (Version,Packed) = Store.LoadSnapshot(RecordType)
+            if Packed is not None:
+                Old = json.loads(zlib.decompress(Packed))
+            else:
+                Old = Seed() if Seed is not None else {}
+
+            Contents = {Name:Old[Name] for Name in Old if Name in Sources}
+            Contents.update(Changes)
+            if Packed is not None and Contents == Old:
+                Written.clear()
+                Written.update(Contents)
+                return True
+
+            Packed = zlib.compress(json.dumps(Contents, separators=(',',':')).encode('utf-8'))
+            if len(Packed) > MaxSnapshotSize:
+                logger.error(f'Snapshot {RecordType} is too big ({len(Packed)} bytes)')
+                return False
+
+            Saved = Store.SaveSnapshot(RecordType, Version, Packed)
+        except Exception as e:
+            logger.error(f'DynamoDB snapshot error for {RecordType}: {e}')
+            return False
+
+        if not Saved:
+            logger.info(f'Snapshot {RecordType} changed while we were updating it - merging again')
+            Metrics.Count('SnapshotConflicts')
+            continue
+
+        Written.clear()
+        Written.update(Contents)
+        return True
+
+    logger.error(f'Could not update snapshot {RecordType} after {SnapshotRetries} attempts')
+    return False
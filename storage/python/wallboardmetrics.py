@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Per-invocation metrics for the Lambda functions. Each invocation's timings
+# (in milliseconds) and counts are written to the log as one line in
+# CloudWatch embedded metric format when it finishes, so they become metrics
+# without any extra calls. Each function makes its own Metrics so that
+# functions loaded into one process (as the benchmarks do) keep their figures
+# apart:
+#
+#   Metrics  = wallboardmetrics.Metrics(FunctionName, MetricNamespace, ProfileRate, ProfileTop)
+#   Profiler = Metrics.StartProfile()
+#   with Metrics.TimePhase('Config'):
+#       ...
+#   Metrics.Count('ConfigCacheHits')
+#   Metrics.StopProfile(Profiler, f'wallboard {WallboardName}')
+#   Metrics.Emit({'Wallboard':WallboardName})
+#
+# This file is deployed to the functions as part of the storage layer.
+#
+
+import io
+import json
+import time
+import random
+import logging
+import cProfile
+import pstats
+from contextlib import contextmanager
+
+#
+# Errors that mean DynamoDB or Connect is throttling us
+#
+ThrottleCodes = ['ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException']
+
+class Metrics:
+    def __init__(self, FunctionName, Namespace, ProfileRate=0, ProfileTop=25):
+        self.FunctionName = FunctionName
+        self.Namespace    = Namespace # Empty for no metrics
+        self.ProfileRate  = ProfileRate
+        self.ProfileTop   = ProfileTop
+        self.Timings      = {}
+        self.Counts       = {}
+
+    def AddTime(self, Name, Started):
+        self.Timings[Name] = self.Timings.get(Name, 0)+(time.perf_counter()-Started)*1000
+
+    @contextmanager
+    def TimePhase(self, Name):
+        Started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.AddTime(Name, Started)
+
+    def Count(self, Name, Value=1):
+        self.Counts[Name] = self.Counts.get(Name, 0)+Value
+
+    def CountThrottles(self, response=None, **Arguments):
+        #
+        # botocore calls this before it decides whether to retry, so we see
+        # the throttled calls that were retried successfully as well.
+        #
+        if response is not None and response[1].get('Error', {}).get('Code') in ThrottleCodes: self.Count('Throttles')
+
+    def WatchClient(self, Client):
+        Client.meta.events.register_first(f'needs-retry.{Client.meta.service_model.service_id.hyphenize()}', self.CountThrottles, unique_id='CountThrottles')
+        return Client
+
+    def Emit(self, Properties={}):
+        if self.Namespace and (len(self.Timings) > 0 or len(self.Counts) > 0):
+            Metrics = [{'Name':f'{Name}Time', 'Unit':'Milliseconds'} for Name in self.Timings]
+            Metrics += [{'Name':Name, 'Unit':'Count'} for Name in self.Counts]
+
+            Record = {'_aws':{'Timestamp':int(time.time()*1000),
+                              'CloudWatchMetrics':[{'Namespace':self.Namespace, 'Dimensions':[['Function']], 'Metrics':Metrics}]},
+                      'Function':self.FunctionName}
+            Record.update(Properties)
+            Record.update({f'{Name}Time':round(self.Timings[Name], 3) for Name in self.Timings})
+            Record.update(self.Counts)
+            print(json.dumps(Record))
+
+        self.Timings = {}
+        self.Counts  = {}
+
+    #
+    # A sampled share of invocations (ProfileRate) can be run under cProfile
+    # to see where the time goes. The statistics are saved in /tmp (so they
+    # can be loaded with pstats) and the functions with the most cumulative
+    # time are written to the log. When it is off this costs one comparison.
+    #
+    def StartProfile(self, Forced=False):
+        if not Forced and (self.ProfileRate <= 0 or random.random() >= self.ProfileRate): return None
+
+        Profiler = cProfile.Profile()
+        Profiler.enable()
+        return Profiler
+
+    def StopProfile(self, Profiler, Description):
+        if Profiler is None: return
+        Profiler.disable()
+        self.Count('Profiled')
+
+        FileName = f'/tmp/profile-{self.FunctionName}-{int(time.time()*1000)}.pstats'
+        try:
+            Profiler.dump_stats(FileName)
+        except Exception as e:
+            logging.getLogger().error(f'Could not save profile to {FileName}: {e}')
+            FileName = None
+
+        Summary = io.StringIO()
+        pstats.Stats(Profiler, stream=Summary).sort_stats('cumulative').print_stats(self.ProfileTop)
+        logging.getLogger().info(f'Profile of {Description} (saved to {FileName}):\n{Summary.getvalue()}')
@@ -0,0 +1,692 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Where the wallboard is kept. The Lambda functions and the import utility
+# don't call DynamoDB themselves - they ask a store for what they need and
+# the store works out how to do it. Which store is used is set with the
+# WallboardStore environment variable:
+#
+#   dynamodb        - the DynamoDB table; the default and the one used in AWS
+#   memory          - kept in memory by the process, so only useful when
+#                     everything runs in one process (the benchmarks)
+#   sqlite:<file>   - kept in a SQLite database file, which several processes
+#                     can share
+#
+# Every store has the same calls. Items are plain dictionaries keyed on
+# Identifier (the partition) and RecordType.
+#
+#   Configuration   GetWallboard, GetDataSources, BumpVersion, CreateTable
+#   Reading data    GetItem, GetItems, GetPartition
+#   Writing data    PutItem, PutIfMissing, Writer,
+#                   LoadSnapshot, SaveSnapshot
+#   Agents          SaveAgentState, TouchAgentState, RefreshAgent,
+#                   GetAgentARN
+#
+# This file is deployed to the functions as a Lambda layer - it is under
+# python/ so that it ends up on their path.
+#
+
+import copy
+import json
+import math
+import time
+import base64
+import sqlite3
+import threading
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.conditions import Key,Attr
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+BatchSize    = 25 # Most items DynamoDB takes in one BatchWriteItem
+MaxBatchKeys = 100 # Most keys DynamoDB takes in one BatchGetItem
+MaxRetries   = 8 # How many times we resend items DynamoDB didn't process
+StateRetries = 5 # How many times we try again if an agent's record changes while we are saving their state
+PageSize     = 1024*1024 # DynamoDB returns at most 1MB from each query or scan
+Stores       = {}
+StoreLock    = threading.Lock()
+
+def IsConditionFailure(Error):
+    return Error.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+def GetLastEvent(Item):
+    #
+    # When we last heard about an agent's state. Records written before
+    # LastEventTimestamp was added only have the EventTimestamp of the last
+    # state change.
+    #
+    return Item.get('LastEventTimestamp', Item.get('EventTimestamp', ''))
+
+def IsSameState(Old, Item):
+    return 'Value' in Old and Old['Value'] == Item['Value'] and Old.get('RoutingProfile', '') == Item.get('RoutingProfile', '')
+
+class DynamoDBStore:
+    #
+    # Calls go through the table's client, which is safe to share between
+    # threads and (unlike the plain client) takes and returns ordinary
+    # Python values. The functions watch the client for throttling.
+    #
+    def __init__(self, TableName):
+        self.TableName    = TableName
+        self.Client       = boto3.resource('dynamodb').Table(TableName).meta.client
+        self.Deserializer = TypeDeserializer()
+
+    def Query(self, Operation, **Arguments):
+        Response = Operation(TableName=self.TableName, **Arguments)
+        Items    = Response['Items']
+        while 'LastEvaluatedKey' in Response:
+            Response = Operation(TableName=self.TableName, ExclusiveStartKey=Response['LastEvaluatedKey'], **Arguments)
+            Items   += Response['Items']
+
+        return Items
+
+    def GetWallboard(self, WallboardName):
+        return self.Query(self.Client.query, KeyConditionExpression=Key('Identifier').eq(WallboardName))
+
+    def GetDataSources(self):
+        return self.Query(self.Client.scan, FilterExpression=Attr('RecordType').begins_with('DataSource'))
+
+    def BumpVersion(self, WallboardName, RecordType):
+        Response = self.Client.update_item(TableName=self.TableName, Key={'Identifier':WallboardName, 'RecordType':RecordType},
+                                           UpdateExpression='ADD ConfigVersion :one SET Updated = :now',
+                                           ExpressionAttributeValues={':one':1, ':now':time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+                                           ReturnValues='UPDATED_NEW')
+        return int(Response['Attributes']['ConfigVersion'])
+
+    def CreateTable(self):
+        #
+        # Agents that have gone away are removed using TTL.
+        #
+        try:
+            self.Client.describe_table(TableName=self.TableName)
+            return False
+        except self.Client.exceptions.ResourceNotFoundException:
+            pass
+
+        self.Client.create_table(TableName=self.TableName,
+                                 KeySchema=[{'AttributeName':'Identifier', 'KeyType':'HASH'},
+                                            {'AttributeName':'RecordType', 'KeyType':'RANGE'}],
+                                 AttributeDefinitions=[{'AttributeName':'Identifier', 'AttributeType':'S'}, {'AttributeName':'RecordType', 'AttributeType':'S'}],
+                                 BillingMode='PAY_PER_REQUEST')
+        self.Client.get_waiter('table_exists').wait(TableName=self.TableName)
+        self.Client.update_time_to_live(TableName=self.TableName, TimeToLiveSpecification={'Enabled':True, 'AttributeName':'ExpiresAt'})
+        return True
+
+    def GetItem(self, Identifier, RecordType, Consistent=False):
+        Response = self.Client.get_item(TableName=self.TableName, Key={'Identifier':Identifier, 'RecordType':RecordType}, ConsistentRead=Consistent)
+        return Response.get('Item')
+
+    def GetItems(self, Keys, Consistent=False):
+        #
+        # Keys are (Identifier, RecordType) pairs and must not repeat. Items
+        # that don't exist are left out.
+        #
+        Items = []
+        for Start in range(0, len(Keys), MaxBatchKeys):
+            Request = {self.TableName:{'Keys':[{'Identifier':Identifier, 'RecordType':RecordType} for (Identifier,RecordType) in Keys[Start:Start+MaxBatchKeys]],
+                                       'ConsistentRead':Consistent}}
+            while len(Request) > 0:
+                Response = self.Client.batch_get_item(RequestItems=Request)
+                Items   += Response['Responses'].get(self.TableName, [])
+                Request  = Response.get('UnprocessedKeys', {})
+
+        return Items
+
+    def GetPartition(self, Identifier, AgentsOnly=False):
+        Arguments = {'KeyConditionExpression':Key('Identifier').eq(Identifier)}
+        if AgentsOnly: Arguments['FilterExpression'] = Attr('AgentARN').exists()
+        return self.Query(self.Client.query, **Arguments)
+
+    def PutItem(self, Item):
+        self.Client.put_item(TableName=self.TableName, Item=Item)
+
+    def PutIfMissing(self, Item):
+        try:
+            self.Client.put_item(TableName=self.TableName, Item=Item, ConditionExpression=Attr('RecordType').not_exists())
+        except ClientError as e:
+            if IsConditionFailure(e): return False
+            raise
+
+        return True
+
+    def Writer(self):
+        return DynamoDBWriter(self)
+
+    def LoadSnapshot(self, RecordType):
+        Item = self.GetItem('Snapshot', RecordType, True)
+        if Item is None: return 0, None
+
+        return int(Item['Version']), bytes(Item['Snapshot'])
+
+    def SaveSnapshot(self, RecordType, Version, Packed):
+        #
+        # Only replaced if nobody else has since Version was read - False
+        # means someone has and the caller should read it again.
+        #
+        Condition = Attr('RecordType').not_exists() if Version == 0 else Attr('Version').eq(Version)
+        try:
+            self.Client.put_item(TableName=self.TableName, Item={'Identifier':'Snapshot', 'RecordType':RecordType, 'Version':Version+1, 'Updated':int(time.time()), 'Snapshot':Packed},
+                                 ConditionExpression=Condition)
+        except ClientError as e:
+            if IsConditionFailure(e): return False
+            raise
+
+        return True
+
+    def SaveAgentState(self, Item):
+        #
+        # Every event for an agent (with a LastEventTimestamp) moves their
+        # LastEventTimestamp on, so that an older event turning up later
+        # can't overwrite a newer state. The whole record - and so StateSince
+        # - is only replaced when the state or routing profile has changed;
+        # otherwise TouchAgentState just moves the timestamp (and expiry)
+        # on. Returns 'Saved', 'Unchanged' or 'Stale' and the item that was
+        # there before.
+        #
+        if 'LastEventTimestamp' not in Item:
+            Response = self.Client.put_item(TableName=self.TableName, Item=Item, ReturnValues='ALL_OLD')
+            return 'Saved', Response.get('Attributes', {})
+
+        if len(Item.get('RoutingProfile', '')) > 0:
+            Changed = Attr('Value').not_exists() | Attr('Value').ne(Item['Value']) | Attr('RoutingProfile').not_exists() | Attr('RoutingProfile').ne(Item['RoutingProfile'])
+        else:
+            Changed = Attr('Value').not_exists() | Attr('Value').ne(Item['Value']) | Attr('RoutingProfile').exists()
+
+        for Attempt in range(0, StateRetries):
+            try:
+                Response = self.Client.put_item(TableName=self.TableName, Item=Item, ConditionExpression=self.IsNewer(Item) & Changed,
+                                                ReturnValues='ALL_OLD', ReturnValuesOnConditionCheckFailure='ALL_OLD')
+                return 'Saved', Response.get('Attributes', {})
+            except ClientError as e:
+                if not IsConditionFailure(e): raise
+                Old = {Name:self.Deserializer.deserialize(Value) for (Name,Value) in e.response.get('Item', {}).items()}
+
+            if GetLastEvent(Old) >= Item['LastEventTimestamp']: return 'Stale', Old
+            if self.TouchAgentState(Item): return 'Unchanged', Old
+
+        raise RuntimeError(f'{Item["RecordType"]} kept changing while their state was being saved')
+
+    def TouchAgentState(self, Item):
+        #
+        # Move on the LastEventTimestamp, LastSeen and ExpiresAt of an agent
+        # whose stored state and routing profile are the same as Item's.
+        # Returns False if they aren't (or the stored event is newer).
+        #
+        if len(Item.get('RoutingProfile', '')) > 0:
+            Same = Attr('Value').eq(Item['Value']) & Attr('RoutingProfile').eq(Item['RoutingProfile'])
+        else:
+            Same = Attr('Value').eq(Item['Value']) & Attr('RoutingProfile').not_exists()
+
+        try:
+            self.Client.update_item(TableName=self.TableName, Key={'Identifier':Item['Identifier'], 'RecordType':Item['RecordType']},
+                                    UpdateExpression='SET LastEventTimestamp = :Timestamp, LastSeen = :Now, ExpiresAt = :Expires',
+                                    ConditionExpression=self.IsNewer(Item) & Same,
+                                    ExpressionAttributeValues={':Timestamp':Item['LastEventTimestamp'], ':Now':Item['LastSeen'], ':Expires':Item['ExpiresAt']})
+        except ClientError as e:
+            if IsConditionFailure(e): return False
+            raise
+
+        return True
+
+    def IsNewer(self, Item):
+        Timestamp = Item['LastEventTimestamp']
+        return Attr('LastEventTimestamp').lt(Timestamp) | \
+               (Attr('LastEventTimestamp').not_exists() & (Attr('EventTimestamp').not_exists() | Attr('EventTimestamp').lt(Timestamp)))
+
+    def RefreshAgent(self, Identifier, RecordType, LastSeen, ExpiresAt):
+        #
+        # Push back when a stored agent expires, unless they have logged out.
+        #
+        try:
+            self.Client.update_item(TableName=self.TableName, Key={'Identifier':Identifier, 'RecordType':RecordType},
+                                    UpdateExpression='SET LastSeen = :Now, ExpiresAt = :Expires',
+                                    ConditionExpression=Attr('RecordType').exists() & Attr('Value').ne('Logout'),
+                                    ExpressionAttributeValues={':Now':LastSeen, ':Expires':ExpiresAt})
+        except ClientError as e:
+            if IsConditionFailure(e): return False
+            raise
+
+        return True
+
+    def GetAgentARN(self, AgentARN):
+        return self.GetItem('AgentARN', AgentARN)
+
+class DynamoDBWriter:
+    #
+    # Writes are sent 25 at a time. DynamoDB may hand some back if it is
+    # busy so those are sent again (backing off each time) and anything still
+    # left over is counted in Failed.
+    #
+    def __init__(self, Store):
+        self.Store    = Store
+        self.Requests = {}
+        self.Failed   = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, Type, Value, Traceback):
+        self.Flush()
+        return False
+
+    def Put(self, Item):
+        self.Add((Item['Identifier'], Item['RecordType']), {'PutRequest':{'Item':Item}})
+
+    def Delete(self, Identifier, RecordType):
+        self.Add((Identifier, RecordType), {'DeleteRequest':{'Key':{'Identifier':Identifier, 'RecordType':RecordType}}})
+
+    def Add(self, ItemKey, Request):
+        self.Requests[ItemKey] = Request # DynamoDB won't take two writes to the same item in one batch - the last one wins
+        if len(self.Requests) >= BatchSize: self.Flush()
+
+    def Flush(self):
+        Requests = list(self.Requests.values())
+        self.Requests = {}
+        for Attempt in range(0, MaxRetries):
+            if len(Requests) == 0: return
+            if Attempt > 0: time.sleep(min(0.05*(2**Attempt), 2))
+            Response = self.Store.Client.batch_write_item(RequestItems={self.Store.TableName:Requests})
+            Requests = Response.get('UnprocessedItems', {}).get(self.Store.TableName, [])
+
+        self.Failed += len(Requests)
+
+def ItemSize(Item):
+    #
+    # Close enough to DynamoDB's idea of item size for counting capacity.
+    #
+    Size = 0
+    for Name in Item:
+        Value = Item[Name]
+        Size += len(Name)
+        if isinstance(Value, str):
+            Size += len(Value.encode('utf-8'))
+        elif isinstance(Value, (bytes, bytearray)):
+            Size += len(Value)
+        elif isinstance(Value, (int, float, Decimal)):
+            Size += len(str(Value))
+        else:
+            Size += len(json.dumps(Value, default=str))
+
+    return Size
+
+class LocalStore:
+    #
+    # What the memory and SQLite stores have in common. The conditions the
+    # functions rely on are checked here, inside Atomic(), so they hold when
+    # several threads (or, for SQLite, processes) share the store. Every call
+    # is counted as the DynamoDB call it stands in for, along with the items
+    # and bytes read and written, so the benchmarks can see what the same
+    # work would cost in AWS. Latency adds a delay to each call to stand in
+    # for the network round trip. The stores provide Get, Put, Remove,
+    # Partition, Prefixed, AllItems and Atomic.
+    #
+    def __init__(self, Latency=0.0):
+        self.Latency = Latency # Seconds added to every call
+        self.Lock    = threading.RLock()
+        self.Reset()
+
+    def Reset(self):
+        self.Calls        = {}
+        self.ItemsRead    = 0
+        self.BytesRead    = 0
+        self.ItemsWritten = 0
+        self.BytesWritten = 0
+        self.Writes       = {} # By partition
+        self.WriteUnits   = {} # By partition - DynamoDB charges a unit for each 1KB of an item written
+
+    def Stats(self):
+        return {'Calls':dict(self.Calls), 'TotalCalls':sum(self.Calls.values()),
+                'ItemsRead':self.ItemsRead, 'BytesRead':self.BytesRead,
+                'ItemsWritten':self.ItemsWritten, 'BytesWritten':self.BytesWritten,
+                'Writes':dict(self.Writes), 'WriteUnits':dict(self.WriteUnits)}
+
+    def Count(self, Call, Times=1):
+        with self.Lock:
+            self.Calls[Call] = self.Calls.get(Call, 0)+Times
+        if self.Latency > 0: time.sleep(self.Latency*Times)
+
+    def Read(self, Items):
+        with self.Lock:
+            for Item in Items:
+                self.ItemsRead += 1
+                self.BytesRead += self.Size(Item)
+        return Items
+
+    def Store(self, Item):
+        Size = ItemSize(Item)
+        with self.Lock:
+            self.ItemsWritten += 1
+            self.BytesWritten += Size
+            self.Writes[Item['Identifier']]     = self.Writes.get(Item['Identifier'], 0)+1
+            self.WriteUnits[Item['Identifier']] = self.WriteUnits.get(Item['Identifier'], 0)+max(1, math.ceil(Size/1024))
+        self.Put(copy.deepcopy(Item))
+
+    def Load(self, Items):
+        #
+        # Put items in the store without counting them.
+        #
+        with self.Atomic():
+            for Item in Items:
+                self.Put(copy.deepcopy(Item))
+
+    def Size(self, Item):
+        return ItemSize(Item)
+
+    def Paged(self, Call, Items):
+        #
+        # A query or scan takes a call for each 1MB of items.
+        #
+        self.Count(Call, max(1, math.ceil(sum(self.Size(Item) for Item in Items)/PageSize)))
+        return self.Read(Items)
+
+    def GetWallboard(self, WallboardName):
+        return self.Paged('Query', self.Partition(WallboardName))
+
+    def GetDataSources(self):
+        return self.Paged('Scan', self.Prefixed('DataSource'))
+
+    def BumpVersion(self, WallboardName, RecordType):
+        self.Count('UpdateItem')
+        with self.Atomic():
+            Item = self.Get(WallboardName, RecordType) or {'Identifier':WallboardName, 'RecordType':RecordType}
+            Item['ConfigVersion'] = Item.get('ConfigVersion', 0)+1
+            Item['Updated']       = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            self.Store(Item)
+
+        return Item['ConfigVersion']
+
+    def CreateTable(self):
+        return False # Nothing to create
+
+    def GetItem(self, Identifier, RecordType, Consistent=False):
+        self.Count('GetItem')
+        Item = self.Get(Identifier, RecordType)
+        if Item is not None: self.Read([Item])
+        return Item
+
+    def GetItems(self, Keys, Consistent=False):
+        self.Count('BatchGetItem', math.ceil(len(Keys)/MaxBatchKeys))
+        Items = [self.Get(Identifier, RecordType) for (Identifier,RecordType) in Keys]
+        return self.Read([Item for Item in Items if Item is not None])
+
+    def GetPartition(self, Identifier, AgentsOnly=False):
+        return self.Paged('Query', self.Partition(Identifier, AgentsOnly))
+
+    def PutItem(self, Item):
+        self.Count('PutItem')
+        with self.Atomic():
+            self.Store(Item)
+
+    def PutIfMissing(self, Item):
+        self.Count('PutItem')
+        with self.Atomic():
+            if self.Get(Item['Identifier'], Item['RecordType']) is not None: return False
+            self.Store(Item)
+
+        return True
+
+    def Writer(self):
+        return LocalWriter(self)
+
+    def LoadSnapshot(self, RecordType):
+        Item = self.GetItem('Snapshot', RecordType, True)
+        if Item is None: return 0, None
+
+        return int(Item['Version']), bytes(Item['Snapshot'])
+
+    def SaveSnapshot(self, RecordType, Version, Packed):
+        self.Count('PutItem')
+        with self.Atomic():
+            Old = self.Get('Snapshot', RecordType)
+            if (0 if Old is None else int(Old['Version'])) != Version: return False
+            self.Store({'Identifier':'Snapshot', 'RecordType':RecordType, 'Version':Version+1, 'Updated':int(time.time()), 'Snapshot':Packed})
+
+        return True
+
+    def SaveAgentState(self, Item):
+        self.Count('PutItem')
+        with self.Atomic():
+            Old = self.Get(Item['Identifier'], Item['RecordType']) or {}
+            if 'LastEventTimestamp' in Item:
+                if GetLastEvent(Old) >= Item['LastEventTimestamp']: return 'Stale', Old
+                if IsSameState(Old, Item):
+                    self.Count('UpdateItem')
+                    self.Store(dict(Old, LastEventTimestamp=Item['LastEventTimestamp'], LastSeen=Item['LastSeen'], ExpiresAt=Item['ExpiresAt']))
+                    return 'Unchanged', Old
+            self.Store(Item)
+
+        return 'Saved', Old
+
+    def TouchAgentState(self, Item):
+        self.Count('UpdateItem')
+        with self.Atomic():
+            Old = self.Get(Item['Identifier'], Item['RecordType'])
+            if Old is None or GetLastEvent(Old) >= Item['LastEventTimestamp'] or not IsSameState(Old, Item): return False
+            self.Store(dict(Old, LastEventTimestamp=Item['LastEventTimestamp'], LastSeen=Item['LastSeen'], ExpiresAt=Item['ExpiresAt']))
+
+        return True
+
+    def RefreshAgent(self, Identifier, RecordType, LastSeen, ExpiresAt):
+        self.Count('UpdateItem')
+        with self.Atomic():
+            Item = self.Get(Identifier, RecordType)
+            if Item is None or Item.get('Value') == 'Logout': return False
+            Item['LastSeen']  = LastSeen
+            Item['ExpiresAt'] = ExpiresAt
+            self.Store(Item)
+
+        return True
+
+    def GetAgentARN(self, AgentARN):
+        return self.GetItem('AgentARN', AgentARN)
+
+class LocalWriter:
+    #
+    # Counted as a BatchWriteItem for each 25 items, like DynamoDBWriter.
+    #
+    def __init__(self, Store):
+        self.Store    = Store
+        self.Requests = {}
+        self.Failed   = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, Type, Value, Traceback):
+        self.Flush()
+        return False
+
+    def Put(self, Item):
+        self.Add((Item['Identifier'], Item['RecordType']), Item)
+
+    def Delete(self, Identifier, RecordType):
+        self.Add((Identifier, RecordType), None)
+
+    def Add(self, ItemKey, Item):
+        self.Requests[ItemKey] = Item
+        if len(self.Requests) >= BatchSize: self.Flush()
+
+    def Flush(self):
+        if len(self.Requests) == 0: return
+
+        self.Store.Count('BatchWriteItem')
+        with self.Store.Atomic():
+            for ((Identifier,RecordType),Item) in self.Requests.items():
+                if Item is None:
+                    self.Store.Remove(Identifier, RecordType)
+                else:
+                    self.Store.Store(Item)
+        self.Requests = {}
+
+class MemoryStore(LocalStore):
+    def __init__(self, Latency=0.0):
+        self.Items = {}
+        self.Sizes = {} # Worked out once when each item is stored
+        LocalStore.__init__(self, Latency)
+
+    def Atomic(self):
+        return self.Lock
+
+    def Get(self, Identifier, RecordType):
+        with self.Lock:
+            Item = self.Items.get(Identifier, {}).get(RecordType)
+            return copy.deepcopy(Item) if Item is not None else None
+
+    def Put(self, Item):
+        with self.Lock:
+            if Item['Identifier'] not in self.Items: self.Items[Item['Identifier']] = {}
+            self.Items[Item['Identifier']][Item['RecordType']] = Item
+            self.Sizes[(Item['Identifier'], Item['RecordType'])] = ItemSize(Item)
+
+    def Remove(self, Identifier, RecordType):
+        with self.Lock:
+            self.Items.get(Identifier, {}).pop(RecordType, None)
+            self.Sizes.pop((Identifier, RecordType), None)
+
+    def Size(self, Item):
+        Size = self.Sizes.get((Item['Identifier'], Item['RecordType']))
+        return Size if Size is not None else ItemSize(Item)
+
+    def Partition(self, Identifier, AgentsOnly=False):
+        with self.Lock:
+            Items = [self.Items[Identifier][RecordType] for RecordType in sorted(self.Items.get(Identifier, {}))]
+            return [copy.deepcopy(Item) for Item in Items if not AgentsOnly or 'AgentARN' in Item]
+
+    def Prefixed(self, Prefix):
+        with self.Lock:
+            return [copy.deepcopy(Item) for Partition in self.Items.values() for Item in Partition.values() if Item['RecordType'].startswith(Prefix)]
+
+    def AllItems(self):
+        with self.Lock:
+            return [copy.deepcopy(Item) for Partition in self.Items.values() for Item in Partition.values()]
+
+class SQLiteTransaction:
+    #
+    # Holds the write lock on the database for a read followed by a write so
+    # that conditional writes work across processes too.
+    #
+    def __init__(self, Store):
+        self.Store = Store
+
+    def __enter__(self):
+        self.Store.Lock.acquire()
+        self.Store.Depth += 1
+        if self.Store.Depth == 1: self.Store.Connection.execute('BEGIN IMMEDIATE')
+        return self
+
+    def __exit__(self, Type, Value, Traceback):
+        self.Store.Depth -= 1
+        if self.Store.Depth == 0:
+            if Type is None:
+                self.Store.Connection.execute('COMMIT')
+            else:
+                self.Store.Connection.execute('ROLLBACK')
+        self.Store.Lock.release()
+        return False
+
+class SQLiteStore(LocalStore):
+    #
+    # Items are kept whole (as JSON) with the key in their own columns. The
+    # primary key means reading a wallboard, a data partition or an agent's
+    # ARN mapping is an indexed read, and there are indexes on the sort key
+    # (so data sources can be found across all wallboards) and on the agent
+    # ARN (so only agents are read from a partition when that's all we want).
+    #
+    def __init__(self, FileName, Latency=0.0):
+        self.Connection = sqlite3.connect(FileName, check_same_thread=False, isolation_level=None, timeout=30)
+        self.Connection.execute('PRAGMA journal_mode=WAL')
+        self.Connection.execute('CREATE TABLE IF NOT EXISTS Items (Identifier TEXT NOT NULL, RecordType TEXT NOT NULL, AgentARN TEXT, Item TEXT NOT NULL, PRIMARY KEY (Identifier, RecordType)) WITHOUT ROWID')
+        self.Connection.execute('CREATE INDEX IF NOT EXISTS ItemsByRecordType ON Items (RecordType)')
+        self.Connection.execute('CREATE INDEX IF NOT EXISTS ItemsByAgentARN ON Items (Identifier, AgentARN) WHERE AgentARN IS NOT NULL')
+        self.Depth = 0
+        LocalStore.__init__(self, Latency)
+
+    def Atomic(self):
+        return SQLiteTransaction(self)
+
+    def Encode(self, Item):
+        return json.dumps(Item, default=EncodeValue, separators=(',',':'))
+
+    def Decode(self, Text):
+        return json.loads(Text, object_hook=DecodeValue)
+
+    def Rows(self, SQL, Parameters):
+        with self.Lock:
+            return [self.Decode(Row[0]) for Row in self.Connection.execute(SQL, Parameters).fetchall()]
+
+    def Get(self, Identifier, RecordType):
+        Rows = self.Rows('SELECT Item FROM Items WHERE Identifier = ? AND RecordType = ?', (Identifier, RecordType))
+        return Rows[0] if len(Rows) > 0 else None
+
+    def Put(self, Item):
+        with self.Lock:
+            self.Connection.execute('INSERT OR REPLACE INTO Items (Identifier, RecordType, AgentARN, Item) VALUES (?, ?, ?, ?)',
+                                    (Item['Identifier'], Item['RecordType'], Item.get('AgentARN'), self.Encode(Item)))
+
+    def Remove(self, Identifier, RecordType):
+        with self.Lock:
+            self.Connection.execute('DELETE FROM Items WHERE Identifier = ? AND RecordType = ?', (Identifier, RecordType))
+
+    def Partition(self, Identifier, AgentsOnly=False):
+        if AgentsOnly:
+            return self.Rows('SELECT Item FROM Items WHERE Identifier = ? AND AgentARN IS NOT NULL ORDER BY RecordType', (Identifier,))
+
+        return self.Rows('SELECT Item FROM Items WHERE Identifier = ? ORDER BY RecordType', (Identifier,))
+
+    def Prefixed(self, Prefix):
+        return self.Rows('SELECT Item FROM Items WHERE RecordType >= ? AND RecordType < ?', (Prefix, Prefix+'\U0010ffff'))
+
+    def AllItems(self):
+        return self.Rows('SELECT Item FROM Items', ())
+
+def EncodeValue(Value):
+    #
+    # JSON can't hold binary or Decimal values so they are tagged.
+    #
+    if isinstance(Value, (bytes, bytearray)): return {'__B':base64.b64encode(bytes(Value)).decode('ascii')}
+    if isinstance(Value, Decimal): return int(Value) if Value == Value.to_integral_value() else float(Value)
+    if isinstance(Value, set): return {'__SS':sorted(Value)}
+    raise TypeError(f'Cannot store {type(Value).__name__}')
+
+def DecodeValue(Object):
+    if '__B' in Object and len(Object) == 1: return base64.b64decode(Object['__B'])
+    if '__SS' in Object and len(Object) == 1: return set(Object['__SS'])
+    return Object
+
+def OpenStore(Store, TableName):
+    #
+    # Stores are opened once per process so that everything in it (the
+    # benchmarks load all of the functions together) shares the same items.
+    #
+    with StoreLock:
+        if (Store, TableName) in Stores: return Stores[(Store, TableName)]
+
+        if Store == 'dynamodb':
+            Opened = DynamoDBStore(TableName)
+        elif Store == 'memory':
+            Opened = MemoryStore()
+        elif Store.startswith('sqlite:'):
+            Opened = SQLiteStore(Store[7:])
+        else:
+            raise ValueError(f'Unknown WallboardStore {Store} - use dynamodb, memory or sqlite:<file>')
+
+        Stores[(Store, TableName)] = Opened
+        return Opened
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# The Lambda functions (and the import utility) are loaded the way Lambda
+# would load them, each under its own module name, with the in-memory store
+# and without the metric lines. Run the tests from the top of the repo with:
+#
+#   python3 -m pytest tests
+#
+
+import os
+import sys
+import signal
+import importlib.util
+import pytest
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(Root, 'storage', 'python'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ['WallboardStore']  = 'memory'
+os.environ['MetricNamespace'] = ''
+
+def LoadModule(Name, FileName):
+    Spec   = importlib.util.spec_from_file_location(Name, os.path.join(Root, FileName))
+    Module = importlib.util.module_from_spec(Spec)
+    Spec.loader.exec_module(Module)
+    return Module
+
+@pytest.fixture(scope='module')
+def Historical():
+    return LoadModule('get_historical_metrics', os.path.join('get-historical-metrics', 'lambda_function.py'))
+
+@pytest.fixture(scope='module')
+def Import(tmp_path_factory):
+    #
+    # The import utility does its work when it is loaded, so it is given a
+    # small definition (without any sources, so Connect isn't called) and a
+    # SQLite store of its own.
+    #
+    Folder = tmp_path_factory.mktemp('import')
+    Definition = Folder / 'board.yaml'
+    Definition.write_text('Identifier: Board\nRows:\n  - Row: 1\n    Cells:\n      - Cell: 1\n        Text: Hello\n')
+
+    Saved = (sys.argv, os.environ['WallboardStore'], signal.getsignal(signal.SIGINT))
+    sys.argv = ['wallboard-import.py', str(Definition)]
+    os.environ['WallboardStore'] = f'sqlite:{Folder / "wallboard.db"}'
+    try:
+        return LoadModule('wallboard_import', 'wallboard-import.py')
+    finally:
+        (sys.argv, os.environ['WallboardStore']) = Saved[:2]
+        signal.signal(signal.SIGINT, Saved[2])
+
+@pytest.fixture(scope='module')
+def Render():
+    return LoadModule('render_wallboard', os.path.join('render-wallboard', 'lambda_function.py'))
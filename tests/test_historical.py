@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+import wallboardstore
+import wallboarddata
+
+Instance = '12345678-1234-1234-1234-123456789012'
+Queue    = '87654321-4321-4321-4321-210987654321'
+
+def test_SplitReference(Historical):
+    assert Historical.SplitReference(f'{Instance}:{Queue}:CONTACTS_ABANDONED') == (Instance, Queue, 'CONTACTS_ABANDONED', 0)
+    assert Historical.SplitReference(f'{Instance}:{Queue}:CONTACTS_ABANDONED@30m') == (Instance, Queue, 'CONTACTS_ABANDONED', 30)
+    assert Historical.SplitReference(f'{Instance}:{Queue}:SERVICE_LEVEL@60') == (Instance, Queue, 'SERVICE_LEVEL', 60)
+
+def test_SplitReferenceErrors(Historical):
+    for Reference in [f'{Instance}:{Queue}:CONTACTS_ABANDONED@soon', f'{Instance}:CONTACTS_ABANDONED']:
+        try:
+            Historical.SplitReference(Reference)
+        except ValueError:
+            continue
+        assert False, f'{Reference} should not parse'
+
+def test_NewWindowLeftBlank(Historical, monkeypatch):
+    #
+    # A new rolling window shows nothing (rather than 0) until the bucket at
+    # the start of its window has been collected.
+    #
+    for Name in ['Data', 'Results', 'Buckets', 'LastFetched', 'Refresh']:
+        monkeypatch.setattr(Historical, Name, {})
+    monkeypatch.setattr(Historical, 'DataSources', {'Abandoned':f'{Instance}:{Queue}:CONTACTS_ABANDONED',
+                                                    'Abandoned30':f'{Instance}:{Queue}:CONTACTS_ABANDONED@30m'})
+
+    Connect = boto3.client('connect')
+    Stub    = Stubber(Connect)
+    Stub.add_response('get_metric_data', {'MetricResults':[{'Dimensions':{'Queue':{'Id':Queue, 'Arn':f'arn:aws:connect:us-east-1:123456789012:instance/{Instance}/queue/{Queue}'}},
+                                                            'Collections':[{'Metric':{'Name':'CONTACTS_ABANDONED', 'Unit':'COUNT', 'Statistic':'SUM'}, 'Value':7}]}]})
+    Stub.activate()
+    monkeypatch.setattr(Historical.boto3, 'client', lambda Service: Connect)
+
+    Historical.GetHistoricalData()
+    Slot = 739000*Historical.SlotsPerDay+120 # 10am, so the window starts on the same day
+    Historical.UpdateBuckets(Slot)
+    Historical.CalculateWindows(Slot)
+    assert Historical.Data['Abandoned'] == '7'
+    assert 'Abandoned30' not in Historical.Data
+
+    #
+    # Once the start bucket is there the window is the difference.
+    #
+    StartSlot = Slot-30//Historical.BucketMinutes
+    Historical.Buckets[f'{Instance}:{Queue}:CONTACTS_ABANDONED'][StartSlot%Historical.BucketCount] = [StartSlot, 4]
+    Historical.CalculateWindows(Slot)
+    assert Historical.Data['Abandoned30'] == '3'
+
+@pytest.mark.parametrize('Values', [
+    [],
+    [0],
+    [0, 0, 0],
+    [-1, -64, -65, 63, 64, -8192, 8191, 8192],
+    [5, -5, 5, -5],
+    [2**31, -2**31, 2**40, 0, 2**63, -2**63, 2**64+7, -2**70],
+    list(range(0, 288)),
+])
+def test_SampleRoundTrip(Historical, Render, Values):
+    Packed = Historical.EncodeSamples(Values)
+    assert Historical.DecodeSamples(Packed) == Values
+    assert Render.DecodeSamples(Packed) == Values # The render function reads them too
+
+def test_SampleEncoding(Historical):
+    #
+    # Small differences either way take one byte each.
+    #
+    assert Historical.EncodeSamples([]) == b''
+    assert Historical.EncodeSamples([0, 1, 0, 63, -1]) == bytes([0, 2, 1, 126, 127])
+    assert Historical.EncodeSamples([64]) == bytes([0x80, 0x01])
+
+def test_EmptySnapshot(Historical):
+    #
+    # With no sources an empty snapshot is written once so that the render
+    # function isn't left reading every record.
+    #
+    Store   = wallboardstore.MemoryStore()
+    Written = {}
+    assert wallboarddata.WriteSnapshot(Store, Historical.Metrics, 'Data', {}, {}, Written)
+    assert Store.LoadSnapshot('Data')[1] is not None
+    assert Store.Stats()['Calls'].get('PutItem', 0)+Store.Stats()['Calls'].get('UpdateItem', 0) == 1
+
+    Store.Reset()
+    assert wallboarddata.WriteSnapshot(Store, Historical.Metrics, 'Data', {}, {}, Written)
+    assert Store.Stats()['Calls'] == {'GetItem':1}
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import json
+import zlib
+import pytest
+from botocore.exceptions import NoCredentialsError
+
+class NoCredentialsStore:
+    def Writer(self):
+        return self
+
+    def __enter__(self):
+        raise NoCredentialsError()
+
+    def __exit__(self, *Details):
+        return False
+
+def test_NoCredentials(Import, monkeypatch, capsys):
+    #
+    # The batches are written on worker threads - the error has to come back
+    # to the main thread to stop the import.
+    #
+    monkeypatch.setattr(Import, 'Store', NoCredentialsStore())
+    Requests = [{'PutRequest':{'Item':{'Identifier':{'S':'Board'}, 'RecordType':{'S':f'Cell#R1C{Cell}'}}}} for Cell in range(60)]
+    with pytest.raises(SystemExit) as Exit:
+        Import.SaveToDynamoDB({'Board':Requests})
+    assert Exit.value.code == 1
+    assert capsys.readouterr().out == 'FATAL: No AWS credentials could be found\n'
+
+def Definition(Folder, Cells):
+    File = Folder / 'board.yaml'
+    File.write_text('Identifier: Board\nRows:\n  - Row: 1\n    Cells:\n' + ''.join(f'      - Cell: {Cell}\n        Text: {Text}\n' for (Cell,Text) in enumerate(Cells, 1)))
+    return File
+
+def test_GetChanges(Import, tmp_path):
+    #
+    # The fixture has already imported "Hello" into R1C1 - importing it again
+    # writes nothing, and only the cells that differ are written or removed.
+    #
+    (WallboardName, Items) = Import.GetWallboardItems(str(Definition(tmp_path, ['Hello'])))
+    Existing = Import.GetExistingItems(WallboardName)
+    assert 'Version' in Existing
+    assert Import.GetChanges(Items, Existing) == ([], len(Items))
+
+    (WallboardName, Items) = Import.GetWallboardItems(str(Definition(tmp_path, ['Goodbye'])))
+    (Requests, Unchanged) = Import.GetChanges(Items, Existing)
+    assert [Request['PutRequest']['Item']['RecordType']['S'] for Request in Requests] == ['Cell#R1C1', 'Compiled']
+    assert Unchanged == len(Items)-2
+
+    (WallboardName, Items) = Import.GetWallboardItems(str(Definition(tmp_path, ['Hello', 'There'])))
+    (Requests, Unchanged) = Import.GetChanges(Items, Existing)
+    assert sorted(Request['PutRequest']['Item']['RecordType']['S'] for Request in Requests) == ['Cell#R1C2', 'Compiled', 'Settings']
+
+    #
+    # Records that are no longer in the definition are removed, apart from
+    # the version record.
+    #
+    Existing['Cell#R9C9'] = {'Identifier':{'S':WallboardName}, 'RecordType':{'S':'Cell#R9C9'}, 'Text':{'S':'Old'}}
+    (Requests, Unchanged) = Import.GetChanges(Items, Existing)
+    assert [Request['DeleteRequest']['Key'] for Request in Requests if 'DeleteRequest' in Request] == [{'Identifier':{'S':WallboardName}, 'RecordType':{'S':'Cell#R9C9'}}]
+
+def test_KeyRecords(Import, capsys):
+    Records = [{'Name':{'S':'Busy'}, 'Formula':{'S':'a+b'}}, {'Name':{'S':'Quiet'}, 'Formula':{'S':'c'}}, {'Name':{'S':'Busy'}, 'Formula':{'S':'a*b'}}]
+    Items   = Import.KeyRecords('Board', Records, 'Calculation')
+    assert list(Items) == ['Calculation#Busy', 'Calculation#Quiet']
+    assert Items['Calculation#Busy'] == {'Name':{'S':'Busy'}, 'Formula':{'S':'a*b'}, 'Identifier':{'S':'Board'}, 'RecordType':{'S':'Calculation#Busy'}}
+    assert capsys.readouterr().out == 'Board: Calculation Busy is defined more than once - using the last one\n'
+
+    assert list(Import.KeyRecords('Board', [{}], 'Settings')) == ['Settings']
+
+def test_CompileWallboard(Import, Render, tmp_path, monkeypatch):
+    File = tmp_path / 'compiled.yaml'
+    File.write_text('''Identifier: CompiledBoard
+Calculations:
+  - Calculation: Total
+    Formula: Waiting+Handled*2
+Thresholds:
+  - Threshold: Busy
+    Reference: Total
+    WarnAbove: 5
+    AlertAbove: 10.5
+AgentStates:
+  - State: Available
+    Colour: Green
+Sources:
+  - Source: Waiting
+    Reference: instance:queue:CONTACTS_IN_QUEUE
+  - Source: Handled
+    Reference: instance:queue:CONTACTS_HANDLED
+Rows:
+  - Row: 1
+    Cells:
+      - Cell: 1
+        Reference: Total
+        ThresholdReference: Busy
+''')
+    monkeypatch.setattr(Import, 'QueueCache', {'instance':['queue']}) # So Connect isn't asked
+    (WallboardName, Items) = Import.GetWallboardItems(str(File))
+
+    Compiled = Import.Untyped(Items['Compiled'])
+    assert (Compiled['RecordType'], Compiled['Format']) == ('Compiled', Import.CompiledFormat)
+    Artifact = json.loads(zlib.decompress(Compiled['Artifact']))
+    assert Artifact['Settings']['Font'] == 'sans-serif' # Defaults are filled in
+    assert Artifact['Settings']['Rows'] == '1'
+    assert Artifact['Cells'] == {'R1C1':{'Address':'R1C1', 'Reference':'Total', 'ThresholdReference':'Busy'}}
+    assert Artifact['Thresholds'] == {'Busy':{'Name':'Busy', 'Reference':'Total', 'WarnAbove':5, 'AlertAbove':10.5}}
+    assert Artifact['Calculations'] == {'Total':'Waiting+Handled*2'}
+    assert Artifact['Formulas'] == {'Total':['Waiting', '+', 'Handled', '*', '2']}
+    assert Artifact['AgentStates'] == {'available':'green'} # Matched without case
+    assert Artifact['DataSources'] == {'Waiting':'instance:queue:CONTACTS_IN_QUEUE', 'Handled':'instance:queue:CONTACTS_HANDLED'}
+
+    #
+    # And the render function can read it.
+    #
+    Render.Store.PutItem(Compiled)
+    assert Render.LoadCompiledConfiguration(WallboardName)
+    assert Render.Thresholds[WallboardName] == Artifact['Thresholds']
+    assert Render.DataSources[WallboardName] == {'Waiting':'instance:queue:CONTACTS_IN_QUEUE'}
+    assert Render.TrendSources[WallboardName] == {'Handled'} # Historical metrics come from the poller
+
+def test_CompileWallboardLimits(Import, monkeypatch, capsys):
+    Items = Import.KeyRecords('Board', [{'Name':{'S':'Busy'}, 'Reference':{'S':'Total'}, 'WarnAbove':{'S':'lots'}}], 'Threshold')
+    with pytest.raises(SystemExit):
+        Import.CompileWallboard('Board', Items)
+    assert capsys.readouterr().out == 'WarnAbove in threshold Busy must be a number\n'
+
+    #
+    # A board too big for one item is left for the render function to read
+    # record by record.
+    #
+    monkeypatch.setattr(Import, 'MaxCompiledSize', 10)
+    assert Import.CompileWallboard('Board', Import.KeyRecords('Board', [{'Address':{'S':'R1C1'}, 'Text':{'S':'Hello'}}], 'Cell')) is None
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+#
+# Copyright 2026 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import json
+import struct
+import pytest
+
+def Unpack(Packed):
+    #
+    # The decoder from wallboard-msgpack-example.html.
+    #
+    Position = 0
+
+    def Take(Format):
+        nonlocal Position
+        Value = struct.unpack_from(Format, Packed, Position)[0]
+        Position += struct.calcsize(Format)
+        return Value
+
+    def Text(Length):
+        nonlocal Position
+        Position += Length
+        return Packed[Position-Length:Position].decode('utf-8')
+
+    def Read():
+        Code = Take('>B')
+        if Code < 0x80:  return Code
+        if Code < 0x90:  return {Read():Read() for Index in range(0, Code & 0x0f)}
+        if Code < 0xa0:  return [Read() for Index in range(0, Code & 0x0f)]
+        if Code < 0xc0:  return Text(Code & 0x1f)
+        if Code >= 0xe0: return Code-0x100
+        Scalars = {0xcb:'>d', 0xcc:'>B', 0xcd:'>H', 0xce:'>I', 0xcf:'>Q', 0xd0:'>b', 0xd1:'>h', 0xd2:'>i', 0xd3:'>q'}
+        if Code in Scalars: return Take(Scalars[Code])
+        if Code in (0xd9, 0xda, 0xdb): return Text(Take({0xd9:'>B', 0xda:'>H', 0xdb:'>I'}[Code]))
+        if Code in (0xdc, 0xdd): return [Read() for Index in range(0, Take('>H' if Code == 0xdc else '>I'))]
+        if Code in (0xde, 0xdf): return {Read():Read() for Index in range(0, Take('>H' if Code == 0xde else '>I'))}
+        return {0xc0:None, 0xc2:False, 0xc3:True}[Code]
+
+    Value = Read()
+    assert Position == len(Packed)
+    return Value
+
+#
+# Shaped like a JSON response, with values that need each of the longer
+# headers as well.
+#
+Wallboard = {
+    'Settings':{'TextColour':'black', 'Columns':'2', 'AgentStateList':{'available':'green', 'lunch':'red'}},
+    'AgentCount':70000,
+    'AgentStates':{f'agent{Agent:05}':{'FullAgentName':f'Agent {Agent}', 'AgentState':'Available' if Agent%2 else 'Lunch', 'TimeInState':'0:01:00'} for Agent in range(0, 300)},
+    'WallboardData':{'R1C1':{'Text':'Café ☕', 'Value':'-3'}, 'R1C2':{'Value':'007', 'Trend':[0, -1, -32, -33, 127, 128, 255, 256, 65535, 65536, 2**32, -129, -32769, -2**31-1, 2**63, 1.5, -0.25]},
+                      'R2C1':{'Text':'x'*31, 'Value':'y'*32}, 'R2C2':{'Text':'z'*256, 'Value':'w'*65536, 'Flags':[None, True, False], 'Empty':{}, 'List':list(range(0, 16))}}
+}
+
+def test_MessagePackRoundTrip(Render, monkeypatch):
+    monkeypatch.setattr(Render, 'msgpack', None)
+    monkeypatch.setattr(Render, 'GetWallboardJSON', lambda WallboardName, TrendFlag=False, AgentOptions={}: Wallboard)
+    assert Unpack(Render.RenderMessagePack('Board')) == Wallboard
+    assert Unpack(Render.RenderMessagePack('Board')) == json.loads(Render.RenderJSON('Board'))
+
+def test_MessagePackLibrary(Render, monkeypatch):
+    #
+    # The msgpack package (when it is installed) has to give the same bytes.
+    #
+    msgpack = pytest.importorskip('msgpack')
+    monkeypatch.setattr(Render, 'msgpack', None)
+    monkeypatch.setattr(Render, 'GetWallboardJSON', lambda WallboardName, TrendFlag=False, AgentOptions={}: Wallboard)
+    assert Render.RenderMessagePack('Board') == msgpack.packb(Wallboard)
@@ -22,23 +22,51 @@ import sys
 import signal
 import os
 import time
+import json
+import zlib
+import math
+import re
 import boto3
-from botocore.exceptions import NoCredentialsError
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer, Binary
+from botocore.exceptions import NoCredentialsError, OperationNotPageableError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 #
 # Global variables
 #
-Dynamo       = boto3.client('dynamodb')
 DDBTableName = os.environ.get('WallboardTable', 'ConnectWallboard')
+WallboardStore = os.environ.get('WallboardStore', 'dynamodb') # dynamodb or sqlite:<file> - see storage/python/wallboardstore.py
+if WallboardStore == 'memory':
+    print('The memory store only lasts as long as this utility runs - use dynamodb or sqlite:<file>')
+    sys.exit(1)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage', 'python'))
+import wallboardstore
+Store = wallboardstore.OpenStore(WallboardStore, DDBTableName)
+BatchSize    = 25 # Most items DynamoDB will take in one batch write
+MaxThreads   = 8  # Number of batch writes we send at the same time
+
+QueueCacheFile = os.environ.get('QueueCacheFile', '')
+QueueCacheAge  = int(os.environ.get('QueueCacheAge', '3600'))
+QueueCache     = {}
+Connect        = None
+Boto3Warning   = False
+
+VersionRecord  = 'Version'
+CompiledRecord = 'Compiled'
+CompiledFormat = 1
+MaxCompiledSize = 350000 # DynamoDB items can't be bigger than 400KB
 
-Settings     = {}
-Calculations = []
-Thresholds   = []
-AgentStates  = {}
-Cells        = []
-DataSources  = []
-MaxColumns   = 0
-MaxRows      = 0
+#
+# These must match the defaults in the render function
+#
+DefaultSettings = {
+    'AlertBackgroundColour': 'red', 
+    'WarningBackgroundColour': 'yellow', 
+    'TextColour': 'black', 
+    'Font': 'sans-serif',
+    'BackgroundColour': 'lightgrey'
+}
+RecordKeys    = {'Threshold':'Name', 'Calculation':'Name', 'Cell':'Address', 'AgentState':'StateName', 'DataSource':'Name'}
 
 #
 # Function definitions
@@ -110,51 +138,120 @@ def GetAgentStates(AgentConfig):
 
     return StateColours
 
+def FetchQueues(InstanceId):
+    global Connect
+
+    #
+    # Get every queue in the instance - a page only holds a hundred or so,
+    # so big instances need several calls.
+    #
+    QueueList = []
+    Paginator = Connect.get_paginator('list_queues')
+    for Page in Paginator.paginate(InstanceId=InstanceId):
+        for Queue in Page['QueueSummaryList']:
+            QueueList.append(Queue['Id'])
+
+    return QueueList
+
+def GetQueueLists(InstanceIds):
+    global QueueCache,Connect
+
+    #
+    # Queue lists are kept for the whole run (so every board and every source
+    # on the same instance shares one lookup) and, if QueueCacheFile is set,
+    # on disk between runs for up to QueueCacheAge seconds.
+    #
+    if QueueCacheFile and len(QueueCache) == 0:
+        try:
+            with open(QueueCacheFile) as Input:
+                Saved = json.load(Input)
+            for InstanceId in Saved:
+                if Saved[InstanceId]['Fetched']+QueueCacheAge > time.time():
+                    QueueCache[InstanceId] = Saved[InstanceId]['Queues']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    Missing = [InstanceId for InstanceId in InstanceIds if InstanceId not in QueueCache]
+    if len(Missing) == 0: return QueueCache
+
+    if Connect is None: Connect = boto3.client('connect')
+
+    Fetched = {}
+    with ThreadPoolExecutor(max_workers=MaxThreads) as Executor:
+        Futures = {Executor.submit(FetchQueues, InstanceId):InstanceId for InstanceId in Missing}
+        for Future in as_completed(Futures):
+            InstanceId = Futures[Future]
+            try:
+                Fetched[InstanceId] = Future.result()
+            except NoCredentialsError:
+                print('FATAL: No AWS credentials could be found')
+                sys.exit(1)
+            except (AttributeError, OperationNotPageableError):
+                QueueCache[InstanceId] = False
+            except Exception as e:
+                print(f'Could not list queues for {InstanceId}: {e}')
+                QueueCache[InstanceId] = None
+
+    QueueCache.update(Fetched)
+
+    if QueueCacheFile and len(Fetched) > 0:
+        try:
+            with open(QueueCacheFile) as Input:
+                Saved = json.load(Input)
+        except (OSError, ValueError):
+            Saved = {}
+        for InstanceId in Fetched:
+            Saved[InstanceId] = {'Fetched':time.time(), 'Queues':Fetched[InstanceId]}
+        try:
+            with open(QueueCacheFile, 'w') as Output:
+                json.dump(Saved, Output)
+        except OSError as e:
+            print(f'Could not save queue cache: {e}')
+
+    return QueueCache
+
 def GetDataSources(SourceConfig):
-    Sources = []
-    Connect = boto3.client('connect')
-    Boto3Warning = False
+    global Boto3Warning
 
+    Sources    = []
+    References = []
 
     for Item in SourceConfig:
         SourceInfo = {}
         SourceInfo['Name']      = {'S':Item['Source']}
         SourceInfo['Reference'] = {'S':Item['Reference']}
+        if 'Refresh' in Item: SourceInfo['Refresh'] = {'S':str(Item['Refresh'])}
         Sources.append(SourceInfo)
 
-        #
-        # Just in case, check the references given and see if we can confirm
-        # if the queue and Connect instance exist. This helps if there is a
-        # typo in the definition file.
-        # 
         try:
             (InstanceId,QueueId,Metric) = Item['Reference'].split(':')
         except Exception as e:
             print(f'Check formatting of {Item["Source"]}: {e}')
             continue
 
-        try:
-            QueueResponse = Connect.list_queues(InstanceId=InstanceId)
-        except AttributeError:
+        References.append((Item['Source'], InstanceId, QueueId))
+
+    #
+    # Just in case, check the references given and see if we can confirm
+    # if the queue and Connect instance exist. This helps if there is a
+    # typo in the definition file.
+    # 
+    QueueLists = GetQueueLists(set([Reference[1] for Reference in References]))
+
+    for (Source,InstanceId,QueueId) in References:
+        if QueueLists[InstanceId] is False:
             if not Boto3Warning:
                 print('Could not get boto3 response - are you using the latest version?')
                 print(' -> Unable to verify if the reference values are correct')
                 Boto3Warning = True
             continue
-        except NoCredentialsError:
-            print('FATAL: No AWS credentials could be found')
-            sys.exit(1)
-        except Exception as e:
-            print(f'{Item["Source"]}: The InstanceId may be incorrect: {InstanceId}')
-            print(e)
+
+        if QueueLists[InstanceId] is None:
+            print(f'{Source}: The InstanceId may be incorrect: {InstanceId}')
             continue
-        
-        QueueList = []
-        for Queue in QueueResponse['QueueSummaryList']:
-            QueueList.append(Queue['Id'])
 
-        if QueueId not in QueueList:
-            print(f'{Item["Source"]}: The QueueId may be incorrect: {QueueId}')
+        if QueueId not in QueueLists[InstanceId]:
+            print(f'{Source}: The QueueId may be incorrect: {QueueId}')
 
     return Sources
 
@@ -198,52 +295,161 @@ def GetCells(RowConfig):
             if 'Rows'               in Cell: Item['Rows']               = {'S':str(Cell['Rows'])}
             if 'Cells'              in Cell: Item['Cells']              = {'S':str(Cell['Cells'])}
             if 'Format'             in Cell: Item['Format']             = {'S':str(Cell['Format'])}
+            if 'Trend'              in Cell: Item['Trend']              = {'S':str(Cell['Trend'])}
 
             Cells.append(Item)
 
     return Cells,Rows,Columns
 
-def SaveToDynamoDB(WallboardName,Records,RecordType):
-    global Dynamo
-
-    Count  = 0
+def KeyRecords(WallboardName,Records,RecordType):
+    Items = {}
 
+    #
+    # Each record is keyed on something that identifies it within the board
+    # (the cell address, threshold name and so on) rather than on its position
+    # in the file. That way adding or moving a row doesn't change the key of
+    # every record after it and we only need to write what has changed.
+    #
     for Item in Records:
         Item['Identifier'] = {'S':WallboardName}
         if RecordType != 'Settings':
-            Item['RecordType'] = {'S':f'{RecordType}{Count}'}
-            Count += 1
+            Item['RecordType'] = {'S':f'{RecordType}#{Item[RecordKeys[RecordType]]["S"]}'}
         else:
             Item['RecordType'] = {'S':RecordType}
 
-        try:
-            Dynamo.put_item(TableName=DDBTableName, Item=Item)
-        except NoCredentialsError:
-            print('FATAL: No AWS credentials could be found')
-            sys.exit(1)
-        except Exception as e:
-            print(f'DynamoDB error: {e}')
+        if Item['RecordType']['S'] in Items:
+            print(f'{WallboardName}: {RecordType} {Item[RecordKeys[RecordType]]["S"]} is defined more than once - using the last one')
+        Items[Item['RecordType']['S']] = Item
+
+    return Items
+
+def GetExistingItems(WallboardName):
+    global Store
+
+    #
+    # The records are built with DynamoDB types ({'S':...}) so what is stored
+    # is converted the same way before they are compared.
+    #
+    Serializer = TypeSerializer()
+    Existing   = {}
+    try:
+        for Item in Store.GetWallboard(WallboardName):
+            Existing[Item['RecordType']] = {Name:Serializer.serialize(Item[Name]) for Name in Item}
+    except NoCredentialsError:
+        print('FATAL: No AWS credentials could be found')
+        sys.exit(1)
+
+    return Existing
+
+def GetChanges(Items, Existing):
+    #
+    # Compare what we want the board to look like with what is already in
+    # DynamoDB. Anything new or different gets written; anything that isn't in
+    # the definition any more (including records from older versions of this
+    # utility which were numbered by position) gets removed.
+    #
+    Requests  = []
+    Unchanged = 0
+    for RecordType in Items:
+        if Existing.get(RecordType) == Items[RecordType]:
+            Unchanged += 1
+            continue
+        Requests.append({'PutRequest':{'Item':Items[RecordType]}})
+
+    for RecordType in Existing:
+        if RecordType == VersionRecord or RecordType in Items: continue
+        Requests.append({'DeleteRequest':{'Key':{'Identifier':Existing[RecordType]['Identifier'],
+                                                 'RecordType':Existing[RecordType]['RecordType']}}})
+
+    return Requests, Unchanged
+
+def Untyped(Item):
+    Deserializer = TypeDeserializer()
+    Item = {Name:Deserializer.deserialize(Item[Name]) for Name in Item}
+    return {Name:(Item[Name].value if isinstance(Item[Name], Binary) else Item[Name]) for Name in Item}
+
+def WriteBatch(Requests):
+    global Store
+
+    #
+    # Write up to 25 items at once. The store resends anything DynamoDB hands
+    # back because it is busy and tells us how many it couldn't write.
+    # A missing credentials error is left for SaveToDynamoDB to deal with on
+    # the main thread.
+    #
+    with Store.Writer() as Writer:
+        for Request in Requests:
+            if 'PutRequest' in Request:
+                Writer.Put(Untyped(Request['PutRequest']['Item']))
+            else:
+                Key = Untyped(Request['DeleteRequest']['Key'])
+                Writer.Delete(Key['Identifier'], Key['RecordType'])
+
+    return Writer.Failed
+
+def BumpVersion(WallboardName):
+    global Store
+
+    try:
+        return Store.BumpVersion(WallboardName, VersionRecord)
+    except Exception as e:
+        print(f'DynamoDB error: {e}')
+        return None
+
+def SaveToDynamoDB(Boards):
+    #
+    # Every board's changes are split into batches and all of the batches are
+    # written across a small pool of threads. Once the last batch for a board
+    # is done we bump its version record and note how long it took.
+    #
+    Finished = {}
+    Failed   = {}
+    Versions = {}
+    Pending  = {}
+    Start    = time.time()
+    with ThreadPoolExecutor(max_workers=MaxThreads) as Executor:
+        Futures = {}
+        for WallboardName in Boards:
+            Finished[WallboardName] = Start
+            Failed[WallboardName]   = 0
+            Versions[WallboardName] = None
+            Requests = Boards[WallboardName]
+            Pending[WallboardName]  = 0
+            for Position in range(0, len(Requests), BatchSize):
+                Futures[Executor.submit(WriteBatch, Requests[Position:Position+BatchSize])] = WallboardName
+                Pending[WallboardName] += 1
+
+        for Future in as_completed(Futures):
+            WallboardName = Futures[Future]
+            try:
+                Failed[WallboardName] += Future.result()
+            except NoCredentialsError:
+                for Waiting in Futures: Waiting.cancel()
+                print('FATAL: No AWS credentials could be found')
+                sys.exit(1)
+            except Exception as e:
+                print(f'DynamoDB error: {e}')
+                Failed[WallboardName] += BatchSize
+            Finished[WallboardName] = max(Finished[WallboardName], time.time())
+
+            #
+            # Only move the version on if everything was written - otherwise
+            # anything watching for it would pick up a half-updated board.
+            #
+            Pending[WallboardName] -= 1
+            if Pending[WallboardName] == 0 and Failed[WallboardName] == 0:
+                Versions[WallboardName] = BumpVersion(WallboardName)
+
+    return Finished, Failed, Versions, Start
 
 def CreateDDBTable():
-    global Dynamo
+    global Store
 
     try:
-        Response = Dynamo.describe_table(TableName=DDBTableName)
+        if Store.CreateTable(): print(f'Created table {DDBTableName}')
     except NoCredentialsError:
         print('FATAL: No AWS credentials could be found')
         sys.exit(1)
-    except:
-        Table = Dynamo.create_table(TableName=DDBTableName,
-                                    KeySchema=[{'AttributeName':'Identifier', 'KeyType':'HASH'},
-                                               {'AttributeName':'RecordType', 'KeyType':'RANGE'}],
-                                    AttributeDefinitions=[{'AttributeName':'Identifier', 'AttributeType':'S'}, {'AttributeName':'RecordType', 'AttributeType':'S'}],
-                                    BillingMode='PAY_PER_REQUEST')
-
-        Table = Dynamo.describe_table(TableName=DDBTableName)
-        while Table['Table']['TableStatus'] != 'ACTIVE':
-            print(f'Waiting for table creation. State: {Table["Table"]["TableStatus"]}')
-            time.sleep(10)
-            Table = Dynamo.describe_table(TableName=DDBTableName)
 
 #
 # Mainline code
@@ -251,64 +457,197 @@ def CreateDDBTable():
 # Basic setup and argument check
 #
 
-signal.signal(signal.SIGINT, Interrupt)
+def GetWallboardItems(FileName):
+    Settings     = {}
+    Calculations = []
+    Thresholds   = []
+    AgentStates  = []
+    DataSources  = []
 
-if len(sys.argv) != 2:
-    print('Usage: wallboard-import.py wallboarddefinition.yaml')
-    sys.exit(1)
+    #
+    # Read the YAML file
+    #
 
-#
-# Read the YAML file
-#
+    with open(FileName) as Input:
+        try:
+            Config = yaml.safe_load(Input)
+        except yaml.YAMLError as e:
+            print(e)
+            sys.exit(1)
 
-with open(sys.argv[1]) as Input:
-    try:
-        Config = yaml.safe_load(Input)
-    except yaml.YAMLError as e:
-        print(e)
+    Settings['WarningBackgroundColour'] = {'S':'Yellow'}
+    Settings['AlertBackgroundColour']   = {'S':'Red'}
+
+    #
+    # Input validation
+    #
+
+    if 'Identifier' not in Config:
+        print('Missing Identifier tag')
         sys.exit(1)
 
-CreateDDBTable()
+    if 'Rows' not in Config:
+        print('Missing row definitions')
+        sys.exit(1)
 
-Settings['WarningBackgroundColour'] = {'S':'Yellow'}
-Settings['AlertBackgroundColour']   = {'S':'Red'}
+    #
+    # Somewhat validated now - let's parse the input
+    #
 
-#
-# Input validation
-#
+    UpdateSettings(Config, Settings)
+    if 'Calculations' in Config: Calculations = GetCalculations(Config['Calculations'])
+    if 'Thresholds'   in Config: Thresholds   = GetThresholds(Config['Thresholds'])
+    if 'AgentStates'  in Config: AgentStates  = GetAgentStates(Config['AgentStates'])
+    if 'Sources'      in Config: DataSources  = GetDataSources(Config['Sources'])
+    (Cells, MaxRows, MaxColumns) = GetCells(Config['Rows'])
 
-if 'Identifier' not in Config:
-    print('Missing Identifier tag')
-    sys.exit(1)
+    if MaxRows == 0:
+        print('No rows were found')
+        sys.exit(1)
+    if MaxColumns == 0:
+        print('No cells were found')
+        sys.exit(1)
 
-if 'Rows' not in Config:
-    print('Missing row definitions')
-    sys.exit(1)
+    Settings['Columns'] = {'S':str(MaxColumns)}
+    Settings['Rows']    = {'S':str(MaxRows)}
+
+    WallboardName = str(Config['Identifier'])
+    Items = KeyRecords(WallboardName, [Settings], 'Settings')
+    Items.update(KeyRecords(WallboardName, Thresholds,   'Threshold'))
+    Items.update(KeyRecords(WallboardName, Calculations, 'Calculation'))
+    Items.update(KeyRecords(WallboardName, Cells,        'Cell'))
+    Items.update(KeyRecords(WallboardName, AgentStates,  'AgentState'))
+    Items.update(KeyRecords(WallboardName, DataSources,  'DataSource'))
+
+    Compiled = CompileWallboard(WallboardName, Items)
+    if Compiled is not None: Items[CompiledRecord] = Compiled
+
+    return WallboardName, Items
+
+def CompileWallboard(WallboardName, Items):
+    #
+    # As well as the individual records we store the whole wallboard in one
+    # compressed item, laid out the way the render function uses it, so that
+    # it can be loaded with a single read. Thresholds are checked and turned
+    # into numbers and formulas are split up here rather than on every render.
+    #
+    Compiled = {'Settings':DefaultSettings.copy(), 'Cells':{}, 'Thresholds':{}, 'Calculations':{}, 'Formulas':{}, 'AgentStates':{}, 'DataSources':{}}
+
+    for RecordType in Items:
+        Item = {Attribute:Items[RecordType][Attribute]['S'] for Attribute in Items[RecordType]}
+        if RecordType == 'Settings':
+            Compiled['Settings'].update(Item)
+            continue
 
+        del Item['RecordType']
+        del Item['Identifier']
+        if RecordType.startswith('Cell#'):
+            Compiled['Cells'][Item['Address']] = Item
+        elif RecordType.startswith('Threshold#'):
+            for Limit in ['WarnBelow', 'AlertBelow', 'WarnAbove', 'AlertAbove']:
+                if Limit not in Item: continue
+                try:
+                    Value = float(Item[Limit])
+                except ValueError:
+                    print(f'{Limit} in threshold {Item["Name"]} must be a number')
+                    sys.exit(1)
+                if math.isnan(Value):
+                    print(f'{Limit} in threshold {Item["Name"]} must be a number')
+                    sys.exit(1)
+                Item[Limit] = int(Value) if Value.is_integer() else Value
+            Compiled['Thresholds'][Item['Name']] = Item
+        elif RecordType.startswith('Calculation#'):
+            Compiled['Calculations'][Item['Name']] = Item['Formula']
+            Compiled['Formulas'][Item['Name']]     = re.split(r'(\+|\*|\-|\/|\(|\)|,)', Item['Formula'])
+        elif RecordType.startswith('AgentState#'):
+            if 'BackgroundColour' in Item: Compiled['AgentStates'][Item['StateName']] = Item['BackgroundColour']
+        elif RecordType.startswith('DataSource#'):
+            Compiled['DataSources'][Item['Name']] = Item['Reference']
+
+    for Address in Compiled['Cells']:
+        Reference = Compiled['Cells'][Address].get('ThresholdReference')
+        if Reference is not None and Reference not in Compiled['Thresholds']:
+            print(f'{WallboardName}: cell {Address} uses threshold {Reference} which is not defined')
+
+    Artifact = zlib.compress(json.dumps(Compiled, sort_keys=True, separators=(',',':')).encode('utf-8'), 9)
+    if len(Artifact) > MaxCompiledSize:
+        print(f'{WallboardName}: compiled wallboard is too big to store ({len(Artifact)} bytes) - the render function will read the records instead')
+        return None
+
+    return {'Identifier':{'S':WallboardName}, 'RecordType':{'S':CompiledRecord},
+            'Format':{'N':str(CompiledFormat)}, 'Artifact':{'B':Artifact}}
+
+def GetFileList(Arguments):
+    #
+    # Each argument can be a definition file or a directory of them.
+    #
+    FileList = []
+    for Argument in Arguments:
+        if os.path.isdir(Argument):
+            for FileName in sorted(os.listdir(Argument)):
+                if FileName.lower().endswith(('.yaml', '.yml')):
+                    FileList.append(os.path.join(Argument, FileName))
+        else:
+            FileList.append(Argument)
+
+    return FileList
+
+#
+# Mainline code
 #
-# Somewhat validated now - let's parse the input
+# Basic setup and argument check
 #
 
-UpdateSettings(Config, Settings)
-if 'Calculations' in Config: Calculations = GetCalculations(Config['Calculations'])
-if 'Thresholds'   in Config: Thresholds   = GetThresholds(Config['Thresholds'])
-if 'AgentStates'  in Config: AgentStates  = GetAgentStates(Config['AgentStates'])
-if 'Sources'      in Config: DataSources  = GetDataSources(Config['Sources'])
-(Cells, MaxRows, MaxColumns) = GetCells(Config['Rows'])
+signal.signal(signal.SIGINT, Interrupt)
 
-if MaxRows == 0:
-    print('No rows were found')
+if len(sys.argv) < 2:
+    print('Usage: wallboard-import.py wallboarddefinition.yaml|directory [...]')
     sys.exit(1)
-if MaxColumns == 0:
-    print('No cells were found')
+
+FileList = GetFileList(sys.argv[1:])
+if len(FileList) == 0:
+    print('No wallboard definition files found')
     sys.exit(1)
 
-Settings['Columns'] = {'S':str(MaxColumns)}
-Settings['Rows']    = {'S':str(MaxRows)}
+CreateDDBTable()
 
-SaveToDynamoDB(Config['Identifier'], [Settings],   'Settings')
-SaveToDynamoDB(Config['Identifier'], Thresholds,   'Threshold')
-SaveToDynamoDB(Config['Identifier'], Calculations, 'Calculation')
-SaveToDynamoDB(Config['Identifier'], Cells,        'Cell')
-SaveToDynamoDB(Config['Identifier'], AgentStates,  'AgentState')
-SaveToDynamoDB(Config['Identifier'], DataSources,  'DataSource')
+#
+# Build all of the items up front and work out what has changed for each
+# board. If there is more than one board we carry on past a broken definition
+# rather than stopping the whole import.
+#
+
+Boards    = {}
+BuildTime = {}
+Unchanged = {}
+for FileName in FileList:
+    Start = time.time()
+    try:
+        (WallboardName, Items) = GetWallboardItems(FileName)
+    except SystemExit:
+        if len(FileList) == 1: raise
+        print(f'{FileName}: not imported')
+        continue
+    except OSError as e:
+        print(f'{FileName}: {e}')
+        continue
+
+    if WallboardName in Boards:
+        print(f'{FileName}: wallboard {WallboardName} is defined more than once - ignored')
+        continue
+
+    (Boards[WallboardName], Unchanged[WallboardName]) = GetChanges(Items, GetExistingItems(WallboardName))
+    BuildTime[WallboardName] = time.time()-Start
+
+(Finished, Failed, Versions, WriteStart) = SaveToDynamoDB(Boards)
+
+for WallboardName in Boards:
+    Puts    = len([Request for Request in Boards[WallboardName] if 'PutRequest' in Request])
+    Deletes = len(Boards[WallboardName])-Puts
+    if Failed[WallboardName]:
+        Status = f', {Failed[WallboardName]} changes not written'
+    elif Versions[WallboardName]:
+        Status = f', now version {Versions[WallboardName]}'
+    else:
+        Status = ''
+    print(f'{WallboardName}: {Puts} written, {Deletes} removed, {Unchanged[WallboardName]} unchanged, read in {BuildTime[WallboardName]:.2f}s, written in {Finished[WallboardName]-WriteStart:.2f}s{Status}')